@@ -3,6 +3,7 @@ import json
 from flask import Flask
 from .config import Config
 from .extensions import db, migrate, csrf
+from .query_counter import not_budgeted
 from .views.main import main_bp
 from .views.auth import auth_bp
 from .admin import admin_bp
@@ -26,6 +27,7 @@ from .models.review import Review
 from .models.shipping import ShippingZone, ShippingMethod
 from .models.tax import TaxRate
 from .models.warehouse import Warehouse, WarehouseStock
+from .models.stock_reservation import StockReservation
 from .models.wishlist import Wishlist, WishlistItem
 from .models.attribute import Attribute
 from .models.attributeValue import AttributeValue
@@ -34,6 +36,10 @@ from .models.productAttribute import ProductAttribute
 from .models.module import Module, ModuleInstance
 from .models.modules.slider import *
 from .models.modules.menu import *
+# Модели остальных модулей: классы модулей грузятся лениво (app/module_registry.py), а таблицы нужны db.create_all()
+from .models.modules.banner import *
+from .models.modules.product_tab import *
+from .models.modules.gallery import *
 from flask_login import LoginManager
 from flask import session
 from flask_talisman import Talisman
@@ -46,6 +52,19 @@ def create_app():
 
     db.init_app(app)
     migrate.init_app(app, db)
+
+    from .cache import chrome_cache
+    chrome_cache.default_ttl = app.config['CHROME_CACHE_TTL']
+    from .page_cache import page_cache
+    page_cache.init_app(app)
+    from .query_counter import init_query_counter
+    init_query_counter(app)
+    from .review_votes import init_review_votes
+    init_review_votes(app)
+    if app.config.get('MODULE_REGISTRY_PRELOAD'):
+        # Классы модулей импортируются до fork — воркеры получают готовый реестр
+        from .module_registry import module_registry
+        app.logger.info(f'Реестр модулей загружен за {module_registry.preload() * 1000:.1f} мс')
     csrf.init_app(app)
     
     # Добавляем фильтр from_json для Jinja2
@@ -126,34 +145,43 @@ def _build_main_menu_context():
     """Helper to build context for the main (header) menu.
 
     Returns a dict compatible with rendering `front/extations/menumodule.html`:
-    { 'instance': ModuleInstance, 'menu_title', 'menu_style', 'show_icons', 'enable_videos', 'max_depth', 'menu_tree' }
+    { 'module_instance': {'id': ...}, 'menu_title', 'menu_style', 'show_icons', 'enable_videos', 'max_depth', 'menu_tree' }
     or None if no main menu configured.
+
+    Результат — отсоединённый снимок из кэша обвязки: сбрасывается при сохранении модулей меню и категорий.
     """
+    from .cache import chrome_cache, CHROME_MENU
     try:
-        from .models.modules.menu import MenuModuleInstance
-        from .models.module import ModuleInstance as ModuleInstanceModel
-        # Import frontend module class lazily to avoid circular imports at app init
-        from .views.modules.menu import MenuModule as FrontMenuModule
-
-        menu_instance = MenuModuleInstance.query.filter_by(is_main=True).first()
-        if not menu_instance:
-            return None
-        module_instance = ModuleInstanceModel.query.get(menu_instance.module_instance_id)
-        if not module_instance:
-            return None
-
-        data = FrontMenuModule.get_instance_data(module_instance)
-        if not data or data.get('menu_tree') is None:
-            return None
-
-        return {
-            'module_instance': module_instance,
-            **data,
-        }
+        return chrome_cache.get_or_set(CHROME_MENU, _load_main_menu_context, key='main')
     except Exception:
         return None
 
 
+@not_budgeted()
+def _load_main_menu_context():
+    from .models.modules.menu import MenuModuleInstance
+    from .models.module import ModuleInstance as ModuleInstanceModel
+    # Import frontend module class lazily to avoid circular imports at app init
+    from .views.modules.menu import MenuModule as FrontMenuModule
+
+    menu_instance = MenuModuleInstance.query.filter_by(is_main=True).first()
+    if not menu_instance:
+        return None
+    module_instance = ModuleInstanceModel.query.get(menu_instance.module_instance_id)
+    if not module_instance:
+        return None
+
+    data = FrontMenuModule.get_instance_data(module_instance)
+    if not data or data.get('menu_tree') is None:
+        return None
+
+    return {
+        # Шаблону нужен только id экземпляра
+        'module_instance': {'id': module_instance.id},
+        **data,
+    }
+
+
 def _register_context_processors(app):
     @app.context_processor
     def inject_main_menu():
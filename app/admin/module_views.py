@@ -1,10 +1,11 @@
-import os
-import importlib
 from flask import render_template, request, flash, redirect, url_for
 from . import admin_bp
 from .decorators import admin_required
 from ..models.module import Module, ModuleInstance
 from ..extensions import db
+from ..module_registry import module_registry
+from ..page_cache import purge_page_tags, module_tag
+from ..views.page_modules import invalidate_module_fragment
 
 
 @admin_bp.route('/modules', methods=['GET'])
@@ -25,41 +26,22 @@ def modules_list():
     )
 
 
-_admin_module_classes = None
-
-
-def _load_admin_module_classes():
-    global _admin_module_classes
-    if _admin_module_classes is not None:
-        return _admin_module_classes
-    _admin_module_classes = {}
-    modules_path = os.path.join(os.path.dirname(__file__), 'modules')
-    for filename in os.listdir(modules_path):
-        if filename.endswith('.py') and filename != '__init__.py':
-            module_name = f"app.admin.modules.{filename[:-3]}"
-            try:
-                module = importlib.import_module(module_name)
-                for attr in dir(module):
-                    obj = getattr(module, attr)
-                    if isinstance(obj, type) and hasattr(obj, 'save_instance'):
-                        _admin_module_classes[attr] = obj
-            except Exception as e:
-                print(f"Ошибка загрузки модуля {module_name}: {e}")
-    return _admin_module_classes
-
-
 @admin_bp.route('/modules/<int:module_id>/instance', defaults={'instance_id': None}, methods=['GET', 'POST'])
 @admin_bp.route('/modules/<int:module_id>/instance/<int:instance_id>', methods=['GET', 'POST'])
 @admin_required
 def create_or_edit_module_instance(module_id, instance_id):
     module = Module.query.get_or_404(module_id)
-    module_classes = _load_admin_module_classes()
-    handler_class = module_classes.get(module.name)  # Имена классов совпадают с Module.name, напр. SliderModule
+    handler_class = module_registry.get_admin(module.name)  # Module.name -> класс по манифесту, напр. SliderModule
 
     # POST -> сохраняем через обработчик, если он есть
     if request.method == 'POST':
         if handler_class and hasattr(handler_class, 'save_instance'):
-            return handler_class.save_instance(module_id, request.form, instance_id)
+            response = handler_class.save_instance(module_id, request.form, instance_id)
+            # Новый экземпляр ещё не стоит ни на одной странице — сбрасывать нечего
+            if instance_id:
+                invalidate_module_fragment(instance_id)
+                purge_page_tags(module_tag(instance_id))
+            return response
         flash('Обработчик модуля не найден.', 'danger')
         return redirect(url_for('admin.modules_list'))
 
@@ -84,8 +66,9 @@ def create_or_edit_module_instance(module_id, instance_id):
 def delete_module_instance(module_id, instance_id):
     """Удаление экземпляра модуля. Если у модуля есть делегат с del_instance — используем его."""
     module = Module.query.get_or_404(module_id)
-    module_classes = _load_admin_module_classes()
-    handler_class = module_classes.get(module.name)
+    handler_class = module_registry.get_admin(module.name)
+    invalidate_module_fragment(instance_id)
+    purge_page_tags(module_tag(instance_id))
 
     # Если у обработчика есть собственная логика удаления — используем её
     if handler_class and hasattr(handler_class, 'del_instance'):
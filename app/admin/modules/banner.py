@@ -10,7 +10,7 @@ class BannerModule:
     """Админ-обработчик для BannerModule.
 
     Имена класса должны совпадать с полем Module.name в БД ("BannerModule"),
-    чтобы `module_views._load_admin_module_classes()` корректно нашёл обработчик.
+    и с записью в MODULE_MANIFEST (app/module_registry.py), по которой реестр находит обработчик.
     """
 
     @staticmethod
@@ -40,15 +40,13 @@ class BannerModule:
         if not module_instance:
             module_instance = ModuleInstance(
                 module_id=module_id,
-                settings=json.dumps(settings),
                 selected_template='default'
             )
+            module_instance.set_settings(settings)
             db.session.add(module_instance)
             db.session.flush()
         else:
-            ModuleInstance.query.filter_by(id=module_instance.id).update({
-                'settings': json.dumps(settings)
-            })
+            module_instance.set_settings(settings)
 
         # BannerModuleInstance
         banner_instance = BannerModuleInstance.query.filter_by(module_instance_id=module_instance.id).first()
@@ -110,7 +108,7 @@ class BannerModule:
             module_instance = ModuleInstance.query.get_or_404(instance_id)
             banner = BannerModuleInstance.query.filter_by(module_instance_id=instance_id).first()
             items = BannerItem.query.filter_by(banner_id=banner.id).all() if banner else []
-            parsed_settings = json.loads(module_instance.settings) if module_instance and module_instance.settings else {}
+            parsed_settings = module_instance.get_settings() if module_instance else {}
         else:
             module_instance = None
             banner = None
@@ -20,14 +20,14 @@ class GalleryModule:
             # Создание
             module_instance = ModuleInstance(
                 module_id=module_id,
-                settings=json.dumps({'name': form_data.get("title")}),
                 selected_template="default"
             )
+            module_instance.set_settings({'name': form_data.get("title")})
             db.session.add(module_instance)
             db.session.flush()
         else:
             # Обновление
-            module_instance.settings = json.dumps({'name': form_data.get("title")})
+            module_instance.set_settings({'name': form_data.get("title")})
 
         # 3) Получаем / создаём GalleryModuleInstance (аналог SliderModuleInstance)
         gallery_instance = GalleryModuleInstance.query.filter_by(module_instance_id=module_instance.id).first()
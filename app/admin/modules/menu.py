@@ -9,10 +9,12 @@ from ...extensions import db
 from ...models.modules.menu import MenuModuleInstance, MenuItemExtended
 from ...models.menu import Menu, MenuItem
 from ...models.page import Page
-from ...models.category import Category
+from ...models.category import Category, assemble_category_tree, get_catalog_categories
 from ...models.post import Post
 from ...models.post_category import PostCategory
 from ...models.module import ModuleInstance
+from ...cache import invalidate_chrome, CHROME_MENU
+from ...views.modules.menu import invalidate_menu_snapshots
 
 
 class MenuModule:
@@ -25,21 +27,27 @@ class MenuModule:
         Returns:
             dict: Словарь с опциями для селектов (JSON serializable)
         """
-        def build_hierarchical_categories(parent_id=None, level=0):
-            """Рекурсивно строит иерархический список категорий"""
-            categories = Category.query.filter_by(parent_id=parent_id).order_by(Category.sort_order, Category.id).all()
+        def build_hierarchical_categories():
+            """Иерархический список категорий: одна выборка, дерево собирается в памяти"""
             result = []
-            for cat in categories:
-                prefix = "—" * level if level > 0 else ""
-                result.append({
-                    'id': cat.id, 
-                    'name': f"{prefix} {cat.name}".strip(), 
-                    'slug': cat.slug,
-                    'level': level,
-                    'has_children': bool(cat.subcategories)
-                })
-                # Рекурсивно добавляем подкатегории
-                result.extend(build_hierarchical_categories(cat.id, level + 1))
+
+            def walk(nodes, level):
+                for node in nodes:
+                    prefix = "—" * level if level > 0 else ""
+                    result.append({
+                        'id': node['category'].id,
+                        'name': f"{prefix} {node['category'].name}".strip(),
+                        'slug': node['category'].slug,
+                        'level': level,
+                        'has_children': bool(node['children'])
+                    })
+                    # Рекурсивно добавляем подкатегории
+                    walk(node['children'], level + 1)
+
+            walk(assemble_category_tree(
+                get_catalog_categories(),
+                lambda category, children: {'category': category, 'children': children}
+            ), 0)
             return result
         
         def build_hierarchical_post_categories(parent_id=None, level=0):
@@ -92,9 +100,9 @@ class MenuModule:
             if not module_instance:
                 module_instance = ModuleInstance(
                     module_id=module_id,
-                    settings=form_data.get('settings') or '{}',
                     selected_template=form_data.get('selected_template') or 'default'
                 )
+                module_instance.set_settings(form_data.get('settings') or '{}')
                 db.session.add(module_instance)
                 db.session.flush()
             print(f"Module instance ID: {module_instance.id}")
@@ -225,6 +233,7 @@ class MenuModule:
                 print(f"Сохраняем пункт: {item_title}, type={item_type}, target_id={target_id}, url={url}, parent_id={parent_id}, video_id={video_id}")
                 index += 1
             db.session.commit()
+            invalidate_menu_snapshots(menu_instance.id)
             print("=== СОХРАНЕНИЕ МЕНЮ ЗАВЕРШЕНО ===")
             from flask import redirect, url_for
             return redirect(url_for('admin.create_or_edit_module_instance', module_id=module_instance.module_id, instance_id=module_instance.id))
@@ -382,6 +391,7 @@ class MenuModule:
 
         # Фиксируем изменения в БД
         db.session.commit()
+        invalidate_chrome(CHROME_MENU)
 
         flash("Экземпляр меню успешно удалён.", "success")
         return redirect(url_for('admin.modules_list'))
@@ -496,6 +506,7 @@ class MenuModule:
                 print(f"Создан пункт меню: {subcat.name} (ID: {menu_item.id})")
             
             db.session.commit()
+            invalidate_menu_snapshots(menu_instance.id)
             print(f"Создано {len(created_items)} пунктов меню")
             return created_items
             
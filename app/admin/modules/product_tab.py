@@ -25,14 +25,14 @@ class TabsModule:
             # создаём
             module_instance = ModuleInstance(
                 module_id=module_id,
-                settings=json.dumps({'name': form_data.get("module_title")}),
                 selected_template="default"
             )
+            module_instance.set_settings({'name': form_data.get("module_title")})
             db.session.add(module_instance)
             db.session.flush()
         else:
             # обновляем
-            module_instance.settings = json.dumps({'title': form_data.get("module_title")})
+            module_instance.set_settings({'title': form_data.get("module_title")})
 
         # 2) Получаем/создаём TabsModuleInstance
         tabs_instance = TabsModuleInstance.query.filter_by(module_instance_id=module_instance.id).first()
@@ -158,7 +158,7 @@ class TabsModule:
             }
 
         # Извлекаем и парсим настройки из module_instance.settings
-        settings = json.loads(module_instance.settings) if module_instance.settings else {}
+        settings = module_instance.get_settings()
 
         # Получаем связанный экземпляр TabsModuleInstance
         tabs_instance = TabsModuleInstance.query.filter_by(module_instance_id=module_instance.id).first()
@@ -173,9 +173,6 @@ class TabsModule:
             if tab_item.mode == "category" and tab_item.category_id:
                 # Получаем товары из указанной категории с ограничением по limit_count
                 products = Product.query.filter_by(category_id=tab_item.category_id).limit(tab_item.limit_count).all()
-                # Загружаем опции для каждого товара
-                for product in products:
-                    product.product_options = ProductOption.get_options_by_product_id(product.id)
                 tab_products[tab_item.id] = products
 
             elif tab_item.mode == "custom" and tab_item.product_ids:
@@ -183,23 +180,23 @@ class TabsModule:
                 product_ids = tab_item.product_ids.split(",")
                 # Получаем товары по списку ID
                 products = Product.query.filter(Product.id.in_(product_ids)).all()
-                # Загружаем опции для каждого товара
-                for product in products:
-                    product.product_options = ProductOption.get_options_by_product_id(product.id)
                 tab_products[tab_item.id] = products
 
             elif tab_item.mode == "all":
                 # Получаем все товары с ограничением по limit_count (по умолчанию 8, если не указано)
                 products = Product.query.limit(tab_item.limit_count or 8).all()
-                # Загружаем опции для каждого товара
-                for product in products:
-                    product.product_options = ProductOption.get_options_by_product_id(product.id)
                 tab_products[tab_item.id] = products
 
             else:
                 # Если режим не распознан или данных нет, устанавливаем пустой список
                 tab_products[tab_item.id] = []
 
+        # Опции для товаров всех вкладок — одним пакетом
+        all_tab_products = [product for products in tab_products.values() for product in products]
+        options_by_product = ProductOption.get_options_by_product_ids([product.id for product in all_tab_products])
+        for product in all_tab_products:
+            product.product_options = options_by_product.get(product.id, [])
+
         return {
             'settings': settings,
             'tabs_instance': tabs_instance,
@@ -37,13 +37,13 @@ class SliderModule:
         if not module_instance:
             module_instance = ModuleInstance(
                 module_id=module_id,
-                settings=json.dumps(settings),
                 selected_template="default"
             )
+            module_instance.set_settings(settings)
             db.session.add(module_instance)
             db.session.flush()
         else:
-            ModuleInstance.query.filter_by(id=module_instance.id).update({'settings': json.dumps(settings)})
+            module_instance.set_settings(settings)
 
         # Получаем или создаем SliderModuleInstance
         slider_instance = SliderModuleInstance.query.filter_by(module_instance_id=module_instance.id).first()
@@ -230,7 +230,7 @@ class SliderModule:
             }
 
         # Парсим настройки из JSON
-        settings = json.loads(module_instance.settings) if module_instance.settings else {}
+        settings = module_instance.get_settings()
 
         # Получаем связанный слайдер и слайды через отношения
         slider_instance = module_instance.slider_instance
@@ -6,6 +6,8 @@ from . import admin_bp
 from .decorators import admin_required
 from ..models.page import *
 from ..models.module import *
+from ..page_cache import purge_page_tags, page_tag
+from ..views.modules.menu import invalidate_menu_snapshots
 from datetime import datetime
 
 
@@ -106,6 +108,9 @@ def page_form(page_id):
             db.session.rollback()
             flash(f"Ошибка при сохранении макета: {e}", "danger")
 
+        purge_page_tags(page_tag(page.id))
+        # Название и slug страницы выводятся в пунктах меню
+        invalidate_menu_snapshots()
         flash("Страница успешно сохранена!", "success")
         return redirect(url_for('admin.page_list'))  # или другой список страниц
 
@@ -118,17 +123,15 @@ def page_form(page_id):
 
     # 4) Подтягиваем реальные данные о модулях и экземплярах
     modules = Module.query.all()
-    instances = ModuleInstance.query.all()
+    instances = ModuleInstance.query.options(db.joinedload(ModuleInstance.module)).all()
     # Превратим их в удобную структуру для шаблона
     # Например, module_instances_by_module = { module_id: [ {...}, {...} ] }
     from collections import defaultdict
     module_instances_by_module = defaultdict(list)
 
     for inst in instances:
-        # Если в inst.settings хранится JSON с именем/названием
-        settings_json = json.loads(inst.settings or '{}')
         # Название экземпляра возьмём из settings.get('name') или "Instance #ID"
-        inst_label = settings_json.get('name') or f"Instance {inst.id}"
+        inst_label = inst.get_settings().get('name') or f"Instance {inst.id}"
 
         module_instances_by_module[inst.module_id].append({
             'id': inst.id,
@@ -157,6 +160,7 @@ def page_delete(page_id):
     # Удаляем саму страницу
     db.session.delete(page)
     db.session.commit()
+    invalidate_menu_snapshots()
     flash("Страница удалена", "success")
     return redirect(url_for('admin.page_list'))
 
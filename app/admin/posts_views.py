@@ -10,6 +10,7 @@ from ..extensions import db
 from ..models.post import Post, PostLayout
 from ..models.module import *
 from .forms import PostCategoryForm
+from ..views.modules.menu import invalidate_menu_snapshots
 
 
 @admin_bp.route('/post_categories', methods=['GET', 'POST'])
@@ -66,6 +67,7 @@ def admin_post_categories():
             
             try:
                 db.session.commit()
+                invalidate_menu_snapshots()
                 flash(f"Удалено {deleted_count} категорий постов и все посты в них.", "success")
             except Exception as e:
                 db.session.rollback()
@@ -146,6 +148,8 @@ def admin_post_categories_form(category_id):
 
         db.session.add(category)
         db.session.commit()
+        # Пункты меню выводят название и slug категории статей
+        invalidate_menu_snapshots()
 
         flash('Категория успешно сохранена!', 'success')
         return redirect(url_for('admin.admin_post_categories'))
@@ -196,6 +200,7 @@ def admin_post_categories_delete(category_id):
         # Удаляем саму категорию
         db.session.delete(category)
         db.session.commit()
+        invalidate_menu_snapshots()
         
         print(f"=== УДАЛЕНИЕ КАТЕГОРИИ ПОСТОВ {category_id} ЗАВЕРШЕНО УСПЕШНО ===")
         flash(f'Категория постов "{category.name}" и все посты в ней успешно удалены', 'success')
@@ -329,6 +334,7 @@ def admin_post_form(post_id):
                 db.session.add(pl)
 
         db.session.commit()
+        invalidate_menu_snapshots()
 
         flash("Пост успешно сохранён!", "success")
         return redirect(url_for('admin.admin_posts'))
@@ -341,13 +347,12 @@ def admin_post_form(post_id):
 
     # 4) Подтягиваем модули и экземпляры
     modules = Module.query.all()
-    instances = ModuleInstance.query.all()
+    instances = ModuleInstance.query.options(db.joinedload(ModuleInstance.module)).all()
     from collections import defaultdict
     module_instances_by_module = defaultdict(list)
 
     for inst in instances:
-        settings_json = json.loads(inst.settings or '{}')
-        inst_label = settings_json.get('name') or f"Instance #{inst.id}"
+        inst_label = inst.get_settings().get('name') or f"Instance #{inst.id}"
         module_instances_by_module[inst.module_id].append({
             'id': inst.id,
             'label': inst_label
@@ -375,5 +380,6 @@ def admin_post_delete(post_id):
     post = Post.query.get_or_404(post_id)
     db.session.delete(post)
     db.session.commit()
+    invalidate_menu_snapshots()
     flash("Пост удалён.", "success")
     return redirect(url_for('admin.admin_posts'))
@@ -15,7 +15,7 @@ from flask_login import current_user, login_required  # Импорт current_use
 from ..models.attributeValue import AttributeValue
 from ..models.product import Product, product_images
 from ..extensions import db
-from ..models.category import Category, build_category_list
+from ..models.category import Category, build_category_list, get_category_subtree_ids
 from ..models.directory import Directory
 from ..models.image import Image
 from ..models.seo_settings import SEOSettings
@@ -23,7 +23,7 @@ from ..models.order import Order  # для главной страницы ст
 from ..models.order import OrderItem, OrderComment
 from ..models.productOptions import ProductOption, ProductOptionValue
 from ..models.size_chart import SizeChart, ProductSizeChart
-from ..models.review import Review
+from ..models.review import Review, ProductReviewStats
 from ..models.customer import Customer
 from ..models.productAttribute import ProductAttribute
 from ..models.attribute import Attribute
@@ -35,6 +35,13 @@ from .utils import *
 from ..models.productOptions import *
 from ..models.site_setings import SiteSettings, SocialLink
 from ..models.page import Page
+from ..cache import invalidate_chrome, CHROME_CATEGORIES, CHROME_SITE_SETTINGS
+from ..facets import invalidate_facet_index
+from ..search import index_products, remove_products_from_index
+from ..page_cache import purge_page_tags, product_purge_tags, product_tag, category_tag
+from ..views.page_modules import invalidate_module_fragments
+from ..views.product_cards import invalidate_product_cards
+from ..views.modules.menu import invalidate_menu_snapshots
 from . import admin_bp
 from ..models.size_chart import SizeChart, ProductSizeChart
 
@@ -86,6 +93,14 @@ def admin_orders():
     return render_template('admin/orders_list.html', orders=orders, status=status)
 
 
+@admin_bp.route('/inventory/reservations', methods=['GET'])
+@admin_required
+def admin_inventory_reservations():
+    """Удержания остатков: активные/просроченные в БД и счётчики конфликтов текущего процесса (JSON)."""
+    from ..inventory import reservation_stats
+    return jsonify(reservation_stats())
+
+
 @admin_bp.route('/orders/<int:order_id>', methods=['GET', 'POST'])
 @admin_required
 def admin_order_view(order_id):
@@ -169,23 +184,10 @@ def admin_categories():
                     if cat:
                         print(f"Удаляем категорию: {cat.name} (ID: {cat.id})")
                         
-                        # Получаем все товары в этой категории (включая подкатегории)
-                        def get_all_products_in_category(cat_id):
-                            """Рекурсивно получает все товары в категории и её подкатегориях"""
-                            products = []
-                            
-                            # Товары в текущей категории
-                            category_products = Product.query.filter_by(category_id=cat_id).all()
-                            products.extend(category_products)
-                            
-                            # Подкатегории
-                            subcategories = Category.query.filter_by(parent_id=cat_id).all()
-                            for subcat in subcategories:
-                                products.extend(get_all_products_in_category(subcat.id))
-                            
-                            return products
-                        
-                        all_products = get_all_products_in_category(cat.id)
+                        # Все товары категории и её подкатегорий — один запрос по поддереву
+                        all_products = Product.query.filter(
+                            Product.category_id.in_(get_category_subtree_ids(cat.id))
+                        ).all()
                         print(f"Найдено товаров для удаления: {len(all_products)}")
                         
                         # Удаляем все товары в категории
@@ -206,6 +208,8 @@ def admin_categories():
             
             try:
                 db.session.commit()
+                invalidate_chrome(CHROME_CATEGORIES)
+                invalidate_menu_snapshots()
                 flash(f"Удалено {deleted_count} категорий и все товары в них.", "success")
             except Exception as e:
                 db.session.rollback()
@@ -216,6 +220,8 @@ def admin_categories():
                 if cat:
                     cat.is_indexed = not cat.is_indexed
             db.session.commit()
+            invalidate_chrome(CHROME_CATEGORIES)
+            invalidate_menu_snapshots()
             flash(f"Флаг 'Индексировать' переключён для {len(selected_ids)} категорий.", "success")
 
         return redirect(url_for('admin.admin_categories'))
@@ -275,12 +281,19 @@ def admin_categories_form(category_id):
             category.image_id = None
 
         if form.parent.data and hasattr(form.parent.data, 'id'):
+            # Нельзя переносить категорию внутрь её собственного поддерева
+            if category.id and form.parent.data.is_descendant_of(category.id):
+                db.session.rollback()
+                flash("Нельзя выбрать родителем саму категорию или её подкатегорию.", "danger")
+                return redirect(url_for('admin.admin_categories_form', category_id=category.id))
             category.parent_id = form.parent.data.id
         else:
             category.parent_id = None
 
         db.session.add(category)
         db.session.commit()
+        # Материализованный путь (и пути потомков при переносе)
+        category.update_path()
 
         # --- Обновляем или создаём запись SEO ---
         seo = existing_seo or SEOSettings(page_type='category', page_id=category.id)
@@ -291,6 +304,15 @@ def admin_categories_form(category_id):
 
         db.session.add(seo)
         db.session.commit()
+        # Категории выводятся в шапке и в автокаталоге меню
+        invalidate_chrome(CHROME_CATEGORIES)
+        invalidate_menu_snapshots()
+        invalidate_facet_index()
+        # Название категории входит в поисковые термины её товаров
+        index_products(Product.query.filter_by(category_id=category.id).all())
+        db.session.commit()
+        purge_page_tags(category_tag(category.id))
+        invalidate_module_fragments()
 
         return redirect(url_for('admin.admin_categories'))
     if existing_seo:
@@ -317,23 +339,10 @@ def admin_categories_delete(category_id):
         category = Category.query.get_or_404(category_id)
         print(f"Категория найдена: {category.name}")
         
-        # Получаем все товары в этой категории (включая подкатегории)
-        def get_all_products_in_category(cat_id):
-            """Рекурсивно получает все товары в категории и её подкатегориях"""
-            products = []
-            
-            # Товары в текущей категории
-            category_products = Product.query.filter_by(category_id=cat_id).all()
-            products.extend(category_products)
-            
-            # Подкатегории
-            subcategories = Category.query.filter_by(parent_id=cat_id).all()
-            for subcat in subcategories:
-                products.extend(get_all_products_in_category(subcat.id))
-            
-            return products
-        
-        all_products = get_all_products_in_category(category_id)
+        # Все товары категории и её подкатегорий — один запрос по поддереву
+        all_products = Product.query.filter(
+            Product.category_id.in_(get_category_subtree_ids(category_id))
+        ).all()
         print(f"Найдено товаров для удаления: {len(all_products)}")
         
         # Удаляем все товары в категории
@@ -348,6 +357,8 @@ def admin_categories_delete(category_id):
         # Удаляем саму категорию
         db.session.delete(category)
         db.session.commit()
+        invalidate_chrome(CHROME_CATEGORIES)
+        invalidate_menu_snapshots()
         
         print(f"=== УДАЛЕНИЕ КАТЕГОРИИ {category_id} ЗАВЕРШЕНО УСПЕШНО ===")
         flash(f'Категория "{category.name}" и все товары в ней успешно удалены', 'success')
@@ -694,6 +705,8 @@ def admin_images_update(image_id):
     img.alt = new_alt
     # Пока не меняем directory_id для простоты
     db.session.commit()
+    # Изображение может быть в карточках любых товаров, а их ключ кэша от него не зависит
+    invalidate_product_cards()
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify(ok=True, message="Изображение обновлено")
@@ -728,6 +741,7 @@ def admin_images_delete(image_id):
     directory_id = img.directory_id
     db.session.delete(img)
     db.session.commit()
+    invalidate_product_cards()
     print(f"✓ Изображение удалено из базы данных")
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -746,6 +760,8 @@ def product_form(product_id):
     import re  # Импортируем re в начале функции
     # 1) Если редактируем
     product = Product.query.get_or_404(product_id) if product_id else None
+    # Категория до редактирования — её листинг тоже нужно сбросить в кэше страниц
+    previous_category_id = product.category_id if product else None
 
     # Основная форма
     form = ProductForm(obj=product)
@@ -1293,6 +1309,9 @@ def product_form(product_id):
         # ---------- Фотографии значений опций ----------
         from ..models.productOptions import ProductOptionValueImage
         
+        # Значения опций общие для товаров: их фото меняются и в карточках других товаров
+        option_values_touched = False
+
         # Сначала удаляем старые фотографии опций для этого товара
         if product_id:
             # Получаем все значения опций для данного товара
@@ -1305,6 +1324,7 @@ def product_form(product_id):
             
             for option_value in option_values:
                 ProductOptionValueImage.query.filter_by(option_value_id=option_value.id).delete()
+            option_values_touched = bool(option_values)
 
         # Обрабатываем новые фотографии опций
         option_photos = {}
@@ -1320,6 +1340,7 @@ def product_form(product_id):
                     if option_name not in option_photos:
                         option_photos[option_name] = {}
                     option_photos[option_name][option_value] = image_ids
+                    option_values_touched = True
 
         # Сохраняем фотографии опций
         for option_name, values_dict in option_photos.items():
@@ -1349,9 +1370,22 @@ def product_form(product_id):
         if size_chart_id:
             db.session.add(ProductSizeChart(product_id=product.id, size_chart_id=size_chart_id))
 
+        # Опции и изображения хранятся в связанных таблицах — отмечаем изменение товара явно,
+        # чтобы сменился ключ кэша карточки (product.id, updated_at)
+        product.updated_at = datetime.utcnow()
+
         # Сохраняем
         try:
+            # Поисковый индекс обновляется в той же транзакции, что и товар
+            index_products([product])
             db.session.commit()
+            # Вариации могли быть перегенерированы — сбрасываем индекс для корзины/оформления заказа
+            ProductVariation.invalidate_variation_index(product.id)
+            invalidate_facet_index()
+            purge_page_tags(*product_purge_tags(product, previous_category_id))
+            invalidate_module_fragments()
+            if option_values_touched:
+                invalidate_product_cards()
             flash("Товар успешно сохранён.", "success")
         except IntegrityError as e:
             db.session.rollback()
@@ -1440,6 +1474,7 @@ def list_products():
         
         if action == 'delete_selected' and selected_ids:
             deleted_count = 0
+            page_tags = []
             for product_id in selected_ids:
                 try:
                     product = Product.query.get(product_id)
@@ -1470,11 +1505,14 @@ def list_products():
                         
                         CartItem.query.filter_by(product_id=product_id).delete()
                         Review.query.filter_by(product_id=product_id).delete()
+                        ProductReviewStats.query.filter_by(product_id=product_id).delete()
                         Favorite.query.filter_by(product_id=product_id).delete()
                         OrderItem.query.filter_by(product_id=product_id).delete()
                         ComparisonItem.query.filter_by(product_id=product_id).delete()
                         WishlistItem.query.filter_by(product_id=product_id).delete()
                         ProductSizeChart.query.filter_by(product_id=product_id).delete()
+                        remove_products_from_index([product_id])
+                        page_tags.extend(product_purge_tags(product))
                         
                         # Удаляем связанные товары
                         from ..models.product import RelatedProduct
@@ -1491,6 +1529,12 @@ def list_products():
             
             try:
                 db.session.commit()
+                from ..models.productOptions import ProductVariation
+                for product_id in selected_ids:
+                    ProductVariation.invalidate_variation_index(product_id)
+                invalidate_facet_index()
+                purge_page_tags(*page_tags)
+                invalidate_module_fragments()
                 flash(f"Удалено {deleted_count} товаров из {len(selected_ids)} выбранных.", "success")
             except Exception as e:
                 db.session.rollback()
@@ -1527,16 +1571,8 @@ def list_products():
     # Фильтр по категории (включая подкатегории)
     category_id = request.args.get('category', type=int)
     if category_id:
-        # Получаем все ID категорий в поддереве
-        def get_category_tree_ids(cat_id):
-            """Рекурсивно получает все ID категорий в поддереве"""
-            ids = [cat_id]
-            children = Category.query.filter_by(parent_id=cat_id).all()
-            for child in children:
-                ids.extend(get_category_tree_ids(child.id))
-            return ids
-        
-        category_ids = get_category_tree_ids(category_id)
+        # Все ID категорий в поддереве — одним запросом по материализованному пути
+        category_ids = get_category_subtree_ids(category_id)
         query = query.filter(Product.category_id.in_(category_ids))
 
     # Сортировка
@@ -1649,6 +1685,8 @@ def reviews_list():
 def review_form(review_id=None):
     review = Review.query.get(review_id) if review_id else None
     if request.method == 'POST':
+        # Вклад отзыва в статистику товара до правки
+        stats_before = review.stats_contribution() if review else None
         product_id = request.form.get('product_id', type=int)
         customer_id = request.form.get('customer_id', type=int)
         rating = request.form.get('rating', type=int)
@@ -1687,7 +1725,9 @@ def review_form(review_id=None):
             review.guest_email = guest_email or None
 
         try:
+            ProductReviewStats.apply_review_change(stats_before, review.stats_contribution())
             db.session.commit()
+            purge_page_tags(product_tag(review.product_id))
             flash('Отзыв сохранён', 'success')
             return redirect(url_for('admin.reviews_list'))
         except Exception as e:
@@ -1703,8 +1743,11 @@ def review_form(review_id=None):
 @admin_required
 def review_approve(review_id):
     review = Review.query.get_or_404(review_id)
+    stats_before = review.stats_contribution()
     review.approved = True
+    ProductReviewStats.apply_review_change(stats_before, review.stats_contribution())
     db.session.commit()
+    purge_page_tags(product_tag(review.product_id))
     flash('Отзыв одобрен', 'success')
     return redirect(url_for('admin.reviews_list'))
 
@@ -1713,8 +1756,12 @@ def review_approve(review_id):
 @admin_required
 def review_delete(review_id):
     review = Review.query.get_or_404(review_id)
+    product_id = review.product_id
+    stats_before = review.stats_contribution()
     db.session.delete(review)
+    ProductReviewStats.apply_review_change(stats_before, None)
     db.session.commit()
+    purge_page_tags(product_tag(product_id))
     flash('Отзыв удалён', 'success')
     return redirect(url_for('admin.reviews_list'))
 
@@ -1781,6 +1828,7 @@ def delete_product(product_id):
         # 7. Удаляем отзывы товара
         print("7. Удаляем отзывы товара...")
         deleted_reviews = Review.query.filter_by(product_id=product_id).delete()
+        ProductReviewStats.query.filter_by(product_id=product_id).delete()
         print(f"   Удалено записей из reviews: {deleted_reviews}")
         
         # 8. Удаляем товар из избранного
@@ -1816,13 +1864,21 @@ def delete_product(product_id):
             (RelatedProduct.related_product_id == product_id)
         ).delete()
         print(f"   Удалено записей из related_products: {deleted_related}")
+
+        # Термины поискового индекса
+        remove_products_from_index([product_id])
         
         # 14. Наконец удаляем сам товар
         print("14. Удаляем сам товар...")
+        page_tags = product_purge_tags(product)
         db.session.delete(product)
         
         print("15. Коммитим изменения...")
         db.session.commit()
+        ProductVariation.invalidate_variation_index(product_id)
+        invalidate_facet_index()
+        purge_page_tags(*page_tags)
+        invalidate_module_fragments()
         print("=== УДАЛЕНИЕ ТОВАРА {product_id} ЗАВЕРШЕНО УСПЕШНО ===")
         flash("Товар удалён", "success")
         
@@ -2196,6 +2252,7 @@ def site_settings():
                 db.session.add(new_link)
 
         db.session.commit()
+        invalidate_chrome(CHROME_SITE_SETTINGS)
         flash("Настройки сайта сохранены!", "success")
         return redirect(url_for('admin.site_settings'))
     
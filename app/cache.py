@@ -0,0 +1,112 @@
+"""
+@file: app/cache.py
+@description: Версионированный кэш процесса для общих данных витрины (категории шапки, настройки сайта, главное меню)
+@dependencies: threading, time
+@created: 2026-10-18
+"""
+
+import threading
+import time
+
+# Пространства имён "обвязки" сайта
+CHROME_CATEGORIES = 'categories'
+CHROME_SITE_SETTINGS = 'site_settings'
+CHROME_MENU = 'menu'
+
+_MISSING = object()
+
+
+class VersionedCache:
+    """
+    TTL-кэш в памяти процесса с версиями по пространствам имён.
+
+    Хранит только отсоединённые от сессии снимки (dict/list) — ORM-объекты класть нельзя.
+    bump(namespace) увеличивает версию пространства, и все его записи становятся устаревшими;
+    значение, загруженное во время bump, не попадёт в кэш со свежей версией.
+    Каждый воркер держит свой кэш: сброс действует на текущий процесс, остальные догоняют по TTL.
+    """
+
+    def __init__(self, default_ttl=300, max_entries=None):
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries  # None — без ограничения
+        self._entries = {}   # (namespace, key) -> (version, expires_at, value)
+        self._versions = {}  # namespace -> int
+        self._lock = threading.Lock()
+
+    def version(self, namespace):
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def get(self, namespace, key=None, default=None):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if not entry:
+                return default
+            version, expires_at, value = entry
+            if version != self._versions.get(namespace, 0) or expires_at <= time.monotonic():
+                self._entries.pop((namespace, key), None)
+                return default
+            return value
+
+    def set(self, namespace, value, key=None, ttl=None, version=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            current = self._versions.get(namespace, 0)
+            if version is not None and version != current:
+                # Пока загружали значение, пространство успели сбросить — не кэшируем устаревшее
+                return
+            self._entries[(namespace, key)] = (current, time.monotonic() + ttl, value)
+            if self.max_entries and len(self._entries) > self.max_entries:
+                self._evict()
+
+    def get_many(self, namespace, keys):
+        """{key: value} для найденных в кэше ключей пространства."""
+        found = {}
+        for key in keys:
+            value = self.get(namespace, key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def _evict(self):
+        # Сначала устаревшие записи, затем самые старые по порядку добавления
+        now = time.monotonic()
+        for entry_key, (version, expires_at, _) in list(self._entries.items()):
+            if expires_at <= now or version != self._versions.get(entry_key[0], 0):
+                del self._entries[entry_key]
+        # Освобождаем с запасом, чтобы не сканировать записи на каждом добавлении
+        target = int(self.max_entries * 0.9)
+        while len(self._entries) > target:
+            del self._entries[next(iter(self._entries))]
+
+    def get_or_set(self, namespace, loader, key=None, ttl=None):
+        """Возвращает значение из кэша или вызывает loader() и сохраняет результат (в том числе None)."""
+        value = self.get(namespace, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        version = self.version(namespace)
+        value = loader()
+        self.set(namespace, value, key=key, ttl=ttl, version=version)
+        return value
+
+    def bump(self, *namespaces):
+        with self._lock:
+            for namespace in namespaces:
+                self._versions[namespace] = self._versions.get(namespace, 0) + 1
+                for entry_key in [k for k in self._entries if k[0] == namespace]:
+                    del self._entries[entry_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+chrome_cache = VersionedCache()
+
+
+def invalidate_chrome(*namespaces):
+    """Сбрасывает кэш обвязки сайта. Без аргументов — все пространства."""
+    chrome_cache.bump(*(namespaces or (CHROME_CATEGORIES, CHROME_SITE_SETTINGS, CHROME_MENU)))
+    # Обвязка есть на каждой странице — сбрасываем и кэш целых страниц
+    from .page_cache import purge_page_tags, TAG_CHROME
+    purge_page_tags(TAG_CHROME)
@@ -0,0 +1,352 @@
+"""
+@file: app/cart_service.py
+@description: Корзина: хранение строк в CartItem (покупатель — customer_id, гость — session_id) и единый расчёт
+              для страницы корзины, оформления и создания заказа. Строки оцениваются одним пакетом: товары — одним
+              запросом, вариации — через индекс ProductVariation.get_variation_index, опции и значения — одним запросом
+@dependencies: CartItem, Product, ProductVariation, ProductOptionValue
+@created: 2026-10-18
+"""
+
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from .extensions import db
+from .models.cart import CartItem, normalize_selected_options, options_hash
+from .models.product import Product
+from .models.productOptions import ProductOptionValue, ProductVariation
+
+
+class CartLine:
+    """
+    Строка корзины до расчёта цен.
+      cart_item_id — CartItem.id (корзина в БД), cart_key — ключ строки в сессии гостя
+    """
+
+    __slots__ = ('product_id', 'quantity', 'selected_options', 'cart_item_id', 'cart_key')
+
+    def __init__(self, product_id, quantity, selected_options=None, cart_item_id=None, cart_key=None):
+        self.product_id = int(product_id)
+        self.quantity = int(quantity)
+        self.selected_options = selected_options or {}
+        self.cart_item_id = cart_item_id
+        self.cart_key = cart_key
+
+
+class PricedCartLine:
+    """
+    Строка снимка корзины.
+      product          — Product (с main_image)
+      price            — цена единицы (вариации, если опции совпали с вариацией, иначе товара)
+      variation_id     — найденная вариация или None
+      options          — [{'option_id', 'option', 'value_id', 'value'}] для вывода выбранных опций
+    """
+
+    __slots__ = ('product', 'quantity', 'selected_options', 'price', 'variation_id',
+                 'cart_item_id', 'cart_key', 'options')
+
+    def __init__(self, product, quantity, selected_options, price, variation_id, cart_item_id, cart_key, options):
+        self.product = product
+        self.quantity = quantity
+        self.selected_options = selected_options
+        self.price = price
+        self.variation_id = variation_id
+        self.cart_item_id = cart_item_id
+        self.cart_key = cart_key
+        self.options = options
+
+    @property
+    def product_id(self):
+        return self.product.id
+
+    @property
+    def total(self):
+        return self.price * self.quantity
+
+    def to_dict(self):
+        return {
+            'cart_item_id': self.cart_item_id,
+            'cart_key': self.cart_key,
+            'product_id': self.product.id,
+            'name': self.product.name,
+            'slug': self.product.slug,
+            'image': self.product.main_image.filename if self.product.main_image else None,
+            'quantity': self.quantity,
+            'selected_options': self.selected_options,
+            'options': self.options,
+            'variation_id': self.variation_id,
+            'price': str(self.price),
+            'total': str(self.total),
+        }
+
+
+class CartSnapshot:
+    """
+    Рассчитанная корзина.
+      lines             — [PricedCartLine] в порядке исходных строк (строки удалённых товаров отброшены)
+      subtotal          — сумма строк, Decimal
+      options_map       — {option_id: ProductOption}, option_values_map — {value_id: ProductOptionValue}
+    """
+
+    def __init__(self, lines, options_map, option_values_map):
+        self.lines = lines
+        self.options_map = options_map
+        self.option_values_map = option_values_map
+        self.subtotal = sum((line.total for line in lines), Decimal('0'))
+
+    @property
+    def total_quantity(self):
+        return sum(line.quantity for line in self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def to_dict(self):
+        return {
+            'lines': [line.to_dict() for line in self.lines],
+            'count': len(self.lines),
+            'total_quantity': self.total_quantity,
+            'subtotal': str(self.subtotal),
+        }
+
+
+class CartService:
+    """Загрузка строк корзины и их пакетный расчёт."""
+
+    @staticmethod
+    def _owner_query(customer_id=None, session_id=None):
+        """Строки покупателя или гостя; у гостевых строк customer_id пустой."""
+        if customer_id:
+            return CartItem.query.filter(CartItem.customer_id == customer_id)
+        return CartItem.query.filter(CartItem.session_id == session_id, CartItem.customer_id.is_(None))
+
+    @classmethod
+    def lines_from_db(cls, customer_id=None, session_id=None):
+        """Строки корзины покупателя или гостя (без товаров — они загружаются в price)."""
+        if not customer_id and not session_id:
+            return []
+        items = cls._owner_query(customer_id, session_id).order_by(CartItem.id).all()
+        return [
+            CartLine(item.product_id, item.quantity, item.get_selected_options(), cart_item_id=item.id)
+            for item in items
+        ]
+
+    @staticmethod
+    def _upsert_lines(rows, owner_column):
+        """
+        Пакетный upsert строк по уникальному ключу (owner_column, product_id, options_hash):
+        существующей строке прибавляется quantity. MySQL — ON DUPLICATE KEY UPDATE, SQLite/PostgreSQL —
+        ON CONFLICT DO UPDATE; для остальных СУБД — поиск строки и UPDATE.
+        """
+        if not rows:
+            return
+        table = CartItem.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table)
+            stmt = stmt.on_duplicate_key_update(quantity=table.c.quantity + stmt.inserted.quantity)
+        elif dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[owner_column, 'product_id', 'options_hash'],
+                set_={'quantity': table.c.quantity + stmt.excluded.quantity}
+            )
+        else:
+            for row in rows:
+                updated = db.session.execute(
+                    table.update().where(
+                        table.c[owner_column] == row[owner_column],
+                        table.c.product_id == row['product_id'],
+                        table.c.options_hash == row['options_hash'],
+                    ).values(quantity=table.c.quantity + row['quantity'])
+                ).rowcount
+                if not updated:
+                    db.session.execute(table.insert().values(**row))
+            return
+        db.session.execute(stmt, rows)
+
+    @staticmethod
+    def _line_row(product_id, quantity, selected_options, customer_id=None, session_id=None):
+        return {
+            'customer_id': customer_id,
+            'session_id': None if customer_id else session_id,
+            'product_id': product_id,
+            'quantity': quantity,
+            'selected_options': json.dumps(selected_options) if selected_options else None,
+            'options_hash': options_hash(selected_options),
+            'created_at': datetime.utcnow(),
+        }
+
+    @classmethod
+    def add_line(cls, product_id, quantity, selected_options, customer_id=None, session_id=None):
+        """
+        Добавляет товар в корзину гостя или покупателя одним upsert: строка с тем же товаром и теми же
+        опциями получает прибавку к количеству, иначе создаётся новая. Возвращает id строки (без commit).
+        """
+        owner_column = 'customer_id' if customer_id else 'session_id'
+        row = cls._line_row(product_id, quantity, selected_options, customer_id, session_id)
+        cls._upsert_lines([row], owner_column)
+        return db.session.execute(
+            select(CartItem.id).where(
+                getattr(CartItem, owner_column) == row[owner_column],
+                CartItem.product_id == product_id,
+                CartItem.options_hash == row['options_hash'],
+            )
+        ).scalar()
+
+    @classmethod
+    def set_quantity(cls, cart_item_id, quantity, customer_id=None, session_id=None):
+        """Новое количество строки (0 и меньше — удаление); True — строка найдена у владельца (без commit)."""
+        if quantity <= 0:
+            return cls.remove_line(cart_item_id, customer_id, session_id)
+        if not cart_item_id or (not customer_id and not session_id):
+            return False
+        return cls._owner_query(customer_id, session_id).filter(CartItem.id == cart_item_id) \
+            .update({CartItem.quantity: quantity}, synchronize_session=False) > 0
+
+    @classmethod
+    def remove_line(cls, cart_item_id, customer_id=None, session_id=None):
+        """Удаляет строку, если она принадлежит покупателю или гостю; True — строка удалена (без commit)."""
+        if not cart_item_id or (not customer_id and not session_id):
+            return False
+        return cls._owner_query(customer_id, session_id) \
+            .filter(CartItem.id == cart_item_id).delete(synchronize_session=False) > 0
+
+    @classmethod
+    def clear(cls, customer_id=None, session_id=None):
+        """Удаляет все строки корзины (без commit)."""
+        if not customer_id and not session_id:
+            return 0
+        return cls._owner_query(customer_id, session_id).delete(synchronize_session=False)
+
+    @classmethod
+    def import_session_cart(cls, cart, session_id):
+        """Переносит корзину старого формата из cookie-сессии (session['cart']) в строки гостя."""
+        lines = cls.lines_from_session(cart)
+        for line in lines:
+            if line.quantity > 0:
+                cls.add_line(line.product_id, line.quantity, line.selected_options, session_id=session_id)
+        return len(lines)
+
+    @classmethod
+    def merge_guest_cart(cls, session_id, customer_id):
+        """
+        Объединяет корзину гостя с корзиной покупателя при входе: один пакетный upsert строк гостя
+        в строки покупателя (совпавшие товар + опции складывают количество) и один DELETE гостевых строк.
+        Повторный вызов ничего не меняет: гостевых строк больше нет. Возвращает число перенесённых строк (без commit).
+        """
+        if not session_id or not customer_id:
+            return 0
+        guest_items = CartItem.query.filter(CartItem.session_id == session_id, CartItem.customer_id.is_(None)) \
+            .order_by(CartItem.id).all()
+        if not guest_items:
+            return 0
+        rows = [
+            cls._line_row(item.product_id, item.quantity, item.get_selected_options(), customer_id=customer_id)
+            for item in guest_items
+        ]
+        cls._upsert_lines(rows, 'customer_id')
+        table = CartItem.__table__
+        db.session.execute(table.delete().where(table.c.id.in_([item.id for item in guest_items])))
+        db.session.expire_all()
+        return len(guest_items)
+
+    @staticmethod
+    def purge_guest_carts(older_than_days=30):
+        """Удаляет гостевые строки старше older_than_days дней (без commit)."""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        return CartItem.query.filter(
+            CartItem.customer_id.is_(None), CartItem.session_id.isnot(None), CartItem.created_at < cutoff
+        ).delete(synchronize_session=False)
+
+    @staticmethod
+    def lines_from_session(cart):
+        """Строки корзины старого формата из cookie-сессии (session['cart'], включая {product_id: quantity})."""
+        lines = []
+        for cart_key, cart_data in (cart or {}).items():
+            try:
+                if isinstance(cart_data, dict):
+                    product_id = cart_data.get('product_id')
+                    if not product_id:
+                        continue
+                    lines.append(CartLine(product_id, cart_data.get('quantity', 1),
+                                          cart_data.get('selected_options') or {}, cart_key=cart_key))
+                elif str(cart_key).isdigit():
+                    lines.append(CartLine(cart_key, cart_data, {}, cart_key=cart_key))
+            except (ValueError, TypeError):
+                continue
+        return lines
+
+    @staticmethod
+    def price(lines, fresh=False):
+        """
+        CartSnapshot для строк корзины за фиксированное число запросов:
+        товары с главным изображением, индекс вариаций (кэш процесса; fresh=True — из БД), значения опций с опциями.
+        """
+        product_ids = list(dict.fromkeys(line.product_id for line in lines))
+        products = {}
+        if product_ids:
+            products = {
+                product.id: product
+                for product in Product.query.options(db.joinedload(Product.main_image))
+                .filter(Product.id.in_(product_ids)).all()
+            }
+        lines = [line for line in lines if line.product_id in products and line.quantity > 0]
+        variation_index = ProductVariation.get_variation_index(list(products), fresh=fresh)
+
+        normalized = [normalize_selected_options(line.selected_options) for line in lines]
+        value_ids = {value_id for options in normalized for value_id in options.values()}
+        option_values_map = {}
+        if value_ids:
+            option_values_map = {
+                value.id: value
+                for value in ProductOptionValue.query.options(db.joinedload(ProductOptionValue.option))
+                .filter(ProductOptionValue.id.in_(value_ids)).all()
+            }
+        options_map = {value.option.id: value.option for value in option_values_map.values() if value.option}
+
+        priced = []
+        for line, options in zip(lines, normalized):
+            product = products[line.product_id]
+            variation = ProductVariation.find_in_index(variation_index, line.product_id, line.selected_options)
+            price = variation['price'] if variation else product.price
+            priced.append(PricedCartLine(
+                product=product,
+                quantity=line.quantity,
+                selected_options=line.selected_options,
+                price=Decimal(str(price or 0)),
+                variation_id=variation['id'] if variation else None,
+                cart_item_id=line.cart_item_id,
+                cart_key=line.cart_key,
+                options=[
+                    {
+                        'option_id': option_id,
+                        'option': options_map[option_id].name if option_id in options_map else None,
+                        'value_id': value_id,
+                        'value': option_values_map[value_id].value if value_id in option_values_map else None,
+                    }
+                    for option_id, value_id in options.items()
+                ],
+            ))
+        return CartSnapshot(priced, options_map, option_values_map)
+
+    @classmethod
+    def for_customer(cls, customer_id, fresh=False):
+        return cls.price(cls.lines_from_db(customer_id=customer_id), fresh=fresh)
+
+    @classmethod
+    def for_guest(cls, session_id, fresh=False):
+        return cls.price(cls.lines_from_db(session_id=session_id), fresh=fresh)
@@ -16,5 +16,94 @@ def clear_cart():
         db.session.rollback()
         click.echo(f'Ошибка при очистке корзины: {e}')
 
+@click.command('rebuild-category-paths')
+@with_appcontext
+def rebuild_category_paths():
+    """Пересчитать материализованные пути категорий по parent_id"""
+    from app.models.category import Category
+    try:
+        changed = Category.rebuild_paths()
+        db.session.commit()
+        click.echo(f'Пути категорий пересчитаны. Обновлено {changed} категорий.')
+    except Exception as e:
+        db.session.rollback()
+        click.echo(f'Ошибка при пересчёте путей категорий: {e}')
+
+@click.command('reindex-search')
+@with_appcontext
+def reindex_search():
+    """Перестроить поисковый индекс товаров"""
+    from app.search import rebuild_search_index
+    try:
+        terms = rebuild_search_index()
+        db.session.commit()
+        click.echo(f'Поисковый индекс перестроен. Записано {terms} терминов.')
+    except Exception as e:
+        db.session.rollback()
+        click.echo(f'Ошибка при перестроении поискового индекса: {e}')
+
+@click.command('module-registry')
+@with_appcontext
+def module_registry_info():
+    """Загрузить все модули из манифеста и показать время импорта каждого"""
+    from app.module_registry import module_registry
+    total = module_registry.preload()
+    for (name, kind), seconds in sorted(module_registry.load_times.items()):
+        click.echo(f'{name:<16} {kind:<6} {seconds * 1000:8.1f} мс')
+    click.echo(f'Всего: {total * 1000:.1f} мс')
+
+@click.command('rebuild-review-stats')
+@with_appcontext
+def rebuild_review_stats():
+    """Пересчитать статистику отзывов всех товаров (product_review_stats)"""
+    from app.models.review import ProductReviewStats
+    try:
+        rows = ProductReviewStats.rebuild()
+        db.session.commit()
+        click.echo(f'Статистика отзывов пересчитана для {rows} товаров.')
+    except Exception as e:
+        db.session.rollback()
+        click.echo(f'Ошибка при пересчёте статистики отзывов: {e}')
+
+@click.command('purge-guest-carts')
+@click.option('--days', default=30, show_default=True, help='Удалить гостевые строки старше N дней')
+@with_appcontext
+def purge_guest_carts(days):
+    """Удалить брошенные корзины гостей (строки cart_item с session_id)"""
+    from app.cart_service import CartService
+    try:
+        deleted = CartService.purge_guest_carts(days)
+        db.session.commit()
+        click.echo(f'Удалено {deleted} строк гостевых корзин.')
+    except Exception as e:
+        db.session.rollback()
+        click.echo(f'Ошибка при очистке гостевых корзин: {e}')
+
+@click.command('release-expired-reservations')
+@click.option('--batch-size', default=500, show_default=True, help='Удержаний за одну транзакцию')
+@click.option('--interval', default=0, show_default=True, help='Повторять каждые N секунд (0 — один проход)')
+@with_appcontext
+def release_expired_reservations(batch_size, interval):
+    """Освободить просроченные удержания остатков (stock_reservations)"""
+    import time
+    from app.inventory import release_expired, reservation_stats
+    while True:
+        try:
+            released = release_expired(batch_size)
+            stats = reservation_stats()
+            click.echo(f'Освобождено {released} удержаний. Активных: {stats["active"]}.')
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f'Ошибка при освобождении удержаний: {e}')
+        if interval <= 0:
+            break
+        time.sleep(interval)
+
 def register_commands(app):
-    app.cli.add_command(clear_cart) 
\ No newline at end of file
+    app.cli.add_command(clear_cart)
+    app.cli.add_command(rebuild_category_paths)
+    app.cli.add_command(reindex_search)
+    app.cli.add_command(module_registry_info)
+    app.cli.add_command(rebuild_review_stats)
+    app.cli.add_command(purge_guest_carts)
+    app.cli.add_command(release_expired_reservations) 
\ No newline at end of file
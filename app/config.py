@@ -15,4 +15,28 @@ class Config:
     LOGIN_VIEW = 'auth.login'  # Маршрут для страницы логина (замените на ваш)
     LOGIN_MESSAGE = 'Пожалуйста, войдите, чтобы получить доступ к этой странице.'
     LOGIN_MESSAGE_CATEGORY = 'warning'  # Категория сообщения для flash
-    SESSION_PROTECTION = 'strong'  # Строгая защита сессии
\ No newline at end of file
+    SESSION_PROTECTION = 'strong'  # Строгая защита сессии
+    CHROME_CACHE_TTL = int(os.environ.get('CHROME_CACHE_TTL', 300))  # TTL кэша шапки/подвала (категории, настройки, меню), сек
+    FACET_BITMAP_INDEX = os.environ.get('FACET_BITMAP_INDEX', '0') == '1'  # битовый индекс фильтров категории в памяти воркера
+    FACET_INDEX_TTL = int(os.environ.get('FACET_INDEX_TTL', 300))  # TTL битового индекса, сек
+    CATEGORY_PAGE_SIZE = int(os.environ.get('CATEGORY_PAGE_SIZE', 24))  # товаров на страницу листинга категории
+    PRODUCT_CARD_CACHE_TTL = int(os.environ.get('PRODUCT_CARD_CACHE_TTL', 3600))  # TTL кэша HTML карточек товаров, сек
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'  # кэш целых страниц витрины для анонимных посетителей
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'filesystem')  # filesystem | redis | memory (только один воркер: сброс не доходит до остальных)
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))  # TTL страницы в кэше, сек
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 1000))  # размер LRU для бэкенда memory
+    PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR', os.path.join(BASE_DIR, '..', 'instance', 'page_cache'))  # каталог бэкенда filesystem
+    PAGE_CACHE_REDIS_URL = os.environ.get('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')  # адрес бэкенда redis
+    MODULE_REGISTRY_PRELOAD = os.environ.get('MODULE_REGISTRY_PRELOAD', '0') == '1'  # импортировать классы модулей при старте (gunicorn --preload)
+    MODULE_FRAGMENT_CACHE_TTL = int(os.environ.get('MODULE_FRAGMENT_CACHE_TTL', 300))  # TTL HTML модулей главной страницы, сек
+    MODULE_RENDER_WORKERS = int(os.environ.get('MODULE_RENDER_WORKERS', 4))  # потоков для параллельного рендеринга модулей (1 — последовательно)
+    PAGE_CACHE_VARY_COOKIES = [c for c in os.environ.get('PAGE_CACHE_VARY_COOKIES', '').split(',') if c]  # cookie, от которых зависит HTML
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '0') == '1'  # превышение бюджета SQL-запросов страницы — исключение (для тестов), иначе предупреждение в лог
+    QUERY_COUNT_HEADER = os.environ.get('QUERY_COUNT_HEADER', '0') == '1'  # заголовок X-Query-Count с числом SQL-запросов ответа
+    REVIEW_CARD_CACHE_TTL = int(os.environ.get('REVIEW_CARD_CACHE_TTL', 3600))  # TTL кэша HTML карточек отзывов, сек
+    REVIEW_VOTE_BUFFER = os.environ.get('REVIEW_VOTE_BUFFER', '0') == '1'  # копить приращения likes/dislikes в памяти и сбрасывать пакетом
+    REVIEW_VOTE_FLUSH_INTERVAL = int(os.environ.get('REVIEW_VOTE_FLUSH_INTERVAL', 5))  # сброс буфера голосов не реже, сек
+    REVIEW_VOTE_FLUSH_SIZE = int(os.environ.get('REVIEW_VOTE_FLUSH_SIZE', 500))  # сброс буфера голосов по числу голосов
+    INVENTORY_TRACKING = os.environ.get('INVENTORY_TRACKING', '0') == '1'  # резервирование и списание остатков при оформлении заказа (включать после заполнения stock)
+    STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 900))  # сколько держать остаток под корзину, сек
+    VARIATION_INDEX_TTL = int(os.environ.get('VARIATION_INDEX_TTL', 60))  # TTL индекса вариаций (цены корзины) в памяти воркера, сек
\ No newline at end of file
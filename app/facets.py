@@ -0,0 +1,295 @@
+"""
+@file: app/facets.py
+@description: Фасетный фильтр каталога по значениям опций (product_option_value_association):
+              отфильтрованные ID товаров и счётчики значений каждой опции с учётом остальных фильтров
+@dependencies: Product, ProductOption, ProductOptionValue, product_option_value_association, VersionedCache
+@created: 2026-10-18
+"""
+
+from sqlalchemy import and_, case, func
+
+from .cache import VersionedCache
+from .extensions import db
+from .models.product import Product
+from .models.productOptions import ProductOption, ProductOptionValue, product_option_value_association
+
+FACETS_NAMESPACE = 'facets'
+
+# Битовые индексы категорий (включаются настройкой FACET_BITMAP_INDEX)
+facet_index_cache = VersionedCache()
+
+
+def normalize_facet_filters(filters):
+    """{option_id: [value_id, ...]} из JSON/формы -> {int: frozenset(int)}; пустые и битые значения отбрасываются."""
+    selected = {}
+    for option_id, value_ids in (filters or {}).items():
+        try:
+            option_id = int(option_id)
+        except (ValueError, TypeError):
+            continue
+        values = set()
+        for value_id in value_ids or []:
+            try:
+                values.add(int(value_id))
+            except (ValueError, TypeError):
+                continue
+        if values:
+            selected[option_id] = frozenset(values)
+    return selected
+
+
+class FacetResult:
+    """
+    Результат фасетного поиска.
+      product_ids — ID товаров, прошедших фильтры (None, если фильтров нет: подходит вся категория)
+      total       — количество таких товаров
+      facets      — [{'id', 'name', 'display_type', 'option_values': [{'id', 'value', 'count', 'selected'}]}]
+    """
+
+    def __init__(self, product_ids, total, facets, selected):
+        self.product_ids = product_ids
+        self.total = total
+        self.facets = facets
+        self.selected = selected
+
+    def apply(self, query):
+        """Ограничивает запрос товаров отфильтрованными ID."""
+        if self.product_ids is None:
+            return query
+        return query.filter(Product.id.in_(self.product_ids))
+
+    def counts(self):
+        """{value_id: count} — для обновления счётчиков на клиенте."""
+        return {value['id']: value['count'] for facet in self.facets for value in facet['option_values']}
+
+
+class FacetEngine:
+    """
+    Фасеты для набора категорий.
+    Внутри опции выбранные значения объединяются через ИЛИ, между опциями — через И.
+    Счётчик значения опции считается с учётом фильтров всех остальных опций (но не её собственного),
+    поэтому выбор внутри опции не обнуляет соседние значения.
+    """
+
+    def __init__(self, category_ids):
+        self.category_ids = list(category_ids)
+
+    def search(self, selected=None):
+        selected = selected or {}
+        skeleton = self._facet_skeleton()
+        if not selected:
+            total = Product.query.filter(Product.category_id.in_(self.category_ids)).count() if self.category_ids else 0
+            return FacetResult(None, total, self._build_facets(skeleton, selected), selected)
+
+        product_ids = [pid for (pid,) in self._matching_products(selected).all()]
+        # Счётчики всех опций — один сгруппированный запрос при любом числе выбранных опций
+        counts = self._value_counts(selected, option_ids=list(skeleton)) if skeleton else {}
+
+        return FacetResult(product_ids, len(product_ids), self._build_facets(skeleton, selected, counts), selected)
+
+    # ----------------------------
+    #  SQL
+    # ----------------------------
+    def _matching_products(self, selected):
+        """ID товаров категории, у которых есть значение из каждой выбранной опции — один GROUP BY/HAVING."""
+        assoc = product_option_value_association
+        all_values = [value_id for values in selected.values() for value_id in values]
+        return db.session.query(assoc.c.product_id) \
+            .join(ProductOptionValue, ProductOptionValue.id == assoc.c.option_value_id) \
+            .join(Product, Product.id == assoc.c.product_id) \
+            .filter(Product.category_id.in_(self.category_ids), assoc.c.option_value_id.in_(all_values)) \
+            .group_by(assoc.c.product_id) \
+            .having(func.count(func.distinct(ProductOptionValue.option_id)) == len(selected))
+
+    def _facet_skeleton(self):
+        """
+        Все опции и значения, встречающиеся у товаров категории, с базовыми счётчиками (без фильтров).
+        {option_id: {'id', 'name', 'display_type', 'values': {value_id: {'id', 'value', 'count'}}}}
+        """
+        assoc = product_option_value_association
+        rows = db.session.query(
+            ProductOption.id, ProductOption.name, ProductOption.display_type,
+            ProductOptionValue.id, ProductOptionValue.value,
+            func.count(func.distinct(assoc.c.product_id))
+        ).select_from(assoc) \
+            .join(ProductOptionValue, ProductOptionValue.id == assoc.c.option_value_id) \
+            .join(ProductOption, ProductOption.id == ProductOptionValue.option_id) \
+            .join(Product, Product.id == assoc.c.product_id) \
+            .filter(Product.category_id.in_(self.category_ids)) \
+            .group_by(ProductOption.id, ProductOption.name, ProductOption.display_type,
+                      ProductOptionValue.id, ProductOptionValue.value) \
+            .order_by(ProductOption.id, ProductOptionValue.id) \
+            .all() if self.category_ids else []
+
+        skeleton = {}
+        for option_id, option_name, display_type, value_id, value, count in rows:
+            option = skeleton.setdefault(option_id, {
+                'id': option_id,
+                'name': option_name,
+                'display_type': display_type,
+                'values': {}
+            })
+            option['values'][value_id] = {'id': value_id, 'value': value, 'count': count}
+        return skeleton
+
+    def _value_counts(self, selected, option_ids):
+        """
+        {value_id: count} для значений указанных опций одним запросом.
+        Подзапрос flags даёт каждому товару категории флаг m<i> = 1, если у него есть значение из i-й выбранной опции.
+        Строка (товар, значение) опции засчитывается, если выставлены флаги всех выбранных опций,
+        кроме собственной опции значения: SUM(CASE WHEN option_id = <выбранная> THEN <флаги остальных> ...).
+        """
+        assoc = product_option_value_association
+        selected_options = list(selected)
+        flag_columns = [
+            func.max(case((assoc.c.option_value_id.in_(selected[option_id]), 1), else_=0)).label(f'm{i}')
+            for i, option_id in enumerate(selected_options)
+        ]
+        flags = db.session.query(assoc.c.product_id.label('product_id'), *flag_columns) \
+            .join(Product, Product.id == assoc.c.product_id) \
+            .filter(Product.category_id.in_(self.category_ids)) \
+            .group_by(assoc.c.product_id) \
+            .subquery()
+
+        def all_flags(except_option=None):
+            conditions = [flags.c[f'm{i}'] == 1
+                          for i, option_id in enumerate(selected_options) if option_id != except_option]
+            return case((and_(*conditions), 1), else_=0) if conditions else 1
+
+        whens = [(ProductOptionValue.option_id == option_id, all_flags(except_option=option_id))
+                 for option_id in selected_options if option_id in option_ids]
+        hit = case(*whens, else_=all_flags()) if whens else all_flags()
+
+        # (product_id, option_value_id) — первичный ключ ассоциации, поэтому SUM равен числу товаров
+        rows = db.session.query(assoc.c.option_value_id, func.sum(hit)) \
+            .join(ProductOptionValue, ProductOptionValue.id == assoc.c.option_value_id) \
+            .join(flags, flags.c.product_id == assoc.c.product_id) \
+            .filter(ProductOptionValue.option_id.in_(option_ids)) \
+            .group_by(assoc.c.option_value_id) \
+            .all()
+        return {value_id: int(count or 0) for value_id, count in rows}
+
+    @staticmethod
+    def _build_facets(skeleton, selected, counts=None):
+        """Собирает фасеты для шаблона/JSON; без counts берутся базовые счётчики категории."""
+        facets = []
+        for option_id, option in skeleton.items():
+            selected_values = selected.get(option_id, frozenset())
+            facets.append({
+                'id': option['id'],
+                'name': option['name'],
+                'display_type': option['display_type'],
+                'option_values': [
+                    {
+                        'id': value_id,
+                        'value': value['value'],
+                        'count': value['count'] if counts is None else counts.get(value_id, 0),
+                        'selected': value_id in selected_values
+                    }
+                    for value_id, value in option['values'].items()
+                ]
+            })
+        return facets
+
+
+class CategoryBitmapIndex:
+    """
+    Битовый индекс категории в памяти: каждому значению опции соответствует int-битмап по позициям товаров.
+    Фильтрация и счётчики — побитовые операции без запросов к БД. Строится одним запросом.
+    """
+
+    def __init__(self, product_ids, value_products, skeleton):
+        self.product_ids = product_ids  # позиция -> product_id
+        self.all_mask = (1 << len(product_ids)) - 1
+        self.skeleton = skeleton
+        positions = {pid: pos for pos, pid in enumerate(product_ids)}
+        self.value_masks = {}
+        for value_id, pids in value_products.items():
+            mask = 0
+            for pid in pids:
+                mask |= 1 << positions[pid]
+            self.value_masks[value_id] = mask
+
+    @classmethod
+    def build(cls, category_ids):
+        assoc = product_option_value_association
+        product_ids = [pid for (pid,) in db.session.query(Product.id)
+                       .filter(Product.category_id.in_(category_ids)).order_by(Product.id).all()] if category_ids else []
+        rows = db.session.query(
+            assoc.c.product_id, ProductOption.id, ProductOption.name, ProductOption.display_type,
+            ProductOptionValue.id, ProductOptionValue.value
+        ).select_from(assoc) \
+            .join(ProductOptionValue, ProductOptionValue.id == assoc.c.option_value_id) \
+            .join(ProductOption, ProductOption.id == ProductOptionValue.option_id) \
+            .join(Product, Product.id == assoc.c.product_id) \
+            .filter(Product.category_id.in_(category_ids)) \
+            .order_by(ProductOption.id, ProductOptionValue.id) \
+            .all() if product_ids else []
+
+        skeleton = {}
+        value_products = {}
+        for product_id, option_id, option_name, display_type, value_id, value in rows:
+            option = skeleton.setdefault(option_id, {
+                'id': option_id,
+                'name': option_name,
+                'display_type': display_type,
+                'values': {}
+            })
+            option['values'].setdefault(value_id, {'id': value_id, 'value': value, 'count': 0})
+            value_products.setdefault(value_id, set()).add(product_id)
+        for option in skeleton.values():
+            for value_id, value in option['values'].items():
+                value['count'] = len(value_products[value_id])
+        return cls(product_ids, value_products, skeleton)
+
+    def _mask(self, selected):
+        mask = self.all_mask
+        for values in selected.values():
+            option_mask = 0
+            for value_id in values:
+                option_mask |= self.value_masks.get(value_id, 0)
+            mask &= option_mask
+        return mask
+
+    def search(self, selected=None):
+        selected = selected or {}
+        counts = {}
+        for option_id, option in self.skeleton.items():
+            others = {oid: values for oid, values in selected.items() if oid != option_id}
+            mask = self._mask(others)
+            for value_id in option['values']:
+                counts[value_id] = bin(self.value_masks.get(value_id, 0) & mask).count('1')
+        facets = FacetEngine._build_facets(self.skeleton, selected, counts)
+
+        if not selected:
+            return FacetResult(None, len(self.product_ids), facets, selected)
+        mask = self._mask(selected)
+        product_ids = [pid for pos, pid in enumerate(self.product_ids) if mask >> pos & 1]
+        return FacetResult(product_ids, len(product_ids), facets, selected)
+
+
+def get_category_facets(category_id, filters=None):
+    """
+    Фасеты категории с учётом подкатегорий.
+    При FACET_BITMAP_INDEX = True используется битовый индекс категории из кэша процесса (TTL FACET_INDEX_TTL),
+    иначе — сгруппированные SQL-запросы.
+    """
+    from flask import current_app
+    from .models.category import get_category_subtree_ids
+
+    selected = normalize_facet_filters(filters)
+    category_ids = get_category_subtree_ids(category_id)
+    if current_app.config.get('FACET_BITMAP_INDEX'):
+        index = facet_index_cache.get_or_set(
+            FACETS_NAMESPACE,
+            lambda: CategoryBitmapIndex.build(category_ids),
+            key=category_id,
+            ttl=current_app.config.get('FACET_INDEX_TTL', 300)
+        )
+        return index.search(selected)
+    return FacetEngine(category_ids).search(selected)
+
+
+def invalidate_facet_index():
+    """Сбрасывает битовые индексы всех категорий (товар мог сменить категорию или опции)."""
+    facet_index_cache.bump(FACETS_NAMESPACE)
@@ -0,0 +1,255 @@
+"""
+@file: app/inventory.py
+@description: Резервирование остатков для корзины и списание при создании заказа.
+              Удержание — UPDATE reserved = reserved + n WHERE stock - reserved >= n (товар или вариация,
+              stock IS NULL — остаток не ведётся),
+              списание — UPDATE stock = stock - n WHERE stock - reserved + удержанное >= n, в транзакции заказа.
+              Просроченные удержания освобождает flask release-expired-reservations; счётчики — inventory_metrics
+@dependencies: StockReservation, Product, ProductVariation
+@created: 2026-10-18
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, or_
+
+from .extensions import db
+from .models.product import Product
+from .models.productOptions import ProductVariation
+from .models.stock_reservation import StockReservation
+
+logger = logging.getLogger(__name__)
+
+_TABLES = {
+    'product': Product.__table__,
+    'variation': ProductVariation.__table__,
+}
+
+
+class InsufficientStock(Exception):
+    """Остатка не хватило: lines — строки снимка корзины, которые нельзя списать."""
+
+    def __init__(self, lines):
+        super().__init__('Недостаточно товара на складе')
+        self.lines = lines
+
+
+class InventoryMetrics:
+    """
+    Счётчики процесса:
+      reserved / reserve_conflicts      — удержания созданы / не хватило остатка
+      committed / commit_conflicts      — строки списаны при заказе / заказ отклонён из-за остатка
+      released / expired                — удержания освобождены владельцем / сборщиком просроченных
+    """
+
+    FIELDS = ('reserved', 'reserve_conflicts', 'committed', 'commit_conflicts', 'released', 'expired')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, name, value=1):
+        if value:
+            with self._lock:
+                self._counts[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+inventory_metrics = InventoryMetrics()
+
+
+def inventory_enabled():
+    return current_app.config.get('INVENTORY_TRACKING', False)
+
+
+def _line_target(line):
+    """Чей остаток расходует строка снимка корзины: вариации (если опции совпали с ней) или товара."""
+    return ('variation', line.variation_id) if line.variation_id else ('product', line.product.id)
+
+
+def _quantities_by_target(lines):
+    quantities = defaultdict(int)
+    for line in lines:
+        quantities[_line_target(line)] += line.quantity
+    return quantities
+
+
+def _available(table, quantity, own=0):
+    """
+    Условие UPDATE: свободного остатка хватает на quantity (с учётом уже удержанного владельцем own).
+    stock IS NULL — остаток не ведётся, ограничения нет (NULL - n остаётся NULL при списании).
+    """
+    return or_(table.c.stock.is_(None), table.c.stock - table.c.reserved + own >= quantity)
+
+
+def _owner_filter(customer_id=None, session_id=None):
+    if customer_id:
+        return StockReservation.customer_id == customer_id
+    return db.and_(StockReservation.session_id == session_id, StockReservation.customer_id.is_(None))
+
+
+def _delete_reservations(reservations):
+    """
+    Удаляет удержания по одному и возвращает {target: количество} только для реально удалённых —
+    если ту же строку уже удалил параллельный запрос или сборщик, её количество не освобождается дважды.
+    """
+    table = StockReservation.__table__
+    released = defaultdict(int)
+    for reservation in reservations:
+        if db.session.execute(table.delete().where(table.c.id == reservation.id)).rowcount:
+            released[reservation.target] += reservation.quantity
+    return released
+
+
+def _take_owner_reservations(customer_id=None, session_id=None):
+    """
+    Забирает удержания владельца для списания: строки блокируются (FOR UPDATE) и удаляются одним DELETE,
+    поэтому сборщик просроченных не освободит их параллельно. Возвращает {target: количество}.
+    """
+    reservations = StockReservation.query.filter(_owner_filter(customer_id, session_id)) \
+        .order_by(StockReservation.id).with_for_update().all()
+    held = defaultdict(int)
+    for reservation in reservations:
+        held[reservation.target] += reservation.quantity
+    if reservations:
+        table = StockReservation.__table__
+        db.session.execute(table.delete().where(table.c.id.in_([r.id for r in reservations])))
+    return held
+
+
+def _release_reserved(released):
+    """reserved = reserved - n для освобождённых удержаний (по возрастанию id — без взаимоблокировок)."""
+    for (kind, target_id), quantity in sorted(released.items()):
+        table = _TABLES[kind]
+        db.session.execute(
+            table.update().where(table.c.id == target_id).values(
+                reserved=case((table.c.reserved >= quantity, table.c.reserved - quantity), else_=0)
+            )
+        )
+
+
+def release_holds(customer_id=None, session_id=None):
+    """Освобождает все удержания покупателя или гостя (без commit). Возвращает число освобождённых единиц."""
+    if not customer_id and not session_id:
+        return 0
+    reservations = StockReservation.query.filter(_owner_filter(customer_id, session_id)).all()
+    released = _delete_reservations(reservations)
+    _release_reserved(released)
+    total = sum(released.values())
+    inventory_metrics.incr('released', total)
+    return total
+
+
+def reserve_cart(cart, customer_id=None, session_id=None, ttl=None):
+    """
+    Удерживает остаток под строки корзины на ttl секунд (STOCK_RESERVATION_TTL), заменяя прежние удержания владельца.
+    Каждое удержание — условный UPDATE, поэтому два покупателя не удержат одну и ту же единицу.
+    Возвращает строки, под которые остатка не хватило (без commit).
+    """
+    if not inventory_enabled() or (not customer_id and not session_id):
+        return []
+    ttl = ttl or current_app.config.get('STOCK_RESERVATION_TTL', 900)
+    release_holds(customer_id, session_id)
+
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    failed_targets = set()
+    for (kind, target_id), quantity in sorted(_quantities_by_target(cart.lines).items()):
+        table = _TABLES[kind]
+        held = db.session.execute(
+            table.update().where(
+                table.c.id == target_id,
+                _available(table, quantity),
+            ).values(reserved=table.c.reserved + quantity)
+        ).rowcount
+        if not held:
+            failed_targets.add((kind, target_id))
+            continue
+        product_id = next(line.product.id for line in cart.lines if _line_target(line) == (kind, target_id))
+        db.session.add(StockReservation(
+            product_id=product_id,
+            variation_id=target_id if kind == 'variation' else None,
+            quantity=quantity,
+            customer_id=customer_id,
+            session_id=None if customer_id else session_id,
+            expires_at=expires_at,
+        ))
+        inventory_metrics.incr('reserved')
+    db.session.flush()
+
+    inventory_metrics.incr('reserve_conflicts', len(failed_targets))
+    return [line for line in cart.lines if _line_target(line) in failed_targets]
+
+
+def commit_cart(cart, customer_id=None, session_id=None):
+    """
+    Списывает остаток под строки заказа в текущей транзакции: удержания владельца превращаются в списание,
+    недостающее берётся из свободного остатка. Условный UPDATE ... WHERE stock - reserved + удержанное >= n
+    не даёт продать больше, чем есть. Если хоть одна строка не списалась — InsufficientStock
+    (вызывающий код откатывает транзакцию целиком).
+    """
+    if not inventory_enabled():
+        return
+    held = {}
+    if customer_id or session_id:
+        held = _take_owner_reservations(customer_id, session_id)
+
+    needed = _quantities_by_target(cart.lines)
+    failed_targets = set()
+    for (kind, target_id), quantity in sorted(needed.items()):
+        table = _TABLES[kind]
+        own = held.pop((kind, target_id), 0)
+        committed = db.session.execute(
+            table.update().where(
+                table.c.id == target_id,
+                _available(table, quantity, own),
+            ).values(stock=table.c.stock - quantity, reserved=table.c.reserved - own)
+        ).rowcount
+        if not committed:
+            failed_targets.add((kind, target_id))
+    # Удержания на товары, которых уже нет в корзине, просто освобождаются
+    _release_reserved(held)
+
+    if failed_targets:
+        inventory_metrics.incr('commit_conflicts', len(failed_targets))
+        logger.warning('Заказ отклонён: не хватило остатка для %s', sorted(failed_targets))
+        raise InsufficientStock([line for line in cart.lines if _line_target(line) in failed_targets])
+    inventory_metrics.incr('committed', len(needed))
+
+
+def release_expired(batch_size=500, now=None):
+    """
+    Освобождает просроченные удержания пачками по batch_size, каждая пачка — отдельная транзакция.
+    Возвращает число освобождённых удержаний.
+    """
+    now = now or datetime.utcnow()
+    total = 0
+    while True:
+        reservations = StockReservation.query.filter(StockReservation.expires_at < now) \
+            .order_by(StockReservation.id).limit(batch_size).all()
+        if not reservations:
+            break
+        released = _delete_reservations(reservations)
+        _release_reserved(released)
+        db.session.commit()
+        total += len(reservations)
+        inventory_metrics.incr('expired', sum(released.values()))
+        if len(reservations) < batch_size:
+            break
+    return total
+
+
+def reservation_stats():
+    """Активные и просроченные удержания в БД + счётчики текущего процесса."""
+    now = datetime.utcnow()
+    active, expired = db.session.query(
+        func.count(case((StockReservation.expires_at >= now, 1))),
+        func.count(case((StockReservation.expires_at < now, 1))),
+    ).one()
+    return {'active': active, 'expired': expired, 'metrics': inventory_metrics.snapshot()}
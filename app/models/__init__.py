@@ -6,12 +6,13 @@ from .productOptions import ProductOption, ProductOptionValue, ProductOptionValu
 from .attribute import Attribute
 from .attributeValue import AttributeValue
 from .productAttribute import ProductAttribute
+from .search import ProductSearchTerm
 from .image import Image
 from .order import Order
 from .cart import CartItem
 from .customer import Customer
 from .customer_address import CustomerAddress
-from .review import Review
+from .review import Review, ProductReviewStats
 from .favorite import Favorite
 from .wishlist import Wishlist, WishlistItem
 from .comparison import ComparisonList, ComparisonItem
@@ -27,6 +28,7 @@ from .promocode import Promocode
 from .shipping import ShippingZone, ShippingMethod
 from .tax import TaxRate
 from .warehouse import Warehouse, WarehouseStock
+from .stock_reservation import StockReservation
 from .size_chart import SizeChart, ProductSizeChart
 from .referral import Referral
 from .region import Region
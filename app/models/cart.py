@@ -1,19 +1,53 @@
 from ..extensions import db
 from .base import BaseModel
 from datetime import datetime
+import hashlib
 import json
 
+
+def normalize_selected_options(selected_options):
+    """{option_id: value_id} с целыми ключами и значениями; битые пары отбрасываются."""
+    normalized = {}
+    if not isinstance(selected_options, dict):
+        return normalized
+    for option_id, value_id in selected_options.items():
+        try:
+            normalized[int(option_id)] = int(value_id)
+        except (ValueError, TypeError):
+            continue
+    return normalized
+
+
+def options_signature(selected_options):
+    """Ключ сравнения опций строки: одинаковые наборы опций в любом порядке и типах дают один ключ."""
+    return tuple(sorted(normalize_selected_options(selected_options).items()))
+
+
+def options_hash(selected_options):
+    """SHA-1 нормализованной сигнатуры опций — колонка CartItem.options_hash для уникального ключа строки."""
+    return hashlib.sha1(json.dumps(options_signature(selected_options)).encode()).hexdigest()
+
+
 class CartItem(BaseModel):
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True)  # Для авторизованных, null для гостей
-    session_id = db.Column(db.String(100), nullable=True)  # Для неавторизованных
+    session_id = db.Column(db.String(100), nullable=True)  # Для неавторизованных: session['session_id'] гостя
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     selected_options = db.Column(db.Text, nullable=True)  # JSON строка с выбранными опциями
+    options_hash = db.Column(db.String(40), nullable=False, server_default='')  # options_hash(selected_options)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     product = db.relationship('Product', backref='cart_items')  # Связь с товаром
 
+    __table_args__ = (
+        db.Index('idx_cart_item_customer', 'customer_id'),
+        db.Index('idx_cart_item_session', 'session_id'),
+        # Одна строка на товар + набор опций: повторное добавление — upsert количества
+        db.UniqueConstraint('customer_id', 'product_id', 'options_hash', name='uq_cart_item_customer_line'),
+        db.UniqueConstraint('session_id', 'product_id', 'options_hash', name='uq_cart_item_session_line'),
+    )
+
     def get_selected_options(self):
         """Получить выбранные опции как словарь"""
         if self.selected_options:
@@ -24,8 +58,9 @@ class CartItem(BaseModel):
         return {}
 
     def set_selected_options(self, options):
-        """Установить выбранные опции"""
+        """Установить выбранные опции (и их хеш)"""
         self.selected_options = json.dumps(options) if options else None
+        self.options_hash = options_hash(options)
 
     def __repr__(self):
         return f'<CartItem product_id={self.product_id} quantity={self.quantity}>'
\ No newline at end of file
@@ -1,7 +1,16 @@
+import logging
+from collections import namedtuple
+
+from sqlalchemy import func, literal
+from sqlalchemy.orm import aliased
+
 from ..extensions import db
 from .base import BaseModel
+from ..query_counter import not_budgeted
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 
 class Category(BaseModel):
     __tablename__ = 'categories'
@@ -17,6 +26,9 @@ class Category(BaseModel):
     sort_order = db.Column(db.Integer, default=0)  # порядок сортировки
     is_indexed = db.Column(db.Boolean, default=False)  # флаг индексации
     image_id = db.Column(db.Integer, db.ForeignKey('images.id'), nullable=True)  # привязанная картинка
+    # Материализованный путь из ID предков и самой категории: "/1/5/12/".
+    # Поддерево — один запрос по префиксу (path LIKE '/1/5/%'), цепочка предков — разбор строки
+    path = db.Column(db.String(255), nullable=True, index=True)
 
     parent = db.relationship('Category', remote_side='Category.id', backref='subcategories')
 
@@ -31,17 +43,97 @@ class Category(BaseModel):
             'category': <Category>,
             'children': [ {...}, {...} ]
           }
+        Все категории (или поддерево parent_id) загружаются одним запросом и собираются в памяти.
         """
-        nodes = []
-        # обходим по sort_order
-        query = Category.query.filter_by(parent_id=parent_id).order_by(Category.sort_order, Category.id)
-        for cat in query:
-            node = {
-                'category': cat,
-                'children': Category.get_category_tree(cat.id)  # рекурсивный вызов
-            }
-            nodes.append(node)
-        return nodes
+        query = Category.query
+        if parent_id is not None:
+            parent_path = db.session.query(Category.path).filter(Category.id == parent_id).scalar()
+            if not parent_path:
+                return []
+            query = query.filter(Category.path.like(parent_path + '%'), Category.id != parent_id)
+
+        return assemble_category_tree(
+            query.order_by(Category.sort_order, Category.name).all(),
+            lambda cat, children: {'category': cat, 'children': children},
+            parent_id=parent_id
+        )
+
+    def build_path(self, parent_path=None):
+        """Путь категории по пути родителя (id должен быть известен — после flush)."""
+        return f"{parent_path or '/'}{self.id}/"
+
+    def update_path(self):
+        """
+        Пересчитывает path категории после сохранения и переносит пути всего поддерева,
+        если категорию переместили. Вызывать после flush/commit, до финального commit.
+        """
+        old_path = self.path
+        parent_path = None
+        if self.parent_id:
+            parent_path = db.session.query(Category.path).filter(Category.id == self.parent_id).scalar()
+            if not parent_path:
+                # Пути ещё не заполнены (старая база) — пересчитываем целиком
+                Category.rebuild_paths()
+                return
+        new_path = self.build_path(parent_path)
+        if old_path == new_path:
+            return
+        self.path = new_path
+        if old_path:
+            # Один UPDATE для всех потомков: заменяем префикс старого пути на новый
+            Category.query.filter(Category.path.like(old_path + '%'), Category.id != self.id).update(
+                {Category.path: literal(new_path) + func.substr(Category.path, len(old_path) + 1)},
+                synchronize_session=False
+            )
+        elif Category.query.filter(Category.parent_id == self.id).first():
+            Category.rebuild_paths()
+
+    def is_descendant_of(self, category_id):
+        """True, если category_id — сама категория или один из её предков."""
+        return category_id in self.get_ancestor_ids()
+
+    def get_ancestor_ids(self):
+        """ID предков от корня до самой категории (по path, без запросов)."""
+        if not self.path:
+            return [self.id]
+        return [int(part) for part in self.path.strip('/').split('/') if part]
+
+    def get_ancestors(self):
+        """Цепочка категорий от корня до текущей — одним запросом (для хлебных крошек)."""
+        ids = self.get_ancestor_ids()
+        if len(ids) <= 1:
+            return [self]
+        by_id = {cat.id: cat for cat in Category.query.filter(Category.id.in_(ids)).all()}
+        return [by_id[cid] for cid in ids if cid in by_id]
+
+    @staticmethod
+    def rebuild_paths():
+        """Пересчитывает path всех категорий по parent_id (одна выборка; обновляются только изменившиеся)."""
+        rows = db.session.query(Category.id, Category.parent_id, Category.path).all()
+        parents = {cid: parent_id for cid, parent_id, _ in rows}
+        current = {cid: path for cid, _, path in rows}
+        paths = {}
+
+        def resolve(cid):
+            chain = []
+            node = cid
+            # Защита от циклов в parent_id
+            while node is not None and node not in paths and node not in chain:
+                chain.append(node)
+                node = parents.get(node)
+            prefix = paths.get(node, '/')
+            for item in reversed(chain):
+                prefix = f"{prefix}{item}/"
+                paths[item] = prefix
+            return paths[cid]
+
+        changed = 0
+        for cid in parents:
+            path = resolve(cid)
+            if current.get(cid) != path:
+                Category.query.filter(Category.id == cid).update({Category.path: path}, synchronize_session=False)
+                changed += 1
+        return changed
 
     def full_name(self):
         if self.parent:
@@ -52,17 +144,123 @@ class Category(BaseModel):
 def build_category_list(parent_id=None, level=0):
     """
     Возвращает список кортежей (cat, level), где cat - объект Category,
-    а level - уровень вложения. Сортируем по sort_order, затем по id.
+    а level - уровень вложения. Сортируем по sort_order, затем по name.
     """
     results = []
-    query = Category.query.filter_by(parent_id=parent_id).order_by(Category.sort_order, Category.id)
-    for cat in query:
-        results.append((cat, level))
-        # рекурсивно добавляем дочерние
-        results.extend(build_category_list(cat.id, level + 1))
+
+    def walk(nodes, depth):
+        for node in nodes:
+            results.append((node['category'], depth))
+            # рекурсивно добавляем дочерние (уже загружены)
+            walk(node['children'], depth + 1)
+
+    walk(Category.get_category_tree(parent_id), level)
     return results
 
+
+def assemble_category_tree(categories, make_node, parent_id=None, max_depth=None):
+    """
+    Общий сборщик дерева категорий за O(n).
+    categories — Category или CategoryRow, уже упорядоченные по (sort_order, name): порядок внутри уровня сохраняется.
+    make_node(category, children) строит узел; корни — parent_id IS NULL или 0.
+    """
+    children_by_parent = {}
+    for category in categories:
+        children_by_parent.setdefault(category.parent_id or None, []).append(category)
+
+    visited = set()
+
+    def build(level_parent_id, depth):
+        if max_depth is not None and depth >= max_depth:
+            return []
+        nodes = []
+        for category in children_by_parent.get(level_parent_id or None, []):
+            # Защита от циклов в parent_id
+            if category.id in visited:
+                continue
+            visited.add(category.id)
+            nodes.append(make_node(category, build(category.id, depth + 1)))
+        return nodes
+
+    return build(parent_id, 0)
+
+
+# Отсоединённая строка категории для витринных деревьев (автокаталог меню)
+CategoryRow = namedtuple('CategoryRow', 'id parent_id name slug description image_id')
+
+
+def _category_version():
+    """
+    Версия таблицы категорий: (количество, последнее updated_at).
+    Меняется при добавлении, удалении и правке категории в любом воркере — дешёвый агрегат вместо полной выборки.
+    """
+    count, last_updated = db.session.query(func.count(Category.id), func.max(Category.updated_at)).one()
+    return count, str(last_updated)
+
+
+def get_catalog_categories():
+    """
+    Все категории одной выборкой в порядке (sort_order, name) — для assemble_category_tree.
+    Результат мемоизирован в кэше обвязки по версии таблицы: сбрасывается invalidate_chrome(CHROME_CATEGORIES)
+    в текущем процессе и сменой версии в остальных.
+    """
+    from ..cache import chrome_cache, CHROME_CATEGORIES
+    return chrome_cache.get_or_set(CHROME_CATEGORIES, _load_catalog_categories, key=('tree', _category_version()))
+
+
+def _load_catalog_categories():
+    rows = (
+        db.session.query(Category.id, Category.parent_id, Category.name, Category.slug,
+                         Category.description, Category.image_id)
+        .order_by(Category.sort_order, Category.name)
+        .all()
+    )
+    return [CategoryRow(*row) for row in rows]
+
+
+def get_category_subtree_ids(category_id):
+    """ID категории и всех её потомков — один запрос по материализованному пути."""
+    if not category_id:
+        return []
+    parent = aliased(Category)
+    ids = [cid for (cid,) in db.session.query(Category.id)
+           .join(parent, Category.path.like(parent.path + '%'))
+           .filter(parent.id == category_id)
+           .all()]
+    if ids:
+        return ids
+    # Категории нет или её path не заполнен — обходим parent_id в памяти, ничего не записывая
+    return _subtree_ids_by_parent(category_id)
+
+
+def _subtree_ids_by_parent(category_id):
+    """Запасной обход поддерева по parent_id (одна выборка id, parent_id) для категорий без path."""
+    children = {}
+    known = set()
+    for cid, parent_id in db.session.query(Category.id, Category.parent_id).all():
+        known.add(cid)
+        children.setdefault(parent_id, []).append(cid)
+    if category_id not in known:
+        return []
+    logger.warning('У категории %s не заполнен path — выполните flask rebuild-category-paths', category_id)
+    ids = []
+    stack = [category_id]
+    while stack:
+        cid = stack.pop()
+        if cid in ids:
+            continue
+        ids.append(cid)
+        stack.extend(children.get(cid, []))
+    return ids
+
 def getPcats():
+    # Корневые категории для шапки: снимок из кэша обвязки, сбрасывается при сохранении категорий
+    from ..cache import chrome_cache, CHROME_CATEGORIES
+    return chrome_cache.get_or_set(CHROME_CATEGORIES, _load_pcats, key='root')
+
+
+@not_budgeted()
+def _load_pcats():
     query = Category.query.filter_by(parent_id=None).order_by(Category.sort_order, Category.id)
     results = []
     for cat in query:
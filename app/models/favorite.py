@@ -17,7 +17,8 @@ class Favorite(BaseModel):
     )
 
 def getFavorites(customer_id):
-    return Favorite.query.filter_by(customer_id=customer_id).all()
+    # Товар подгружаем тем же запросом, чтобы списки избранного не делали запрос на каждую карточку
+    return Favorite.query.options(db.joinedload(Favorite.product)).filter_by(customer_id=customer_id).all()
 
 def addFavorite(customer_id, product_id):
     # Проверяем, не существует ли уже такая запись
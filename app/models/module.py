@@ -1,8 +1,43 @@
+import json
+import logging
+import threading
+
 from ..extensions import db
 from datetime import datetime
 from .base import BaseModel
 from sqlalchemy.dialects.mysql import JSON
 
+_logger = logging.getLogger(__name__)
+
+# Приведение значений настроек к типам из settings_schema
+_SETTING_TYPES = {
+    'bool': lambda value: value.strip().lower() in ('1', 'true', 'on', 'yes') if isinstance(value, str) else bool(value),
+    'int': int,
+    'float': float,
+    'str': str,
+    'list': list,
+    'dict': dict,
+}
+
+
+class ModuleSettings(dict):
+    """
+    Разобранные и проверенные настройки экземпляра модуля (только чтение).
+    Доступ и по ключу, и по атрибуту: settings['title'] / settings.title; отсутствующий ключ -> None.
+    Объект разделяется между запросами (мемоизация), поэтому изменять его нельзя.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('ModuleSettings только для чтения — сохраняйте через ModuleInstance.set_settings()')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
 class Module(BaseModel):
     """Шаблоны модулей"""
     __tablename__ = 'modules'
@@ -13,6 +48,29 @@ class Module(BaseModel):
     templates = db.Column(JSON, nullable=False)  # Список доступных шаблонов
     creation_template = db.Column(db.String(255), nullable=False)
 
+    def get_settings_fields(self):
+        """
+        settings_schema в виде {поле: {'type', 'default'}}.
+        Поддерживаются {"поле": "bool"}, {"поле": {"type": "int", "default": 5}}
+        и список [{"name": "поле", "type": ..., "default": ...}]; неизвестные типы не приводятся.
+        """
+        schema = self.settings_schema
+        if isinstance(schema, str):
+            try:
+                schema = json.loads(schema) if schema else {}
+            except ValueError:
+                schema = {}
+        if isinstance(schema, list):
+            schema = {field['name']: field for field in schema if isinstance(field, dict) and field.get('name')}
+        fields = {}
+        for name, spec in (schema or {}).items():
+            if isinstance(spec, str):
+                spec = {'type': spec}
+            elif not isinstance(spec, dict):
+                spec = {}
+            fields[name] = {'type': spec.get('type'), 'default': spec.get('default')}
+        return fields
+
     def __repr__(self):
         return f"<Module {self.name}>"
 
@@ -24,10 +82,85 @@ class ModuleInstance(BaseModel):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), nullable=False, index=True)
     settings = db.Column(JSON, nullable=False)  # Настройки конкретного модуля
+    # Увеличивается при каждом set_settings — ключ мемоизации разобранных настроек
+    settings_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     content = db.Column(JSON, nullable=True)  # Контент модуля (например, изображения для галереи)
     selected_template = db.Column(db.String(255), nullable=False)  # Выбранный шаблон отображения
 
     module = db.relationship('Module', backref=db.backref('instances', lazy=True))
 
+    # (id, settings_version) -> ModuleSettings
+    _settings_memo = {}
+    _settings_memo_lock = threading.Lock()
+    SETTINGS_MEMO_LIMIT = 5000
+
+    def _settings_fields(self):
+        module = self.module
+        if module is None and self.module_id:
+            # Экземпляр может быть ещё не сохранён (settings пока пустые) — без autoflush
+            with db.session.no_autoflush:
+                module = db.session.get(Module, self.module_id)
+        return module.get_settings_fields() if module else {}
+
+    @staticmethod
+    def validate_settings(values, fields):
+        """
+        Приводит значения к типам схемы и подставляет значения по умолчанию.
+        Невалидное значение заменяется значением по умолчанию; поля вне схемы сохраняются как есть.
+        """
+        result = dict(values or {})
+        for name, field in fields.items():
+            if result.get(name) is None:
+                if field['default'] is not None:
+                    result[name] = field['default']
+                continue
+            caster = _SETTING_TYPES.get(field['type'])
+            if caster is None:
+                continue
+            try:
+                result[name] = caster(result[name])
+            except (TypeError, ValueError):
+                _logger.warning(f"Настройка {name}: значение {result[name]!r} не приводится к {field['type']}")
+                result[name] = field['default']
+        return result
+
+    def _parse_settings(self):
+        raw = self.settings
+        if isinstance(raw, str):
+            try:
+                raw = json.loads(raw) if raw else {}
+            except ValueError:
+                raw = {}
+        if not isinstance(raw, dict):
+            raw = {}
+        return ModuleSettings(self.validate_settings(raw, self._settings_fields()))
+
+    def get_settings(self):
+        """
+        Настройки как ModuleSettings. JSON разбирается один раз на (id, settings_version) в процессе —
+        горячие пути рендеринга не парсят его повторно.
+        """
+        if not self.id:
+            return self._parse_settings()
+        key = (self.id, self.settings_version or 0)
+        settings = self._settings_memo.get(key)
+        if settings is None:
+            settings = self._parse_settings()
+            with self._settings_memo_lock:
+                if len(self._settings_memo) >= self.SETTINGS_MEMO_LIMIT:
+                    self._settings_memo.clear()
+                self._settings_memo[key] = settings
+        return settings
+
+    def set_settings(self, values):
+        """Единственная точка сохранения настроек: проверка по схеме, сериализация и новая версия."""
+        if isinstance(values, str):
+            try:
+                values = json.loads(values) if values else {}
+            except ValueError:
+                values = {}
+        self.settings = json.dumps(self.validate_settings(values, self._settings_fields()))
+        self.settings_version = (self.settings_version or 0) + 1
+
     def __repr__(self):
-        return f"<ModuleInstance {self.id} of Module {self.module.name}>"
\ No newline at end of file
+        return f"<ModuleInstance {self.id} of Module {self.module.name}>"
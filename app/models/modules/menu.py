@@ -5,10 +5,15 @@
 @created: 2024-12-21
 """
 
+import json
+import logging
+
 from ...extensions import db
 from ..base import BaseModel
 from sqlalchemy.dialects.mysql import JSON
 
+_logger = logging.getLogger(__name__)
+
 __all__ = ['MenuModuleInstance', 'MenuItemExtended']
 
 
@@ -30,10 +35,50 @@ class MenuModuleInstance(BaseModel):
     enable_auto_catalog = db.Column(db.Boolean, default=True)  # автогенерация каталога
     is_main = db.Column(db.Boolean, default=False, nullable=False)  # Главное меню (header)
 
+    # Материализованное дерево меню (JSON) и его поколение: NULL — снимок устарел и пересобирается при чтении
+    tree_snapshot = db.Column(db.Text, nullable=True)
+    snapshot_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Связи
     module_instance = db.relationship('ModuleInstance', backref=db.backref('menu_instance', uselist=False))
     menu = db.relationship('Menu', backref='menu_instances')
 
+    def get_tree_snapshot(self):
+        """Сохранённое дерево меню или None, если снимок устарел."""
+        if not self.tree_snapshot:
+            return None
+        try:
+            return json.loads(self.tree_snapshot)
+        except ValueError:
+            return None
+
+    def store_tree_snapshot(self, snapshot, version):
+        """
+        Сохраняет дерево отдельной короткой транзакцией (не трогая сессию запроса).
+        Запись условная: если снимок успели сбросить во время сборки (version изменился), устаревшее дерево не сохраняется.
+        """
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    db.update(MenuModuleInstance)
+                    .where(MenuModuleInstance.id == self.id, MenuModuleInstance.snapshot_version == version)
+                    .values(tree_snapshot=json.dumps(snapshot, ensure_ascii=False))
+                )
+        except Exception as e:
+            # Снимок — только ускорение: при ошибке записи дерево соберётся заново при следующем чтении
+            _logger.warning(f"Не удалось сохранить снимок меню {self.id}: {e}")
+
+    @staticmethod
+    def mark_snapshots_stale(menu_instance_id=None):
+        """Сбрасывает снимки (все или одного экземпляра) и увеличивает их поколение. Фиксирует вызывающий."""
+        query = db.update(MenuModuleInstance).values(
+            tree_snapshot=None,
+            snapshot_version=MenuModuleInstance.snapshot_version + 1
+        )
+        if menu_instance_id is not None:
+            query = query.where(MenuModuleInstance.id == menu_instance_id)
+        db.session.execute(query)
+
     def __repr__(self):
         return f"<MenuModuleInstance {self.title}>"
 
@@ -85,64 +130,68 @@ class MenuItemExtended(BaseModel):
     def __repr__(self):
         return f"<MenuItemExtended {self.item_type}:{self.target_id}>"
 
-    def get_dynamic_url(self):
-        """Генерирует URL на основе типа пункта меню"""
+    # item_type -> (модель, поле названия, префикс URL, текст для удалённого объекта)
+    @staticmethod
+    def _target_types():
         from ..page import Page
         from ..category import Category
         from ..post import Post
         from ..post_category import PostCategory
+        return {
+            'page': (Page, Page.title, '/page/', 'Страница не найдена'),
+            'category': (Category, Category.name, '/category/', 'Категория не найдена'),
+            'post_category': (PostCategory, PostCategory.name, '/blog/category/', 'Категория статей не найдена'),
+            'post': (Post, Post.title, '/blog/', 'Статья не найдена'),
+        }
+
+    @staticmethod
+    def load_targets(extended_items):
+        """
+        Целевые объекты пунктов меню: {(item_type, target_id): {'title', 'url'}}.
+        ID собираются по типам, каждый тип — один запрос IN.
+        """
+        ids_by_type = {}
+        for extended_item in extended_items:
+            if extended_item.target_id:
+                ids_by_type.setdefault(extended_item.item_type, set()).add(extended_item.target_id)
+
+        targets = {}
+        for item_type, (model, title_column, url_prefix, _) in MenuItemExtended._target_types().items():
+            ids = ids_by_type.get(item_type)
+            if not ids:
+                continue
+            rows = db.session.query(model.id, title_column, model.slug).filter(model.id.in_(ids)).all()
+            for target_id, title, slug in rows:
+                targets[(item_type, target_id)] = {'title': title, 'url': f'{url_prefix}{slug}'}
+        return targets
+
+    def _target(self, targets):
+        if targets is None:
+            targets = self.load_targets([self])
+        return targets.get((self.item_type, self.target_id))
+
+    def get_dynamic_url(self, targets=None):
+        """Генерирует URL на основе типа пункта меню (targets — результат load_targets для пакета пунктов)"""
+        if self.item_type in self._target_types() and self.target_id:
+            target = self._target(targets)
+            return target['url'] if target else '#'
 
-        if self.item_type == 'page' and self.target_id:
-            page = Page.query.get(self.target_id)
-            return f'/page/{page.slug}' if page else '#'
-            
-        elif self.item_type == 'category' and self.target_id:
-            category = Category.query.get(self.target_id)
-            return f'/category/{category.slug}' if category else '#'
-            
-        elif self.item_type == 'post_category' and self.target_id:
-            post_cat = PostCategory.query.get(self.target_id)
-            return f'/blog/category/{post_cat.slug}' if post_cat else '#'
-            
-        elif self.item_type == 'post' and self.target_id:
-            post = Post.query.get(self.target_id)
-            return f'/blog/{post.slug}' if post else '#'
-            
         elif self.item_type == 'catalog':
             return '/catalog'
-            
-        elif self.item_type == 'external':
-            return self.menu_item.url if self.menu_item else '#'
-            
+
         else:
             return self.menu_item.url if self.menu_item else '#'
 
-    def get_target_title(self):
-        """Получает название целевого объекта"""
-        from ..page import Page
-        from ..category import Category
-        from ..post import Post
-        from ..post_category import PostCategory
+    def get_target_title(self, targets=None):
+        """Получает название целевого объекта (targets — результат load_targets для пакета пунктов)"""
+        target_types = self._target_types()
+        if self.item_type in target_types and self.target_id:
+            target = self._target(targets)
+            return target['title'] if target else target_types[self.item_type][3]
 
-        if self.item_type == 'page' and self.target_id:
-            page = Page.query.get(self.target_id)
-            return page.title if page else 'Страница не найдена'
-            
-        elif self.item_type == 'category' and self.target_id:
-            category = Category.query.get(self.target_id)
-            return category.name if category else 'Категория не найдена'
-            
-        elif self.item_type == 'post_category' and self.target_id:
-            post_cat = PostCategory.query.get(self.target_id)
-            return post_cat.name if post_cat else 'Категория статей не найдена'
-            
-        elif self.item_type == 'post' and self.target_id:
-            post = Post.query.get(self.target_id)
-            return post.title if post else 'Статья не найдена'
-            
         elif self.item_type == 'catalog':
             return 'Каталог товаров'
-            
+
         else:
             return self.menu_item.title if self.menu_item else 'Без названия'
 
@@ -179,64 +228,49 @@ class MenuItemExtended(BaseModel):
         return '#'
 
     @staticmethod
-    def get_catalog_items(parent_id=None, max_depth=3, current_depth=0):
+    def get_catalog_items(parent_id=None, max_depth=3, current_depth=0, categories=None):
         """Генерирует структуру каталога категорий для автоменю.
         Поддерживает корневые категории с parent_id IS NULL или = 0.
+        Дерево собирается в памяти из categories (по умолчанию — мемоизированный get_catalog_categories).
         """
-        from ..category import Category
-        from sqlalchemy import or_
+        from ..category import assemble_category_tree, get_catalog_categories
 
         if current_depth >= max_depth:
             return []
+        if categories is None:
+            categories = get_catalog_categories()
 
-        # Корневой уровень: допускаем parent_id IS NULL или = 0
-        if parent_id is None:
-            categories = (
-                Category.query
-                .filter(or_(Category.parent_id.is_(None), Category.parent_id == 0))
-                .order_by(Category.sort_order, Category.name)
-                .all()
-            )
-        else:
-            categories = (
-                Category.query
-                .filter(Category.parent_id == parent_id)
-                .order_by(Category.sort_order, Category.name)
-                .all()
-            )
-        
-        catalog_items = []
-        for category in categories:
-            item_data = {
+        return assemble_category_tree(
+            categories,
+            lambda category, children: {
                 'id': category.id,
                 'title': category.name,
                 'url': f'/category/{category.slug}',
                 'slug': category.slug,
                 'description': category.description,
                 'image_id': category.image_id,
-                'children': MenuItemExtended.get_catalog_items(
-                    parent_id=category.id,
-                    max_depth=max_depth,
-                    current_depth=current_depth + 1,
-                )
-            }
-            catalog_items.append(item_data)
-            
-        return catalog_items
+                'children': children,
+            },
+            parent_id=parent_id,
+            max_depth=max_depth - current_depth
+        )
 
     def build_menu_structure(self):
         """Строит полную структуру меню для данного экземпляра"""
+        from ..menu import MenuItem
+
         menu_items = MenuItemExtended.query.filter_by(
             menu_instance_id=self.menu_instance_id
         ).join(MenuItem).order_by(MenuItem.position, MenuItemExtended.sort_order).all()
+        targets = MenuItemExtended.load_targets(menu_items)
 
         menu_structure = []
         
         for extended_item in menu_items:
             item_data = {
                 'id': extended_item.id,
-                'title': extended_item.get_target_title(),
-                'url': extended_item.get_dynamic_url(),
+                'title': extended_item.get_target_title(targets),
+                'url': extended_item.get_dynamic_url(targets),
                 'type': extended_item.item_type,
                 'icon_id': extended_item.icon_id,
                 'video_id': extended_item.video_id,
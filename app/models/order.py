@@ -1,4 +1,5 @@
 # order.py
+import json
 from datetime import datetime
 from ..extensions import db
 from .base import BaseModel
@@ -52,6 +53,24 @@ class OrderItem(BaseModel):
 
     product = db.relationship('Product')
 
+    @classmethod
+    def insert_lines(cls, order_id, lines):
+        """
+        Позиции заказа из строк снимка корзины (PricedCartLine) одним INSERT (executemany):
+        цена и вариация берутся из снимка, повторно ничего не запрашивается.
+        """
+        rows = [{
+            'order_id': order_id,
+            'product_id': line.product.id,
+            'quantity': line.quantity,
+            'price': line.price,
+            'variation_id': line.variation_id,
+            'selected_options': json.dumps(line.selected_options) if line.selected_options else None,
+        } for line in lines]
+        if rows:
+            db.session.execute(cls.__table__.insert(), rows)
+        return len(rows)
+
 
 class OrderComment(BaseModel):
     __tablename__ = 'order_comments'
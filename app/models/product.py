@@ -1,8 +1,12 @@
+import base64
+import json
 import os
+from decimal import Decimal, InvalidOperation
 
+from sqlalchemy import and_, literal, or_, select, union_all
 from sqlalchemy.dialects.mysql import JSON
 
-from .category import getSybCategoryByID
+from .category import get_category_subtree_ids
 from ..extensions import db
 from .base import BaseModel
 from datetime import datetime
@@ -26,6 +30,7 @@ class Product(BaseModel):
     description = db.Column(db.Text, nullable=True)
     price = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     stock = db.Column(db.Integer, nullable=False, default=0)
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # удержано StockReservation
     bonus_points = db.Column(db.Integer, nullable=False, default=0)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
     main_image_id = db.Column(db.Integer, db.ForeignKey('images.id'), nullable=True)
@@ -47,6 +52,10 @@ class Product(BaseModel):
     __table_args__ = (
         db.Index('idx_product_name', 'name'),
         db.Index('idx_product_slug', 'slug'),
+        # Keyset-пагинация листингов категорий по режимам сортировки
+        db.Index('idx_product_category_sort', 'category_id', 'sort_order', 'id'),
+        db.Index('idx_product_category_price', 'category_id', 'price', 'id'),
+        db.Index('idx_product_category_created', 'category_id', 'created_at', 'id'),
     )
 
     def total_stock(self):
@@ -130,11 +139,7 @@ class Product(BaseModel):
         # Присваиваем в slug результат
         self.slug = unique_slug
 def get_all_subcategory_ids(category_id):
-    ids = [category_id]
-    subcategories = getSybCategoryByID(category_id)
-    for subcat in subcategories:
-        ids.extend(get_all_subcategory_ids(subcat.id))
-    return ids
+    return get_category_subtree_ids(category_id)
 
 def getProductsByCategoryID(category_id):
     category_ids = get_all_subcategory_ids(category_id)
@@ -147,6 +152,134 @@ def getProductBySlug(product_slug):
     return product
 
 
+# Режимы сортировки листингов: ключ -> (колонка, по убыванию). Второй ключ всегда Product.id в том же направлении
+PRODUCT_SORTS = {
+    'popular': (Product.sort_order, False),
+    'new': (Product.created_at, True),
+    'price_asc': (Product.price, False),
+    'price_desc': (Product.price, True),
+}
+
+
+def _cursor_value(sort, value):
+    if value is None:
+        return None
+    if sort == 'new':
+        return value.isoformat()
+    if sort in ('price_asc', 'price_desc'):
+        return str(value)
+    return value
+
+
+def encode_product_cursor(product, sort):
+    """Курсор «после этого товара» для keyset-пагинации: base64(JSON [sort, значение, id])."""
+    column, _ = PRODUCT_SORTS[sort]
+    payload = [sort, _cursor_value(sort, getattr(product, column.key)), product.id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_product_cursor(cursor, sort):
+    """(значение, id) из курсора или None, если курсор пустой, битый или от другой сортировки."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, last_id = json.loads(raw)
+        if cursor_sort != sort:
+            return None
+        if value is not None:
+            if sort == 'new':
+                value = datetime.fromisoformat(value)
+            elif sort in ('price_asc', 'price_desc'):
+                value = Decimal(value)
+        return value, int(last_id)
+    except (ValueError, TypeError, InvalidOperation):
+        return None
+
+
+def paginate_products(query, sort='popular', cursor=None, limit=24):
+    """
+    Keyset-пагинация запроса товаров по (sort_order, id), (price, id) или (created_at, id).
+    Возвращает (products, next_cursor); next_cursor = None на последней странице.
+    NULL в колонке сортировки идут первыми при возрастании и последними при убывании (как в MySQL).
+    """
+    if sort not in PRODUCT_SORTS:
+        sort = 'popular'
+    column, descending = PRODUCT_SORTS[sort]
+
+    position = decode_product_cursor(cursor, sort)
+    if position:
+        value, last_id = position
+        if descending:
+            if value is None:
+                query = query.filter(column.is_(None), Product.id < last_id)
+            else:
+                query = query.filter(or_(column < value, and_(column == value, Product.id < last_id), column.is_(None)))
+        else:
+            if value is None:
+                query = query.filter(or_(column.isnot(None), and_(column.is_(None), Product.id > last_id)))
+            else:
+                query = query.filter(or_(column > value, and_(column == value, Product.id > last_id)))
+
+    if descending:
+        query = query.order_by(column.desc(), Product.id.desc())
+    else:
+        query = query.order_by(column.asc(), Product.id.asc())
+
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница, без COUNT
+    products = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_product_cursor(products[-1], sort)
+    return products, next_cursor
+
+
+def get_product_images_data(product_ids):
+    """
+    Галерея для списка товаров одним запросом.
+    Возвращает {product_id: [Image, ...]}: сначала главное изображение (order = -1),
+    затем дополнительные из product_images по возрастанию order, без дубля главного.
+    """
+    from .image import Image
+
+    product_ids = list(dict.fromkeys(pid for pid in product_ids if pid))
+    product_images_data = {pid: [] for pid in product_ids}
+    if not product_ids:
+        return product_images_data
+
+    main_images = select(
+        Product.id.label('product_id'),
+        Product.main_image_id.label('image_id'),
+        literal(-1).label('order'),
+        literal(1).label('is_main')
+    ).where(Product.id.in_(product_ids), Product.main_image_id.isnot(None))
+    additional_images = select(
+        product_images.c.product_id.label('product_id'),
+        product_images.c.image_id.label('image_id'),
+        product_images.c.order.label('order'),
+        literal(0).label('is_main')
+    ).where(product_images.c.product_id.in_(product_ids))
+    gallery = union_all(main_images, additional_images).subquery()
+
+    rows = db.session.query(Image, gallery.c.product_id, gallery.c.order, gallery.c.is_main) \
+        .join(gallery, Image.id == gallery.c.image_id) \
+        .all()
+
+    # Сортируем в Python: NULL в order у старых записей не должен обгонять главное изображение
+    rows.sort(key=lambda r: (r[1], -r[3], r[2] is None, r[2] or 0))
+    main_image_ids = {}
+    for img, product_id, order, is_main in rows:
+        if is_main:
+            main_image_ids[product_id] = img.id
+        elif img.id == main_image_ids.get(product_id):
+            continue
+        img.order = order  # Добавляем order как динамический атрибут
+        product_images_data[product_id].append(img)
+
+    return product_images_data
+
+
 # Модель для связанных товаров
 class RelatedProduct(BaseModel):
     __tablename__ = 'related_products'
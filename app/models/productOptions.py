@@ -1,3 +1,6 @@
+import threading
+import time
+
 from ..extensions import db
 from datetime import datetime
 from .base import BaseModel
@@ -25,6 +28,15 @@ product_option_value_association = db.Table(
 )
 
 
+# --------------------------------
+#  Индекс вариаций (кэш процесса)
+# --------------------------------
+# TTL (Config.VARIATION_INDEX_TTL) ограничивает устаревание в других воркерах; в текущем процессе индекс
+# сбрасывается сразу при сохранении товара. Оформление заказа читает вариации из БД (fresh=True)
+_variation_index_cache = {}  # product_id -> (expires_at, {(product_id, frozenset(value_ids)): {...}})
+_variation_index_lock = threading.Lock()
+
+
 class ProductOption(BaseModel):
     __tablename__ = 'product_options'
     id = db.Column(db.Integer, primary_key=True)
@@ -44,49 +56,66 @@ class ProductOption(BaseModel):
 
     @classmethod
     def get_options_by_product_id(cls, product_id):
-        # Получаем все значения опций, связанные с данным продуктом
-        option_values = db.session.query(ProductOptionValue).join(
-            product_option_value_association,
-            (product_option_value_association.c.option_value_id == ProductOptionValue.id)
-        ).filter(
-            product_option_value_association.c.product_id == product_id
-        ).all()
-        # Создаем словарь для хранения опций и их значений
-        options_dict = {}
-
-        for value in option_values:
-            option_id = value.option.id
-            option_name = value.option.name
-            optin_type = value.option.display_type
-            has_individual_photos = value.option.has_individual_photos
-            if option_id not in options_dict:
-                options_dict[option_id] = {
-                    'id': option_id,
-                    'name': option_name,
-                    'display_type': optin_type,
-                    'has_individual_photos': has_individual_photos,
+        if not product_id:
+            return []
+        return cls.get_options_by_product_ids([product_id]).get(product_id, [])
+
+    @classmethod
+    def get_options_by_product_ids(cls, product_ids):
+        """
+        Опции сразу для набора товаров: {product_id: [опции...]} в формате get_options_by_product_id.
+        Фиксированное число запросов независимо от количества товаров и значений:
+        значения с опциями (joinedload) + фотографии значений с изображениями (selectinload).
+        """
+        product_ids = list(dict.fromkeys(pid for pid in product_ids if pid))
+        options_by_product = {pid: [] for pid in product_ids}
+        if not product_ids:
+            return options_by_product
+
+        rows = db.session.query(product_option_value_association.c.product_id, ProductOptionValue) \
+            .select_from(product_option_value_association) \
+            .join(ProductOptionValue, product_option_value_association.c.option_value_id == ProductOptionValue.id) \
+            .options(
+                db.joinedload(ProductOptionValue.option),
+                db.selectinload(ProductOptionValue.images).joinedload(ProductOptionValueImage.image)
+            ) \
+            .filter(product_option_value_association.c.product_id.in_(product_ids)) \
+            .order_by(product_option_value_association.c.product_id, product_option_value_association.c.option_value_id) \
+            .all()
+
+        # Фотографии значения не зависят от товара — собираем один раз на значение
+        photos_by_value = {}
+        options_dicts = {pid: {} for pid in product_ids}
+        for product_id, value in rows:
+            option = value.option
+            options_dict = options_dicts[product_id]
+            if option.id not in options_dict:
+                options_dict[option.id] = {
+                    'id': option.id,
+                    'name': option.name,
+                    'display_type': option.display_type,
+                    'has_individual_photos': option.has_individual_photos,
                     'values': []
                 }
-            # Загружаем фотографии для этого значения опции
-            photos = []
-            if value.images:
-                for img_rel in value.images:
-                    if img_rel.image:
-                        photos.append({
-                            'id': img_rel.image.id,
-                            'path': img_rel.image.filename,  # Используем filename вместо path
-                            'order': img_rel.order,
-                            'is_main': img_rel.is_main
-                        })
-            
-            options_dict[option_id]['values'].append({
+            if value.id not in photos_by_value:
+                photos_by_value[value.id] = [
+                    {
+                        'id': img_rel.image.id,
+                        'path': img_rel.image.filename,  # Используем filename вместо path
+                        'order': img_rel.order,
+                        'is_main': img_rel.is_main
+                    }
+                    for img_rel in value.images if img_rel.image
+                ]
+            options_dict[option.id]['values'].append({
                 'id': value.id,
                 'value': value.value,
-                'photos': photos
+                'photos': photos_by_value[value.id]
             })
 
-        # Возвращаем список словарей с id, name и values опций
-        return list(options_dict.values())
+        for product_id, options_dict in options_dicts.items():
+            options_by_product[product_id] = list(options_dict.values())
+        return options_by_product
 
 
 class ProductOptionValue(BaseModel):
@@ -149,6 +178,7 @@ class ProductVariation(BaseModel):
     # Цена и остаток конкретно для этой вариации
     price = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     stock = db.Column(db.Integer, nullable=True, default=0)
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # удержано StockReservation
     # SEO-поля
     slug = db.Column(db.String(255), nullable=True, unique=True, index=True)
     seo_title = db.Column(db.String(255), nullable=True)
@@ -167,7 +197,13 @@ class ProductVariation(BaseModel):
 
     @classmethod
     def get_variations_by_product_id(cls, product_id):
-        variations = db.session.query(cls).filter(cls.product_id == product_id).all()
+        # Значения с опциями — одним selectin-запросом, изображение — в основном: число запросов не зависит от вариаций
+        variations = db.session.query(cls).options(
+            db.selectinload(cls.option_values)
+            .joinedload(ProductVariationOptionValue.option_value)
+            .joinedload(ProductOptionValue.option),
+            db.joinedload(cls.variation_image)
+        ).filter(cls.product_id == product_id).order_by(cls.id).all()
         variations_dict = {}
 
         for variation in variations:
@@ -221,6 +257,94 @@ class ProductVariation(BaseModel):
 
         return variations_dict
 
+    @staticmethod
+    def normalize_option_value_ids(selected_options):
+        """frozenset ID значений опций из selected_options корзины ({option_id: value_id}); ключи/значения могут быть строками."""
+        values = selected_options.values() if isinstance(selected_options, dict) else (selected_options or [])
+        value_ids = set()
+        for value in values:
+            try:
+                value_ids.add(int(value))
+            except (ValueError, TypeError):
+                continue
+        return frozenset(value_ids)
+
+    @classmethod
+    def get_variation_index(cls, product_ids, fresh=False):
+        """
+        Компактный индекс вариаций для корзины и оформления заказа:
+          {(product_id, frozenset(option_value_ids)): {'id': ..., 'price': Decimal, 'stock': int}}
+        В отличие от get_variations_by_product_id не строит HTML и данные изображений.
+        Недостающие в кэше товары догружаются одним запросом; fresh=True — все товары из БД, минуя кэш
+        (цена и вариация строк заказа не должны зависеть от устаревшего индекса другого воркера).
+        """
+        from flask import current_app
+
+        product_ids = list(dict.fromkeys(pid for pid in product_ids if pid))
+        now = time.monotonic()
+        index = {}
+        missing = product_ids if fresh else []
+        with _variation_index_lock:
+            for product_id in ([] if fresh else product_ids):
+                cached = _variation_index_cache.get(product_id)
+                if cached and cached[0] > now:
+                    index.update(cached[1])
+                else:
+                    missing.append(product_id)
+        if not missing:
+            return index
+
+        rows = db.session.query(
+            cls.id, cls.product_id, cls.price, cls.stock, ProductVariationOptionValue.option_value_id
+        ).outerjoin(
+            ProductVariationOptionValue, ProductVariationOptionValue.variation_id == cls.id
+        ).filter(cls.product_id.in_(missing)).order_by(cls.product_id, cls.id).all()
+
+        variations = {}
+        for variation_id, product_id, price, stock, option_value_id in rows:
+            variation = variations.setdefault(variation_id, {
+                'product_id': product_id,
+                'id': variation_id,
+                'price': price,
+                'stock': stock or 0,
+                'option_value_ids': set()
+            })
+            if option_value_id is not None:
+                variation['option_value_ids'].add(option_value_id)
+
+        loaded = {product_id: {} for product_id in missing}
+        for variation in variations.values():
+            key = (variation['product_id'], frozenset(variation['option_value_ids']))
+            # При одинаковых наборах значений побеждает первая вариация — как при переборе get_variations_by_product_id
+            loaded[variation['product_id']].setdefault(key, {
+                'id': variation['id'],
+                'price': variation['price'],
+                'stock': variation['stock']
+            })
+
+        expires_at = now + current_app.config.get('VARIATION_INDEX_TTL', 60)
+        with _variation_index_lock:
+            for product_id, entries in loaded.items():
+                _variation_index_cache[product_id] = (expires_at, entries)
+                index.update(entries)
+        return index
+
+    @classmethod
+    def find_in_index(cls, index, product_id, selected_options):
+        """Запись индекса для выбранных опций или None."""
+        if not selected_options:
+            return None
+        return index.get((product_id, cls.normalize_option_value_ids(selected_options)))
+
+    @staticmethod
+    def invalidate_variation_index(product_id=None):
+        """Сбрасывает индекс вариаций товара (или весь индекс, если product_id не указан)."""
+        with _variation_index_lock:
+            if product_id is None:
+                _variation_index_cache.clear()
+            else:
+                _variation_index_cache.pop(product_id, None)
+
     # Пример метода для автогенерации slug
     def generate_slug(self):
         if not self.slug:
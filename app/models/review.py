@@ -1,4 +1,9 @@
+import base64
+import json
 from datetime import datetime
+
+from sqlalchemy import and_, bindparam, or_, select
+
 from ..extensions import db
 from .base import BaseModel
 
@@ -20,6 +25,224 @@ class Review(BaseModel):
     likes = db.Column(db.Integer, default=0, nullable=False)
     dislikes = db.Column(db.Integer, default=0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ключ кэша карточки отзыва
     approved = db.Column(db.Boolean, default=False)
 
     product = db.relationship('Product', backref='reviews')
+
+    __table_args__ = (
+        # Лента одобренных отзывов товара: фильтр + keyset-порядок (created_at, id) по одному индексу
+        db.Index('idx_review_product_approved_created', 'product_id', 'approved', 'created_at', 'id'),
+    )
+
+    def stats_contribution(self):
+        """
+        Вклад отзыва в ProductReviewStats: (product_id, rating, рекомендует) для одобренного, иначе None.
+        Рекомендующим считается recommend = True, а при незаданном recommend — оценка от 4.
+        """
+        if not self.approved or not self.product_id:
+            return None
+        rating = int(self.rating or 0)
+        return self.product_id, rating, bool(self.recommend is True or (self.recommend is None and rating >= 4))
+
+    @staticmethod
+    def apply_vote_deltas(deltas, connection=None):
+        """
+        Атомарно прибавляет голоса: deltas = {review_id: (likes, dislikes)}.
+        Одно UPDATE likes = likes + n (executemany) вместо чтения-изменения-записи в Python;
+        строки обновляются по возрастанию id, чтобы пакеты из разных процессов не взаимоблокировались.
+        """
+        rows = [
+            {'b_id': review_id, 'b_likes': likes, 'b_dislikes': dislikes}
+            for review_id, (likes, dislikes) in sorted(deltas.items())
+            if likes or dislikes
+        ]
+        if not rows:
+            return
+        table = Review.__table__
+        stmt = table.update().where(table.c.id == bindparam('b_id')).values(
+            likes=table.c.likes + bindparam('b_likes'),
+            dislikes=table.c.dislikes + bindparam('b_dislikes'),
+        )
+        (connection or db.session).execute(stmt, rows)
+
+    @staticmethod
+    def vote_counts(review_id):
+        """(likes, dislikes) из БД — свежие значения после атомарного UPDATE."""
+        row = db.session.execute(
+            select(Review.likes, Review.dislikes).where(Review.id == review_id)
+        ).first()
+        return (row.likes or 0, row.dislikes or 0) if row else (0, 0)
+
+    @staticmethod
+    def approved_stats(product_id):
+        """
+        Статистика одобренных отзывов товара из ProductReviewStats (одна строка):
+        {'total', 'avg', 'counts': {1..5: n}, 'recommend_percent'}.
+        """
+        return ProductReviewStats.get_many([product_id])[product_id]
+
+
+class ProductReviewStats(db.Model):
+    """
+    Денормализованная статистика одобренных отзывов товара: количество, сумма оценок, гистограмма 1..5
+    и число рекомендующих. Обновляется приращениями в той же транзакции, что и отзыв
+    (ProductReviewStats.apply_review_change), пересобирается командой flask rebuild-review-stats.
+    """
+    __tablename__ = 'product_review_stats'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_1 = db.Column(db.Integer, nullable=False, default=0)
+    rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_5 = db.Column(db.Integer, nullable=False, default=0)
+    recommend_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        total = self.review_count or 0
+        return {
+            'total': total,
+            'avg': round(self.rating_sum / total, 1) if total else 0,
+            'counts': {i: getattr(self, f'rating_{i}') or 0 for i in range(1, 6)},
+            'recommend_percent': int(round(100 * self.recommend_count / total)) if total else 0,
+        }
+
+    @staticmethod
+    def empty():
+        return {'total': 0, 'avg': 0, 'counts': {i: 0 for i in range(1, 6)}, 'recommend_percent': 0}
+
+    @staticmethod
+    def get_many(product_ids):
+        """{product_id: статистика} одним запросом — для страницы товара и карточек листингов."""
+        product_ids = [pid for pid in dict.fromkeys(product_ids) if pid]
+        stats = {pid: ProductReviewStats.empty() for pid in product_ids}
+        if product_ids:
+            for row in ProductReviewStats.query.filter(ProductReviewStats.product_id.in_(product_ids)).all():
+                stats[row.product_id] = row.to_dict()
+        return stats
+
+    @staticmethod
+    def apply_review_change(before, after):
+        """
+        Переносит изменение отзыва в статистику: before/after — Review.stats_contribution() до и после.
+        Атомарный UPDATE с приращениями; если строки товара ещё нет — она пересчитывается по отзывам.
+        Вызывать до commit, в транзакции изменения отзыва.
+        """
+        if before == after:
+            return
+        deltas = {}
+        for contribution, sign in ((before, -1), (after, 1)):
+            if contribution is None:
+                continue
+            product_id, rating, recommends = contribution
+            delta = deltas.setdefault(product_id, {'review_count': 0, 'rating_sum': 0, 'recommend_count': 0})
+            delta['review_count'] += sign
+            delta['rating_sum'] += sign * rating
+            delta['recommend_count'] += sign * int(recommends)
+            if 1 <= rating <= 5:
+                delta[f'rating_{rating}'] = delta.get(f'rating_{rating}', 0) + sign
+
+        table = ProductReviewStats.__table__
+        for product_id, delta in deltas.items():
+            result = db.session.execute(
+                table.update()
+                .where(table.c.product_id == product_id)
+                .values({**{column: table.c[column] + value for column, value in delta.items()},
+                         'updated_at': datetime.utcnow()})
+            )
+            if result.rowcount == 0:
+                db.session.flush()
+                ProductReviewStats.rebuild(product_id)
+
+    @staticmethod
+    def rebuild(product_id=None):
+        """
+        Пересчитывает статистику по одобренным отзывам: одного товара или всех (product_id=None).
+        Возвращает число записанных строк. Фиксирует вызывающий.
+        """
+        recommends = db.or_(Review.recommend.is_(True), db.and_(Review.recommend.is_(None), Review.rating >= 4))
+        columns = [
+            Review.product_id,
+            db.func.count(Review.id),
+            db.func.coalesce(db.func.sum(Review.rating), 0),
+            *[db.func.sum(db.case((Review.rating == i, 1), else_=0)) for i in range(1, 6)],
+            db.func.sum(db.case((recommends, 1), else_=0)),
+        ]
+        query = db.session.query(*columns).filter(Review.approved.is_(True)).group_by(Review.product_id)
+        delete = ProductReviewStats.query
+        if product_id is not None:
+            query = query.filter(Review.product_id == product_id)
+            delete = delete.filter(ProductReviewStats.product_id == product_id)
+
+        rows = query.all()
+        delete.delete(synchronize_session=False)
+        now = datetime.utcnow()
+        values = [
+            {
+                'product_id': row[0],
+                'review_count': row[1],
+                'rating_sum': int(row[2] or 0),
+                **{f'rating_{i}': int(row[2 + i] or 0) for i in range(1, 6)},
+                'recommend_count': int(row[8] or 0),
+                'updated_at': now,
+            }
+            for row in rows
+        ]
+        if product_id is not None and not values:
+            # Строка с нулями: дальнейшие изменения пойдут приращениями
+            values = [{'product_id': product_id, 'updated_at': now}]
+        if values:
+            db.session.execute(ProductReviewStats.__table__.insert(), values)
+        return len(values)
+
+
+def encode_review_cursor(review):
+    """Курсор «после этого отзыва» для ленты отзывов: base64(JSON [created_at, id])."""
+    payload = [review.created_at.isoformat() if review.created_at else None, review.id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_review_cursor(cursor):
+    """(created_at, id) из курсора или None, если курсор пустой или битый."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, last_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at is not None else None), int(last_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def paginate_approved_reviews(product_id, cursor=None, limit=2):
+    """
+    Keyset-пагинация одобренных отзывов товара по (created_at, id), новые сверху.
+    Возвращает (reviews, next_cursor); next_cursor = None на последней странице.
+    Отзывы, добавленные во время прокрутки, не сдвигают следующие порции (нет дублей, как при offset).
+    """
+    query = Review.query.options(db.joinedload(Review.customer)) \
+        .filter(Review.product_id == product_id, Review.approved.is_(True))
+
+    position = decode_review_cursor(cursor)
+    if position:
+        created_at, last_id = position
+        if created_at is None:
+            query = query.filter(Review.created_at.is_(None), Review.id < last_id)
+        else:
+            query = query.filter(or_(
+                Review.created_at < created_at,
+                and_(Review.created_at == created_at, Review.id < last_id),
+                Review.created_at.is_(None),
+            ))
+
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая порция, без COUNT
+    reviews = query.order_by(Review.created_at.desc(), Review.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        next_cursor = encode_review_cursor(reviews[-1])
+    return reviews, next_cursor
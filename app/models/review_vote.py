@@ -1,4 +1,7 @@
 from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
 from ..extensions import db
 
 
@@ -14,4 +17,24 @@ class ReviewVote(db.Model):
         db.UniqueConstraint('review_id', 'voter_key', name='uq_review_votes_review_voter'),
     )
 
+    @staticmethod
+    def record(review_id, voter_key):
+        """
+        Insert-or-ignore голоса в текущей транзакции: True — голос записан, False — этот voter_key уже голосовал.
+        Дедупликация держится на уникальном ключе (review_id, voter_key), без предварительного SELECT.
+        """
+        table = ReviewVote.__table__
+        values = {'review_id': review_id, 'voter_key': voter_key, 'created_at': datetime.utcnow()}
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('mysql', 'sqlite'):
+            stmt = table.insert().values(**values) \
+                .prefix_with('IGNORE', dialect='mysql') \
+                .prefix_with('OR IGNORE', dialect='sqlite')
+            return db.session.execute(stmt).rowcount > 0
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(**values))
+            return True
+        except IntegrityError:
+            return False
 
@@ -0,0 +1,18 @@
+from ..extensions import db
+
+
+class ProductSearchTerm(db.Model):
+    """
+    Инвертированный индекс поиска: нормализованный термин -> товар с весом лучшего поля,
+    в котором термин встретился (название, артикул, категория, атрибуты, описание).
+    Заполняется app/search.py: index_products / remove_products_from_index.
+    """
+    __tablename__ = 'product_search_terms'
+
+    term = db.Column(db.String(64), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    weight = db.Column(db.Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        db.Index('idx_search_term_product', 'product_id'),
+    )
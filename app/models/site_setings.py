@@ -1,6 +1,7 @@
 from datetime import datetime
 from ..extensions import db
 from .base import BaseModel
+from ..query_counter import not_budgeted
 
 class SocialLink(BaseModel):
     __tablename__ = 'social_links'
@@ -47,5 +48,45 @@ class SiteSettings(BaseModel):
         return f"<SiteSettings {self.title}>"
 
 def getSiteSettings():
+    """
+    Настройки сайта для витрины — снимок в виде dict из кэша обвязки (шаблоны обращаются к ним так же:
+    site_settings.logo.filename). Для редактирования используйте SiteSettings.query.
+    """
+    from ..cache import chrome_cache, CHROME_SITE_SETTINGS
+    return chrome_cache.get_or_set(CHROME_SITE_SETTINGS, _load_site_settings_snapshot)
+
+
+def _image_snapshot(image):
+    if not image:
+        return None
+    return {'id': image.id, 'filename': image.filename}
+
+
+@not_budgeted()
+def _load_site_settings_snapshot():
     settings = db.session.query(SiteSettings).first()
-    return settings
+    if not settings:
+        return None
+    return {
+        'id': settings.id,
+        'title': settings.title,
+        'logo_id': settings.logo_id,
+        'logo': _image_snapshot(settings.logo),
+        'address': settings.address,
+        'email': settings.email,
+        'phone': settings.phone,
+        'owner': settings.owner,
+        'working_hours': settings.working_hours,
+        'map_locations': settings.map_locations,
+        'social_links': [
+            {
+                'platform': link.platform,
+                'url': link.url,
+                'icon_id': link.icon_id,
+                'icon': _image_snapshot(link.icon)
+            }
+            for link in settings.social_links
+        ],
+        'additional_info': settings.additional_info,
+        'home_page_id': settings.home_page_id,
+    }
@@ -0,0 +1,31 @@
+from datetime import datetime
+from ..extensions import db
+from .base import BaseModel
+
+
+class StockReservation(BaseModel):
+    """
+    Удержание остатка под строку корзины на время оформления заказа.
+    Количество учитывается в reserved товара (variation_id пустой) или вариации; строка живёт до expires_at,
+    при создании заказа превращается в списание stock, просроченные освобождает flask release-expired-reservations.
+    """
+    __tablename__ = 'stock_reservations'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    variation_id = db.Column(db.Integer, db.ForeignKey('product_variations.id', ondelete='CASCADE'), nullable=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id', ondelete='CASCADE'), nullable=True)
+    session_id = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_stock_reservation_customer', 'customer_id'),
+        db.Index('idx_stock_reservation_session', 'session_id'),
+        db.Index('idx_stock_reservation_expires', 'expires_at'),
+    )
+
+    @property
+    def target(self):
+        """('variation', id) или ('product', id) — чей остаток удерживается."""
+        return ('variation', self.variation_id) if self.variation_id else ('product', self.product_id)
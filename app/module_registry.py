@@ -0,0 +1,113 @@
+"""
+@file: app/module_registry.py
+@description: Декларативный реестр модулей страницы: Module.name -> фронтовый и админский классы.
+              Классы импортируются лениво при первом обращении и кэшируются; preload() — для воркеров после fork
+@dependencies: importlib, logging, threading, time
+@created: 2026-10-18
+"""
+
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Манифест модулей: имя в Module.name -> пути "пакет.модуль:Класс" фронтового (get_instance_data)
+# и админского (save_instance / load_instance_data / del_instance) обработчиков.
+# Новый модуль подключается строкой здесь или через register_module().
+MODULE_MANIFEST = {
+    'SliderModule': {
+        'front': 'app.views.modules.slider:SliderModule',
+        'admin': 'app.admin.modules.slider:SliderModule',
+    },
+    'BannerModule': {
+        'front': 'app.views.modules.banner:BannerModule',
+        'admin': 'app.admin.modules.banner:BannerModule',
+    },
+    'MenuModule': {
+        'front': 'app.views.modules.menu:MenuModule',
+        'admin': 'app.admin.modules.menu:MenuModule',
+    },
+    'TabsModule': {
+        'front': 'app.views.modules.product_tab:TabsModule',
+        'admin': 'app.admin.modules.product_tab:TabsModule',
+    },
+    'GalleryModule': {
+        'front': None,
+        'admin': 'app.admin.modules.gallery:GalleryModule',
+    },
+}
+
+FRONT = 'front'
+ADMIN = 'admin'
+
+
+class ModuleRegistry:
+    """
+    Разрешает Module.name в класс обработчика по манифесту.
+    Импорт — только при первом обращении к модулю; результат (в том числе отсутствие класса) кэшируется.
+    load_times хранит время импорта каждого класса — видно, сколько стоит холодный старт.
+    """
+
+    def __init__(self, manifest):
+        self._manifest = {name: dict(entry) for name, entry in manifest.items()}
+        self._classes = {}  # (name, kind) -> class | None
+        self._lock = threading.Lock()
+        self.load_times = {}  # (name, kind) -> секунды
+
+    def register_module(self, name, front=None, admin=None):
+        with self._lock:
+            self._manifest[name] = {FRONT: front, ADMIN: admin}
+            self._classes.pop((name, FRONT), None)
+            self._classes.pop((name, ADMIN), None)
+
+    def names(self):
+        return list(self._manifest)
+
+    def _resolve(self, name, kind):
+        key = (name, kind)
+        if key in self._classes:
+            return self._classes[key]
+        with self._lock:
+            if key in self._classes:
+                return self._classes[key]
+            target = (self._manifest.get(name) or {}).get(kind)
+            handler_class = None
+            if target:
+                module_path, _, class_name = target.partition(':')
+                started = time.perf_counter()
+                try:
+                    handler_class = getattr(importlib.import_module(module_path), class_name)
+                except (ImportError, AttributeError) as e:
+                    # Битая запись манифеста не должна ронять страницу — модуль просто не выводится
+                    logger.error(f"Модуль {name} ({kind}): не удалось загрузить {target}: {e}")
+                self.load_times[key] = time.perf_counter() - started
+            self._classes[key] = handler_class
+            return handler_class
+
+    def get_front(self, name):
+        """Фронтовый класс модуля (с get_instance_data) или None."""
+        return self._resolve(name, FRONT)
+
+    def get_admin(self, name):
+        """Админский класс модуля (с save_instance) или None."""
+        return self._resolve(name, ADMIN)
+
+    def preload(self, kinds=(FRONT, ADMIN)):
+        """
+        Импортирует все классы манифеста заранее и возвращает затраченное время, сек.
+        Вызывается в мастер-процессе (gunicorn --preload), чтобы воркеры после fork получили готовый реестр.
+        """
+        started = time.perf_counter()
+        for name in self.names():
+            for kind in kinds:
+                self._resolve(name, kind)
+        return time.perf_counter() - started
+
+
+module_registry = ModuleRegistry(MODULE_MANIFEST)
+
+
+def register_module(name, front=None, admin=None):
+    module_registry.register_module(name, front=front, admin=admin)
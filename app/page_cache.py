@@ -0,0 +1,349 @@
+"""
+@file: app/page_cache.py
+@description: Кэш целых страниц витрины (/, /category/<slug>, /product/<slug>) для анонимных GET-запросов
+              с инвалидацией по тегам (product:<id>, category:<id>, module:<id>, page:<id>, chrome)
+@dependencies: flask, flask_wtf.csrf, pickle; redis — только для бэкенда 'redis'
+@created: 2026-10-18
+"""
+
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, make_response, request, session
+from flask.globals import request_ctx
+from flask_login import current_user
+
+# Тег "обвязки" сайта (шапка, меню, подвал) — есть у каждой кэшированной страницы
+TAG_CHROME = 'chrome'
+# Страницы, зависящие от произвольных товаров каталога (вкладки "все товары" и т.п.)
+TAG_CATALOG = 'catalog'
+# Служебный тег: увеличивается при любом сбросе, чтобы не сохранить страницу, отрендеренную во время сброса
+_TAG_ANY = '*'
+
+# Подстановка вместо CSRF-токена в сохранённом HTML: токен привязан к сессии посетителя
+CSRF_PLACEHOLDER = '__PAGE_CACHE_CSRF_TOKEN__'
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def category_tag(category_id):
+    return f'category:{category_id}'
+
+
+def module_tag(module_instance_id):
+    return f'module:{module_instance_id}'
+
+
+def page_tag(page_id):
+    return f'page:{page_id}'
+
+
+# ----------------------------
+#  Бэкенды
+# ----------------------------
+class MemoryPageCacheBackend:
+    """LRU в памяти процесса. Сброс тегов действует только на текущий воркер."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return {tag: self._tags.get(tag, 0) for tag in tags}
+
+    def bump_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemPageCacheBackend:
+    """Файлы в каталоге, общем для всех воркеров одного сервера."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tags_directory = os.path.join(directory, 'tags')
+        os.makedirs(self.tags_directory, exist_ok=True)
+
+    @staticmethod
+    def _name(value):
+        return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+    def _write(self, path, data):
+        # Атомарная запись: читатели никогда не видят недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        path = os.path.join(self.directory, self._name(key))
+        try:
+            with open(path, 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        self._write(os.path.join(self.directory, self._name(key)), pickle.dumps((time.time() + ttl, value)))
+
+    def _read_tag(self, tag):
+        try:
+            with open(os.path.join(self.tags_directory, self._name(tag)), 'rb') as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def tag_versions(self, tags):
+        return {tag: self._read_tag(tag) for tag in tags}
+
+    def bump_tags(self, tags):
+        for tag in tags:
+            self._write(os.path.join(self.tags_directory, self._name(tag)), str(self._read_tag(tag) + 1).encode())
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class RedisPageCacheBackend:
+    """Redis (или совместимое хранилище) — общий кэш и версии тегов для всех серверов."""
+
+    def __init__(self, url, prefix='page_cache:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("Для PAGE_CACHE_BACKEND = 'redis' установите пакет redis") from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return pickle.loads(data) if data else None
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + key, int(ttl), pickle.dumps(value))
+
+    def tag_versions(self, tags):
+        tags = list(tags)
+        if not tags:
+            return {}
+        values = self.client.mget([self.prefix + 'tag:' + tag for tag in tags])
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    def bump_tags(self, tags):
+        pipe = self.client.pipeline()
+        for tag in tags:
+            pipe.incr(self.prefix + 'tag:' + tag)
+        pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def create_page_cache_backend(config):
+    backend = config.get('PAGE_CACHE_BACKEND', 'memory')
+    if backend == 'filesystem':
+        return FileSystemPageCacheBackend(config['PAGE_CACHE_DIR'])
+    if backend == 'redis':
+        return RedisPageCacheBackend(config['PAGE_CACHE_REDIS_URL'])
+    return MemoryPageCacheBackend(config.get('PAGE_CACHE_MAX_ENTRIES', 1000))
+
+
+# ----------------------------
+#  Кэш страниц
+# ----------------------------
+class PageCache:
+    """
+    Запись хранит HTML, статус, тип содержимого и версии тегов на момент рендеринга.
+    Сброс тега лишь увеличивает его версию — запись с устаревшей версией любого своего тега считается промахом,
+    поэтому бэкенду не нужно хранить обратный индекс тег -> ключи.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.enabled = False
+        self.ttl = 300
+        self.vary_cookies = ()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', False)
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        self.vary_cookies = tuple(app.config.get('PAGE_CACHE_VARY_COOKIES') or ())
+        self.backend = create_page_cache_backend(app.config) if self.enabled else None
+        if isinstance(self.backend, MemoryPageCacheBackend):
+            app.logger.warning(
+                "PAGE_CACHE_BACKEND = 'memory': сброс тегов виден только воркеру, сохранившему изменения, "
+                "остальные воркеры отдают устаревшие страницы до истечения PAGE_CACHE_TTL. "
+                "При нескольких воркерах используйте 'filesystem' или 'redis'"
+            )
+
+    def request_is_cacheable(self):
+        if not self.enabled or request.method != 'GET':
+            return False
+        # Flash-сообщения выводятся в шапке: такую страницу нельзя ни отдать из кэша, ни сохранить
+        if session.get('_flashes'):
+            return False
+        # Авторизованный покупатель видит персональную шапку; админ на витрине считается анонимом
+        from .models.customer import Customer
+        return not (current_user.is_authenticated and isinstance(current_user, Customer))
+
+    def request_key(self):
+        parts = [request.url]
+        for cookie in self.vary_cookies:
+            parts.append(f'{cookie}={request.cookies.get(cookie, "")}')
+        return 'page:' + hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def lookup(self, key):
+        entry = self.backend.get(key)
+        if not entry:
+            return None
+        current = self.backend.tag_versions(entry['tags'])
+        if current != entry['tags']:
+            return None
+        return entry
+
+    def store(self, key, body, status, content_type, tags, started_version):
+        versions = self.backend.tag_versions(set(tags) | {_TAG_ANY})
+        if versions.pop(_TAG_ANY) != started_version:
+            # Во время рендеринга что-то сбросили — страница может содержать устаревшие данные
+            return
+        self.backend.set(key, {
+            'body': body,
+            'status': status,
+            'content_type': content_type,
+            'tags': versions,
+        }, self.ttl)
+
+    def purge(self, *tags):
+        if self.backend and tags:
+            self.backend.bump_tags(set(tags) | {_TAG_ANY})
+
+    def clear(self):
+        if self.backend:
+            self.backend.clear()
+
+
+page_cache = PageCache()
+
+
+def add_page_tags(*tags):
+    """Отмечает зависимость текущей кэшируемой страницы от тегов. Вне кэшируемого запроса ничего не делает."""
+    collected = g.get('page_cache_tags')
+    if collected is not None:
+        collected.update(tag for tag in tags if tag)
+
+
+def purge_page_tags(*tags):
+    """Сбрасывает закэшированные страницы, отмеченные любым из тегов."""
+    page_cache.purge(*tags)
+
+
+def product_purge_tags(product, previous_category_id=None):
+    """Теги, которые нужно сбросить при изменении товара: сам товар и листинги его категорий с предками."""
+    from .models.category import Category
+
+    tags = [product_tag(product.id), TAG_CATALOG]
+    for category_id in {product.category_id, previous_category_id} - {None}:
+        category = Category.query.get(category_id)
+        if category:
+            tags.extend(category_tag(cid) for cid in category.get_ancestor_ids() + [category.id])
+    return tags
+
+
+def cached_page(view):
+    """
+    Декоратор вью витрины: отдаёт анонимным посетителям сохранённый HTML.
+    CSRF-токен в сохранённой странице заменяется заглушкой и подставляется заново для каждого посетителя.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not page_cache.request_is_cacheable():
+            return view(*args, **kwargs)
+
+        key = page_cache.request_key()
+        try:
+            entry = page_cache.lookup(key)
+        except Exception as e:
+            current_app.logger.warning(f'Кэш страниц недоступен: {e}')
+            return view(*args, **kwargs)
+
+        if entry:
+            body = entry['body']
+            if CSRF_PLACEHOLDER in body:
+                from flask_wtf.csrf import generate_csrf
+                body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+            response = make_response(body, entry['status'])
+            response.content_type = entry['content_type']
+            response.headers['X-Page-Cache'] = 'HIT'
+            return response
+
+        started_version = page_cache.backend.tag_versions([_TAG_ANY])[_TAG_ANY]
+        g.page_cache_tags = {TAG_CHROME}
+        response = make_response(view(*args, **kwargs))
+        tags = g.pop('page_cache_tags', set())
+
+        # Сообщения, добавленные самим вью (показанные в шапке или ещё ждущие в сессии), — личные для посетителя
+        flashed = bool(session.get('_flashes') or getattr(request_ctx, 'flashes', None))
+        if (response.status_code == 200 and response.mimetype == 'text/html' and not response.direct_passthrough
+                and not flashed):
+            body = response.get_data(as_text=True)
+            token = g.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+            if token:
+                body = body.replace(token, CSRF_PLACEHOLDER)
+            try:
+                page_cache.store(key, body, response.status_code, response.content_type, tags, started_version)
+            except Exception as e:
+                current_app.logger.warning(f'Не удалось сохранить страницу в кэш: {e}')
+            response.headers['X-Page-Cache'] = 'MISS'
+        return response
+
+    return wrapper
@@ -0,0 +1,118 @@
+"""
+@file: app/query_counter.py
+@description: Счётчик SQL-запросов текущего HTTP-запроса и бюджет запросов для горячих страниц.
+              query_budget(n) проверяет, что блок уложился в n запросов: в строгом режиме (тесты) — исключение,
+              иначе — предупреждение в лог
+@dependencies: sqlalchemy.event, flask.g
+@created: 2026-10-18
+"""
+
+import contextlib
+import logging
+import threading
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_installed = False
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Блок выполнил больше SQL-запросов, чем разрешено бюджетом."""
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        # copy_current_request_context в потоке открывает свой контекст приложения со своим g:
+        # такие запросы считаются там и добавляются к запросу через merge_thread_queries
+        with _lock:
+            g._query_count = g.get('_query_count', 0) + 1
+            if g.get('_query_exempt_depth'):
+                g._query_exempt_count = g.get('_query_exempt_count', 0) + 1
+
+
+def init_query_counter(app):
+    """Подключает счётчик ко всем движкам SQLAlchemy (один раз на процесс) и заголовок X-Query-Count."""
+    global _installed
+    with _lock:
+        if not _installed:
+            event.listen(Engine, 'before_cursor_execute', _count_query)
+            _installed = True
+
+    if app.config.get('QUERY_COUNT_HEADER'):
+        @app.after_request
+        def add_query_count_header(response):
+            response.headers['X-Query-Count'] = str(query_count())
+            return response
+
+
+def query_count():
+    """Число SQL-запросов, выполненных в текущем HTTP-запросе (вне запроса — 0)."""
+    if not has_request_context():
+        return 0
+    return g.get('_query_count', 0)
+
+
+def thread_query_counts():
+    """(все, вне бюджета) запросы текущего контекста — вернуть из потока для merge_thread_queries."""
+    if not has_request_context():
+        return 0, 0
+    return g.get('_query_count', 0), g.get('_query_exempt_count', 0)
+
+
+def merge_thread_queries(counts):
+    """Добавляет к текущему запросу запросы, выполненные в потоке со своим g (см. thread_query_counts)."""
+    if not has_request_context():
+        return
+    total, exempt = counts
+    if g.get('_query_exempt_depth'):
+        exempt = total
+    g._query_count = g.get('_query_count', 0) + total
+    g._query_exempt_count = g.get('_query_exempt_count', 0) + exempt
+
+
+def _budgeted_count():
+    return query_count() - (g.get('_query_exempt_count', 0) if has_request_context() else 0)
+
+
+@contextlib.contextmanager
+def not_budgeted():
+    """
+    Запросы внутри не входят в бюджеты страниц (но учитываются в query_count).
+    Для загрузчиков общих кэшей (обвязка сайта): холодный кэш — не свойство конкретной страницы.
+    Работает и как декоратор.
+    """
+    if not has_request_context():
+        yield
+        return
+    g._query_exempt_depth = g.get('_query_exempt_depth', 0) + 1
+    try:
+        yield
+    finally:
+        g._query_exempt_depth -= 1
+
+
+@contextlib.contextmanager
+def query_budget(limit, name='block'):
+    """
+    Проверяет, что блок выполнил не больше limit запросов (без запросов внутри not_budgeted).
+    QUERY_BUDGET_STRICT = True (тесты) — QueryBudgetExceeded, иначе — предупреждение в лог.
+    Фактическое число запросов блока сохраняется в g.query_budgets[name].
+    """
+    started = _budgeted_count()
+    yield
+    used = _budgeted_count() - started
+    if not has_request_context():
+        return
+    budgets = g.setdefault('query_budgets', {})
+    budgets[name] = used
+    if used <= limit:
+        return
+    message = f'{name}: {used} SQL-запросов при бюджете {limit}'
+    if has_app_context() and current_app.config.get('QUERY_BUDGET_STRICT'):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -0,0 +1,150 @@
+"""
+@file: app/review_votes.py
+@description: Голосование за отзывы: запись голоса (insert-or-ignore) и счётчики likes/dislikes.
+              При REVIEW_VOTE_BUFFER = True приращения счётчиков копятся в памяти процесса и сбрасываются
+              пакетом (фоновым потоком раз в REVIEW_VOTE_FLUSH_INTERVAL сек или по REVIEW_VOTE_FLUSH_SIZE голосов),
+              чтобы популярный отзыв не упирался в блокировку одной строки reviews
+@dependencies: Review, ReviewVote
+@created: 2026-10-18
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from .extensions import db
+from .models.review import Review
+from .models.review_vote import ReviewVote
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewVoteBuffer:
+    """
+    Write-behind буфер приращений: {review_id: [likes, dislikes]}.
+    Сами голоса (review_votes) пишутся сразу — теряются только ещё не сброшенные приращения счётчиков
+    при аварийном завершении процесса; при штатной остановке буфер сбрасывается (atexit).
+    По интервалу буфер сбрасывает фоновый daemon-поток, поэтому приращения не залёживаются в простаивающем воркере.
+    """
+
+    def __init__(self, flush_interval=5, flush_size=500):
+        self.enabled = False
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.app = None
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._pending = defaultdict(lambda: [0, 0])
+        self._pending_votes = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, review_id, likes=0, dislikes=0):
+        """Добавляет приращение; True — пора сбрасывать буфер."""
+        self._ensure_flusher()
+        with self._lock:
+            delta = self._pending[review_id]
+            delta[0] += likes
+            delta[1] += dislikes
+            self._pending_votes += 1
+            return (self._pending_votes >= self.flush_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def _ensure_flusher(self):
+        # Поток запускается при первом голосе, а не при импорте: после fork воркера (gunicorn --preload)
+        # поток родителя в дочернем процессе не существует, и is_alive() вернёт False
+        if self.app is None:
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name='review-vote-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_due(self):
+        with self._lock:
+            return bool(self._pending_votes) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if not self._flush_due():
+                continue
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    pass  # приращения возвращены в буфер, ошибка уже в логе
+
+    def pending(self, review_id):
+        """Ещё не сброшенные (likes, dislikes) отзыва — чтобы ответ голосующему учитывал его голос."""
+        with self._lock:
+            delta = self._pending.get(review_id)
+            return (delta[0], delta[1]) if delta else (0, 0)
+
+    def flush(self):
+        """Сбрасывает накопленные приращения одним пакетным UPDATE в отдельной транзакции."""
+        with self._lock:
+            deltas = {review_id: tuple(delta) for review_id, delta in self._pending.items()}
+            self._pending = defaultdict(lambda: [0, 0])
+            self._pending_votes = 0
+            self._last_flush = time.monotonic()
+        if not deltas:
+            return 0
+        try:
+            with db.engine.begin() as connection:
+                Review.apply_vote_deltas(deltas, connection=connection)
+        except Exception:
+            # Возвращаем приращения в буфер — попробуем при следующем сбросе
+            with self._lock:
+                for review_id, (likes, dislikes) in deltas.items():
+                    delta = self._pending[review_id]
+                    delta[0] += likes
+                    delta[1] += dislikes
+            logger.exception('Не удалось сбросить буфер голосов за отзывы')
+            raise
+        return len(deltas)
+
+
+review_vote_buffer = ReviewVoteBuffer()
+
+
+def init_review_votes(app):
+    """Настраивает буфер из конфигурации, фоновый сброс по интервалу и сброс остатка при остановке процесса."""
+    review_vote_buffer.enabled = app.config.get('REVIEW_VOTE_BUFFER', False)
+    review_vote_buffer.flush_interval = app.config.get('REVIEW_VOTE_FLUSH_INTERVAL', 5)
+    review_vote_buffer.flush_size = app.config.get('REVIEW_VOTE_FLUSH_SIZE', 500)
+    review_vote_buffer.app = app if review_vote_buffer.enabled else None
+    if review_vote_buffer.enabled:
+        def flush_on_exit():
+            with app.app_context():
+                try:
+                    review_vote_buffer.flush()
+                except Exception:
+                    pass
+        atexit.register(flush_on_exit)
+
+
+def cast_vote(review_id, voter_key, action):
+    """
+    Голос 'like' / 'dislike' от voter_key. Возвращает (записан ли голос, likes, dislikes).
+    Повторный голос того же voter_key не меняет счётчики (уникальный ключ review_votes).
+    """
+    likes, dislikes = (1, 0) if action == 'like' else (0, 1)
+    recorded = ReviewVote.record(review_id, voter_key)
+    flush_due = False
+    if recorded:
+        if review_vote_buffer.enabled:
+            flush_due = review_vote_buffer.add(review_id, likes, dislikes)
+        else:
+            Review.apply_vote_deltas({review_id: (likes, dislikes)})
+    db.session.commit()
+    if flush_due:
+        try:
+            review_vote_buffer.flush()
+        except Exception:
+            pass
+
+    current_likes, current_dislikes = Review.vote_counts(review_id)
+    pending_likes, pending_dislikes = review_vote_buffer.pending(review_id)
+    return recorded, current_likes + pending_likes, current_dislikes + pending_dislikes
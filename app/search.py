@@ -0,0 +1,228 @@
+"""
+@file: app/search.py
+@description: Поиск товаров по инвертированному индексу (product_search_terms): транслитерация unidecode,
+              опечатки через RapidFuzz, ранжирование по весу поля и близости термина
+@dependencies: ProductSearchTerm, Product, ProductVariation, ProductAttribute, Category, rapidfuzz, unidecode
+@created: 2026-10-18
+"""
+
+import bisect
+import re
+
+from rapidfuzz import fuzz, process
+from unidecode import unidecode
+
+from .cache import VersionedCache
+from .extensions import db
+from .models.attributeValue import AttributeValue
+from .models.category import Category
+from .models.product import Product
+from .models.productAttribute import ProductAttribute
+from .models.productOptions import ProductVariation
+from .models.search import ProductSearchTerm
+
+# Вес термина по полю, где он найден (в индексе хранится максимальный)
+FIELD_WEIGHTS = {
+    'name': 10,
+    'sku': 8,
+    'category': 4,
+    'attribute': 3,
+    'description': 1,
+}
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+FUZZY_SCORE_CUTOFF = 80  # минимальная похожесть термина (0..100) для исправления опечатки
+FUZZY_LIMIT = 5          # сколько похожих терминов словаря подставлять на одно слово запроса
+
+SEARCH_NAMESPACE = 'search_vocabulary'
+search_cache = VersionedCache(default_ttl=600)
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def tokenize(text):
+    """Нормализует текст: снимает HTML, транслитерирует кириллицу в латиницу, режет на слова."""
+    if not text:
+        return []
+    text = unidecode(_TAG_RE.sub(' ', str(text))).lower()
+    return [token[:MAX_TERM_LENGTH] for token in _TOKEN_RE.findall(text) if len(token) >= MIN_TERM_LENGTH]
+
+
+def _sku_terms(sku):
+    tokens = tokenize(sku)
+    # Артикул ищут и слитно: "AB-12" -> "ab12"
+    if len(tokens) > 1:
+        tokens.append(''.join(tokens)[:MAX_TERM_LENGTH])
+    return tokens
+
+
+# ----------------------------
+#  Индексация
+# ----------------------------
+def _collect_terms(products):
+    """{product_id: {term: weight}} для списка товаров; связанные данные загружаются пакетно."""
+    product_ids = [product.id for product in products]
+    terms = {product.id: {} for product in products}
+
+    def add(product_id, text_terms, field):
+        weight = FIELD_WEIGHTS[field]
+        bucket = terms[product_id]
+        for term in text_terms:
+            if bucket.get(term, 0) < weight:
+                bucket[term] = weight
+
+    category_ids = {product.category_id for product in products if product.category_id}
+    category_names = dict(db.session.query(Category.id, Category.name).filter(Category.id.in_(category_ids)).all()) \
+        if category_ids else {}
+
+    for product in products:
+        add(product.id, tokenize(product.name), 'name')
+        add(product.id, tokenize(product.description), 'description')
+        if product.category_id in category_names:
+            add(product.id, tokenize(category_names[product.category_id]), 'category')
+
+    for product_id, sku in db.session.query(ProductVariation.product_id, ProductVariation.sku) \
+            .filter(ProductVariation.product_id.in_(product_ids), ProductVariation.sku.isnot(None)).all():
+        add(product_id, _sku_terms(sku), 'sku')
+
+    for product_id, value in db.session.query(ProductAttribute.product_id, AttributeValue.value) \
+            .join(AttributeValue, AttributeValue.id == ProductAttribute.attribute_value_id) \
+            .filter(ProductAttribute.product_id.in_(product_ids)).all():
+        add(product_id, tokenize(value), 'attribute')
+
+    return terms
+
+
+def index_products(products):
+    """
+    Переиндексирует товары: удаляет их старые термины и вставляет новые пакетно.
+    Вызывается после сохранения товара; commit остаётся за вызывающим кодом.
+    """
+    db.session.flush()
+    products = [product for product in products if product and product.id]
+    if not products:
+        return 0
+    terms = _collect_terms(products)
+    remove_products_from_index([product.id for product in products], invalidate=False)
+    rows = [
+        {'term': term, 'product_id': product_id, 'weight': weight}
+        for product_id, bucket in terms.items()
+        for term, weight in bucket.items()
+    ]
+    if rows:
+        db.session.execute(ProductSearchTerm.__table__.insert(), rows)
+    search_cache.bump(SEARCH_NAMESPACE)
+    return len(rows)
+
+
+def remove_products_from_index(product_ids, invalidate=True):
+    product_ids = [pid for pid in product_ids if pid]
+    if not product_ids:
+        return
+    ProductSearchTerm.query.filter(ProductSearchTerm.product_id.in_(product_ids)).delete(synchronize_session=False)
+    if invalidate:
+        search_cache.bump(SEARCH_NAMESPACE)
+
+
+def rebuild_search_index(batch_size=500):
+    """Полная переиндексация каталога пачками (CLI: flask reindex-search)."""
+    ProductSearchTerm.query.delete(synchronize_session=False)
+    total = 0
+    last_id = 0
+    while True:
+        batch = Product.query.filter(Product.id > last_id).order_by(Product.id).limit(batch_size).all()
+        if not batch:
+            break
+        total += index_products(batch)
+        last_id = batch[-1].id
+    search_cache.bump(SEARCH_NAMESPACE)
+    return total
+
+
+# ----------------------------
+#  Поиск
+# ----------------------------
+def _vocabulary():
+    """
+    Отсортированный словарь терминов индекса — для продолжений слова и опечаток.
+    Кэш процесса сбрасывается индексацией только в своём воркере, поэтому новые термины из других
+    воркеров появляются здесь с задержкой (TTL кэша); точное совпадение от словаря не зависит.
+    """
+    return search_cache.get_or_set(
+        SEARCH_NAMESPACE,
+        lambda: sorted(term for (term,) in db.session.query(ProductSearchTerm.term).distinct().all())
+    )
+
+
+def _expand_token(token):
+    """
+    {термин индекса: похожесть 0..1} для слова запроса:
+    точное совпадение — 1, продолжение слова (префикс) — 0.9, опечатка — по RapidFuzz.
+    """
+    # Само слово ищется в индексе всегда — даже если его ещё нет в закэшированном словаре воркера
+    expansions = {token: 1.0}
+    vocabulary = _vocabulary()
+    # Продолжения слова — непрерывный диапазон отсортированного словаря
+    start = bisect.bisect_left(vocabulary, token)
+    end = bisect.bisect_left(vocabulary, token + '\uffff', start)
+    for term in vocabulary[start:end]:
+        if term != token:
+            expansions[term] = 0.9
+    if len(token) >= 3:
+        for term, score, _ in process.extract(token, vocabulary, scorer=fuzz.ratio,
+                                              score_cutoff=FUZZY_SCORE_CUTOFF, limit=FUZZY_LIMIT):
+            expansions[term] = max(expansions.get(term, 0), score / 100 * 0.8)
+    return expansions
+
+
+def search_product_ids(query, limit=20):
+    """
+    Ранжированный список ID товаров по запросу.
+    Балл товара — сумма по словам запроса лучшего (вес поля × похожесть термина).
+    Сначала идут товары, где нашлись все слова запроса, затем — частичные совпадения.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+
+    expansions = {token: _expand_token(token) for token in tokens}
+    all_terms = {term for token_terms in expansions.values() for term in token_terms}
+    if not all_terms:
+        return []
+
+    rows = db.session.query(ProductSearchTerm.product_id, ProductSearchTerm.term, ProductSearchTerm.weight) \
+        .filter(ProductSearchTerm.term.in_(all_terms)).all()
+
+    scores = {}   # product_id -> {token: best score}
+    for product_id, term, weight in rows:
+        product_scores = scores.setdefault(product_id, {})
+        for token, token_terms in expansions.items():
+            similarity = token_terms.get(term)
+            if similarity and product_scores.get(token, 0) < weight * similarity:
+                product_scores[token] = weight * similarity
+
+    ranked = sorted(
+        scores.items(),
+        key=lambda item: (-len(item[1]), -sum(item[1].values()), item[0])
+    )
+    return [product_id for product_id, _ in ranked[:limit]]
+
+
+def _search_by_name(query, limit):
+    """Запасной поиск по вхождению в название, пока индекс пуст (до первой индексации каталога)."""
+    return Product.query.options(db.joinedload(Product.main_image)) \
+        .filter(Product.name.ilike(f'%{query}%')).order_by(Product.name).limit(limit).all()
+
+
+def search_products(query, limit=20):
+    """Товары в порядке релевантности (с главным изображением одним запросом)."""
+    if not _vocabulary():
+        return _search_by_name(query, limit)
+    product_ids = search_product_ids(query, limit=limit)
+    if not product_ids:
+        return []
+    products = Product.query.options(db.joinedload(Product.main_image)).filter(Product.id.in_(product_ids)).all()
+    by_id = {product.id: product for product in products}
+    return [by_id[pid] for pid in product_ids if pid in by_id]
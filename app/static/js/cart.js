@@ -1 +1,81 @@
+$(document).ready(function() {
+    initCartPage();
+});
 
+// Запрос к JSON API корзины (/cart/api/...): CSRF-токен передаётся заголовком X-CSRFToken
+function cartApiRequest(url, method, payload) {
+    return $.ajax({
+        url: url,
+        method: method,
+        contentType: 'application/json',
+        headers: {
+            'X-CSRFToken': $('meta[name="csrf-token"]').attr('content')
+        },
+        data: payload ? JSON.stringify(payload) : undefined
+    });
+}
+
+// Перерисовка строк и итога страницы корзины по снимку из ответа API
+function renderCartSnapshot(cart) {
+    const lines = {};
+    cart.lines.forEach(function(line) {
+        lines[line.cart_item_id] = line;
+    });
+
+    $('.cart-line').each(function() {
+        const $row = $(this);
+        const line = lines[$row.data('cart-item-id')];
+        if (!line) {
+            $row.remove();
+            return;
+        }
+        $row.find('.cart-qty').val(line.quantity);
+        $row.find('.cart-line-total').text(line.total + ' р.');
+    });
+
+    $('#cart-subtotal').text(cart.subtotal);
+    if (cart.count === 0) {
+        window.location.reload();
+    }
+}
+
+function initCartPage() {
+    if (!$('.cart-line').length) return;
+
+    $(document).off('change', '.cart-qty');
+    $(document).on('change', '.cart-qty', function() {
+        const $input = $(this);
+        const cartItemId = $input.closest('.cart-line').data('cart-item-id');
+        const quantity = Math.max(parseInt($input.val(), 10) || 0, 0);
+
+        cartApiRequest('/cart/api/items/' + cartItemId, 'PATCH', { quantity: quantity })
+            .done(function(response) {
+                renderCartSnapshot(response.cart);
+            })
+            .fail(function(xhr) {
+                if (xhr.responseJSON && xhr.responseJSON.cart) {
+                    renderCartSnapshot(xhr.responseJSON.cart);
+                }
+                showNotification('Не удалось изменить количество', 'error');
+            });
+    });
+
+    // Удаление без перезагрузки; без JS форма отправляется на /cart/remove как раньше
+    $(document).off('submit', '.cart-remove-form');
+    $(document).on('submit', '.cart-remove-form', function(e) {
+        e.preventDefault();
+        const cartItemId = $(this).closest('.cart-line').data('cart-item-id');
+
+        cartApiRequest('/cart/api/items/' + cartItemId, 'DELETE')
+            .done(function(response) {
+                renderCartSnapshot(response.cart);
+                showNotification('Товар удален из корзины!', 'success');
+            })
+            .fail(function(xhr) {
+                if (xhr.responseJSON && xhr.responseJSON.cart) {
+                    renderCartSnapshot(xhr.responseJSON.cart);
+                }
+                showNotification('Не удалось удалить товар', 'error');
+            });
+    });
+}
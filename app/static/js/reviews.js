@@ -139,9 +139,9 @@
     if (!btn) return;
     e.preventDefault();
     const productId = btn.getAttribute('data-product-id');
-    let offset = parseInt(btn.getAttribute('data-offset') || '0', 10);
+    const cursor = btn.getAttribute('data-cursor') || '';
     const limit = parseInt(btn.getAttribute('data-limit') || '2', 10);
-    fetch(`/product/${productId}/reviews?offset=${offset}&limit=${limit}`)
+    fetch(`/product/${productId}/reviews?cursor=${encodeURIComponent(cursor)}&limit=${limit}`)
       .then(r => r.json())
       .then(json => {
         if (!json || !json.ok) return;
@@ -150,8 +150,8 @@
         temp.innerHTML = json.html || '';
         const cards = Array.from(temp.children);
         cards.forEach(card => parent.insertBefore(card, btn));
-        btn.setAttribute('data-offset', String(json.next_offset || (offset + cards.length)));
-        if (!json.has_more) {
+        btn.setAttribute('data-cursor', json.next_cursor || '');
+        if (!json.has_more || !json.next_cursor) {
           btn.remove();
         }
       }).catch(()=>{});
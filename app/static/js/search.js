@@ -9,7 +9,7 @@ function searchProducts(query) {
                     `<div class="col-6 p-1"><div class="list-group-item card p-2 h-100">
     <a href="/product/${product.slug}" class="align-items-center" style="text-decoration: none; color: #000">
         <div >
-            <img src="/static/uploads/${product.image}" class="img-fluid rounded" alt="${product.name}">
+            <img src="/static/uploads/${product.image || 'placeholder.jpg'}" class="img-fluid rounded" alt="${product.name}">
         </div>
         <div>
             <h6 class="mb-1 fs-6" >${product.name}</h6>
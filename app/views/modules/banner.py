@@ -1,4 +1,3 @@
-import json
 import logging
 from flask import flash, redirect, url_for
 from ...models.module import ModuleInstance
@@ -39,7 +38,7 @@ class BannerModule:
             }
 
         # Извлекаем и парсим настройки из module_instance.settings
-        settings = json.loads(module_instance.settings) if module_instance.settings else {}
+        settings = module_instance.get_settings()
 
         # Получаем связанный экземпляр BannerModuleInstance
         banner_instance = BannerModuleInstance.query.filter_by(module_instance_id=module_instance.id).first()
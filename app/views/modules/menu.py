@@ -1,14 +1,18 @@
 """
 @file: app/views/modules/menu.py
-@description: Логика модуля меню для фронтенда
+@description: Логика модуля меню для фронтенда. Дерево меню материализуется в MenuModuleInstance.tree_snapshot
+              и пересобирается только после изменения пунктов меню, категорий, страниц или статей
 @dependencies: MenuModuleInstance, MenuItemExtended
 @created: 2024-12-21
 """
 
+from ...extensions import db
 from ...models.modules.menu import MenuModuleInstance, MenuItemExtended
 from ...models.menu import MenuItem
-from ...models.category import Category
 from ...models.image import Image
+from ...models.category import get_catalog_categories
+from ...cache import invalidate_chrome, CHROME_MENU
+from ..page_modules import invalidate_module_fragment
 
 
 class MenuModule:
@@ -37,17 +41,12 @@ class MenuModule:
                     'menu_items': []
                 }
 
-            # Получаем пункты меню с их расширенными данными
-            extended_items = MenuItemExtended.query.filter_by(
-                menu_instance_id=menu_instance.id
-            ).join(MenuItem).order_by(MenuItem.position).all()
-
-            # Строим структуру меню
-            menu_structure = MenuModule.build_menu_structure(
-                extended_items, 
-                menu_instance.max_depth,
-                menu_instance.enable_auto_catalog
-            )
+            # Готовое дерево из снимка; если снимок сброшен — собираем и сохраняем для следующих запросов
+            menu_tree = menu_instance.get_tree_snapshot()
+            if menu_tree is None:
+                version = menu_instance.snapshot_version or 0
+                menu_tree = MenuModule.build_menu_tree(menu_instance)
+                menu_instance.store_tree_snapshot(menu_tree, version)
 
             # Возвращаем данные для шаблона
             return {
@@ -56,8 +55,8 @@ class MenuModule:
                 'show_icons': menu_instance.show_icons,
                 'enable_videos': menu_instance.enable_videos,
                 'max_depth': menu_instance.max_depth,
-                'menu_items': menu_structure,
-                'menu_tree': MenuModule.build_hierarchical_menu(menu_structure)
+                'menu_items': MenuModule.flatten_menu(menu_tree),
+                'menu_tree': menu_tree
             }
 
         except Exception as e:
@@ -67,6 +66,79 @@ class MenuModule:
                 'menu_items': []
             }
 
+    @staticmethod
+    def build_menu_tree(menu_instance):
+        """
+        Собирает дерево меню экземпляра: пункты с MenuItem — одним запросом,
+        целевые объекты — по запросу на тип, изображения — одним запросом IN, каталог — одним проходом по категориям.
+        """
+        extended_items = MenuItemExtended.query.filter_by(
+            menu_instance_id=menu_instance.id
+        ).join(MenuItemExtended.menu_item).options(
+            db.contains_eager(MenuItemExtended.menu_item)
+        ).order_by(MenuItem.position).all()
+
+        menu_structure = MenuModule.build_menu_structure(
+            extended_items,
+            menu_instance.max_depth,
+            menu_instance.enable_auto_catalog
+        )
+        return MenuModule.build_hierarchical_menu(menu_structure)
+
+    @staticmethod
+    def _is_catalog_point(extended_item):
+        # Каталог: всегда подтягиваем дерево категорий, чтобы не зависеть от невыставленных флагов
+        url_value = (extended_item.menu_item.url or '').rstrip('/') if getattr(extended_item, 'menu_item', None) else ''
+        return (
+            extended_item.item_type == 'catalog' or
+            (extended_item.item_type in ('custom', 'external') and url_value == '/catalog')
+        )
+
+    @staticmethod
+    def _catalog_items(root_id, max_depth, categories):
+        # Если в целевом id указан корень каталога — используем его
+        catalog_items = MenuItemExtended.get_catalog_items(
+            parent_id=root_id or None,
+            max_depth=max_depth,
+            categories=categories
+        )
+        # Fallback: если ничего не нашли на верхнем уровне, а есть единственный корень — берем его детей
+        if not catalog_items:
+            roots = MenuItemExtended.get_catalog_items(parent_id=None, max_depth=1, categories=categories)
+            if len(roots) == 1:
+                catalog_items = MenuItemExtended.get_catalog_items(
+                    parent_id=roots[0]['id'],
+                    max_depth=max_depth,
+                    categories=categories
+                )
+        return catalog_items
+
+    @staticmethod
+    def _catalog_image_ids(catalog_items):
+        for item in catalog_items:
+            if item.get('image_id'):
+                yield item['image_id']
+            yield from MenuModule._catalog_image_ids(item.get('children', []))
+
+    @staticmethod
+    def load_images(image_ids):
+        """{id: filename} для иконок, видео и картинок категорий — одним запросом IN."""
+        image_ids = {image_id for image_id in image_ids if image_id}
+        if not image_ids:
+            return {}
+        return dict(db.session.query(Image.id, Image.filename).filter(Image.id.in_(image_ids)).all())
+
+    @staticmethod
+    def _media_data(images, image_id, url_prefix):
+        filename = images.get(image_id) if image_id else None
+        if not filename:
+            return None
+        return {
+            'id': image_id,
+            'filename': filename,
+            'url': f'{url_prefix}{filename}'
+        }
+
     @staticmethod
     def build_menu_structure(extended_items, max_depth=3, enable_auto_catalog=True):
         """
@@ -80,37 +152,34 @@ class MenuModule:
         Returns:
             list: Структурированный список пунктов меню
         """
+        targets = MenuItemExtended.load_targets(extended_items)
+
+        # Автокаталог: одна мемоизированная выборка категорий на всё меню, деревья собираются в памяти
+        categories = None
+        catalog_by_item = {}
+        for extended_item in extended_items:
+            if MenuModule._is_catalog_point(extended_item):
+                if categories is None:
+                    categories = get_catalog_categories()
+                catalog_by_item[extended_item.id] = MenuModule._catalog_items(
+                    extended_item.target_id, max_depth, categories
+                )
+
+        image_ids = {extended_item.icon_id for extended_item in extended_items}
+        image_ids |= {extended_item.video_id for extended_item in extended_items}
+        for catalog_items in catalog_by_item.values():
+            image_ids.update(MenuModule._catalog_image_ids(catalog_items))
+        images = MenuModule.load_images(image_ids)
+
         menu_items = []
 
         for extended_item in extended_items:
             try:
-                # Получаем данные иконки и видео
-                icon_data = None
-                video_data = None
-
-                if extended_item.icon_id:
-                    icon = Image.query.get(extended_item.icon_id)
-                    if icon:
-                        icon_data = {
-                            'id': icon.id,
-                            'filename': icon.filename,
-                            'url': f'/static/uploads/{icon.filename}'
-                        }
-
-                if extended_item.video_id:
-                    video = Image.query.get(extended_item.video_id)
-                    if video:
-                        video_data = {
-                            'id': video.id,
-                            'filename': video.filename,
-                            'url': f'/static/uploads/videos/{video.filename}'
-                        }
-
                 # Формируем данные пункта меню
                 item_data = {
                     'id': extended_item.menu_item.id,  # Используем ID из MenuItem, а не из MenuItemExtended
-                    'title': extended_item.get_target_title(),
-                    'url': extended_item.get_dynamic_url(),
+                    'title': extended_item.get_target_title(targets),
+                    'url': extended_item.get_dynamic_url(targets),
                     'type': extended_item.item_type,
                     'description': extended_item.description,
                     'custom_class': extended_item.custom_class,
@@ -118,34 +187,14 @@ class MenuModule:
                     'is_featured': extended_item.is_featured,
                     'parent_id': extended_item.menu_item.parent_id,
                     'position': extended_item.menu_item.position,
-                    'icon': icon_data,
-                    'video': video_data,
+                    'icon': MenuModule._media_data(images, extended_item.icon_id, '/static/uploads/'),
+                    'video': MenuModule._media_data(images, extended_item.video_id, '/static/uploads/videos/'),
                     'children': []
                 }
 
                 # Для каталога добавляем автогенерируемые категории
-                # Каталог: всегда подтягиваем дерево категорий, чтобы не зависеть от невыставленных флагов
-                url_value = (extended_item.menu_item.url or '').rstrip('/') if getattr(extended_item, 'menu_item', None) else ''
-                is_catalog_point = (
-                    extended_item.item_type == 'catalog' or
-                    (extended_item.item_type in ('custom', 'external') and url_value == '/catalog')
-                )
-                if is_catalog_point:
-                    # Если в целевом id указан корень каталога — используем его
-                    parent_root_id = extended_item.target_id if extended_item.target_id else None
-                    catalog_items = MenuItemExtended.get_catalog_items(
-                        parent_id=parent_root_id,
-                        max_depth=max_depth
-                    )
-                    # Fallback: если ничего не нашли на верхнем уровне, а есть единственный корень — берем его детей
-                    if not catalog_items:
-                        roots = MenuItemExtended.get_catalog_items(parent_id=None, max_depth=1)
-                        if len(roots) == 1:
-                            catalog_items = MenuItemExtended.get_catalog_items(
-                                parent_id=roots[0]['id'],
-                                max_depth=max_depth
-                            )
-                    item_data['children'] = MenuModule.format_catalog_items(catalog_items)
+                if extended_item.id in catalog_by_item:
+                    item_data['children'] = MenuModule.format_catalog_items(catalog_by_item[extended_item.id], images)
 
                 menu_items.append(item_data)
 
@@ -156,31 +205,24 @@ class MenuModule:
         return menu_items
 
     @staticmethod
-    def format_catalog_items(catalog_items):
+    def format_catalog_items(catalog_items, images=None):
         """
         Форматирует пункты автокаталога для отображения
         
         Args:
             catalog_items: Список пунктов каталога
+            images: {id: filename} картинок категорий; без него загружается одним запросом
             
         Returns:
             list: Отформатированные пункты каталога
         """
+        if images is None:
+            images = MenuModule.load_images(MenuModule._catalog_image_ids(catalog_items))
+
         formatted_items = []
 
         for item in catalog_items:
             try:
-                # Получаем данные изображения категории
-                image_data = None
-                if item.get('image_id'):
-                    image = Image.query.get(item['image_id'])
-                    if image:
-                        image_data = {
-                            'id': image.id,
-                            'filename': image.filename,
-                            'url': f'/static/uploads/{image.filename}'
-                        }
-
                 formatted_item = {
                     'id': f"catalog_{item['id']}",
                     'title': item['title'],
@@ -190,9 +232,9 @@ class MenuModule:
                     'custom_class': 'catalog-item',
                     'open_in_new_tab': False,
                     'is_featured': False,
-                    'icon': image_data,
+                    'icon': MenuModule._media_data(images, item.get('image_id'), '/static/uploads/'),
                     'video': None,
-                    'children': MenuModule.format_catalog_items(item.get('children', []))
+                    'children': MenuModule.format_catalog_items(item.get('children', []), images)
                 }
 
                 formatted_items.append(formatted_item)
@@ -215,31 +257,35 @@ class MenuModule:
         Returns:
             list: Иерархическое дерево меню
         """
-        print(f"=== BUILD HIERARCHICAL MENU ===")
-        print(f"parent_id: {parent_id}")
-        print(f"menu_items count: {len(menu_items)}")
-        
-        tree = []
-
+        children_by_parent = {}
         for item in menu_items:
-            print(f"Item: {item.get('title')} (ID: {item.get('id')}, parent_id: {item.get('parent_id')})")
-            if item.get('parent_id') == parent_id:
-                print(f"  -> Adding to tree (parent_id matches)")
-                # Рекурсивно получаем дочерние элементы
-                children = MenuModule.build_hierarchical_menu(menu_items, item['id'])
-                
-                # Добавляем уже существующие дочерние элементы (например, из каталога)
-                if item.get('children'):
-                    children.extend(item['children'])
-                
+            children_by_parent.setdefault(item.get('parent_id'), []).append(item)
+
+        def attach(level_parent_id):
+            tree = []
+            for item in children_by_parent.get(level_parent_id, []):
+                # Подпункты меню, затем уже существующие дочерние элементы (например, из каталога)
+                children = attach(item['id']) + (item.get('children') or [])
                 if children:
                     item['children'] = children
-                    print(f"  -> Added {len(children)} children")
-
                 tree.append(item)
+            return tree
+
+        return attach(parent_id)
+
+    @staticmethod
+    def flatten_menu(menu_tree):
+        """Пункты меню (без автокаталога) плоским списком в порядке position."""
+        items = []
+
+        def walk(nodes):
+            for node in nodes:
+                if not str(node.get('id')).startswith('catalog_'):
+                    items.append(node)
+                walk(node.get('children') or [])
 
-        print(f"Returning tree with {len(tree)} items for parent_id {parent_id}")
-        return tree
+        walk(menu_tree)
+        return sorted(items, key=lambda item: item.get('position') or 0)
 
     @staticmethod
     def get_breadcrumbs(current_url, menu_items):
@@ -313,4 +359,19 @@ class MenuModule:
 
         except Exception as e:
             print(f"Ошибка получения меню по местоположению: {e}")
-            return None 
\ No newline at end of file
+            return None
+
+
+def invalidate_menu_snapshots(menu_instance_id=None):
+    """
+    Вызывается после фиксации изменений пунктов меню, категорий, страниц или статей:
+    сбрасывает снимки деревьев в БД (все или одного экземпляра), кэш главного меню и HTML модулей меню.
+    """
+    MenuModuleInstance.mark_snapshots_stale(menu_instance_id)
+    db.session.commit()
+    invalidate_chrome(CHROME_MENU)
+    query = db.session.query(MenuModuleInstance.module_instance_id)
+    if menu_instance_id is not None:
+        query = query.filter(MenuModuleInstance.id == menu_instance_id)
+    for (module_instance_id,) in query.all():
+        invalidate_module_fragment(module_instance_id)
@@ -1,12 +1,12 @@
 # app/admin/modules/tabs_module.py
-import json
-from flask import flash, redirect, url_for
+import re
+from sqlalchemy import literal, union_all
 from ...extensions import db
-from ...models.module import ModuleInstance
-from ...models.modules.product_tab import TabsModuleInstance, TabItem
+from ...models.modules.product_tab import TabsModuleInstance
 from ...models.product import Product
-from ...models.category import Category
 from ...models.productOptions import ProductOption
+from ...page_cache import add_page_tags, product_tag, category_tag, TAG_CATALOG
+from ..page_modules import cached_module_data
 
 
 class TabsModule:
@@ -23,51 +23,107 @@ class TabsModule:
             }
 
         # Извлекаем и парсим настройки из module_instance.settings
-        settings = json.loads(module_instance.settings) if module_instance.settings else {}
+        settings = module_instance.get_settings()
 
-        # Получаем связанный экземпляр TabsModuleInstance
-        tabs_instance = TabsModuleInstance.query.filter_by(module_instance_id=module_instance.id).first()
+        # Вкладки и товары — снимок в кэше модуля (сбрасывается save_instance и правкой товаров/категорий)
+        data = cached_module_data(module_instance.id, lambda: TabsModule._load_tabs(module_instance.id), key='tabs')
 
-        # Получаем список вкладок (TabItem), если tabs_instance существует
-        tab_items = TabItem.query.filter_by(tabs_id=tabs_instance.id).all() if tabs_instance else []
+        # Зависимости для кэша страниц: выведенные товары, категории вкладок, "все товары" — весь каталог
+        tab_items = data['tab_items']
+        add_page_tags(*(product_tag(product['id']) for products in data['tab_products'].values() for product in products))
+        add_page_tags(*(category_tag(tab_item['category_id']) for tab_item in tab_items if tab_item['mode'] == 'category'))
+        if any(tab_item['mode'] == 'all' for tab_item in tab_items):
+            add_page_tags(TAG_CATALOG)
 
-        # Инициализируем словарь для товаров по вкладкам
-        tab_products = {}
+        return {
+            'settings': settings,
+            **data
+        }
 
-        for tab_item in tab_items:
-            if tab_item.mode == "category" and tab_item.category_id:
-                # Получаем товары из указанной категории с ограничением по limit_count
-                products = Product.query.filter_by(category_id=tab_item.category_id).limit(tab_item.limit_count).all()
-                # Загружаем опции для каждого товара
-                for product in products:
-                    product.product_options = ProductOption.get_options_by_product_id(product.id)
-                tab_products[tab_item.id] = products
+    @staticmethod
+    def _tab_product_ids(tab_item):
+        # product_ids хранится как "1,2,3" или JSON '["1","2","3"]'
+        return [int(pid) for pid in re.findall(r'\d+', tab_item.product_ids or '')]
 
-            elif tab_item.mode == "custom" and tab_item.product_ids:
-                # Разбиваем строку product_ids на список ID
-                product_ids = tab_item.product_ids.split(",")
-                # Получаем товары по списку ID
-                products = Product.query.filter(Product.id.in_(product_ids)).all()
-                # Загружаем опции для каждого товара
-                for product in products:
-                    product.product_options = ProductOption.get_options_by_product_id(product.id)
-                tab_products[tab_item.id] = products
+    @staticmethod
+    def _load_tabs(module_instance_id):
+        """
+        Снимок вкладок: {'tabs_instance', 'tab_items', 'tab_products': {tab_id: [product dict]}}.
+        Товары всех вкладок — один UNION ALL (по подзапросу с LIMIT на вкладку) с главным изображением,
+        опции — одним пакетом.
+        """
+        tabs_instance = TabsModuleInstance.query.options(db.selectinload(TabsModuleInstance.items)) \
+            .filter_by(module_instance_id=module_instance_id).first()
+        if not tabs_instance:
+            return {'tabs_instance': None, 'tab_items': [], 'tab_products': {}}
+        tab_items = sorted(tabs_instance.items, key=lambda item: item.id)
 
-            elif tab_item.mode == "all":
-                # Получаем все товары с ограничением по limit_count (по умолчанию 8, если не указано)
-                products = Product.query.limit(tab_item.limit_count or 8).all()
-                # Загружаем опции для каждого товара
-                for product in products:
-                    product.product_options = ProductOption.get_options_by_product_id(product.id)
-                tab_products[tab_item.id] = products
+        selects = []
+        custom_order = {}
+        for tab_item in tab_items:
+            tab_query = db.session.query(literal(tab_item.id).label('tab_id'), Product.id.label('product_id'))
+            if tab_item.mode == 'category' and tab_item.category_id:
+                tab_query = tab_query.filter(Product.category_id == tab_item.category_id) \
+                    .order_by(Product.sort_order, Product.id).limit(tab_item.limit_count)
+            elif tab_item.mode == 'custom' and tab_item.product_ids:
+                ids = TabsModule._tab_product_ids(tab_item)
+                if not ids:
+                    continue
+                custom_order[tab_item.id] = {pid: position for position, pid in enumerate(ids)}
+                tab_query = tab_query.filter(Product.id.in_(ids))
+            elif tab_item.mode == 'all':
+                tab_query = tab_query.order_by(Product.sort_order, Product.id).limit(tab_item.limit_count or 8)
+            else:
+                continue
+            # Обёртка в подзапрос: LIMIT внутри UNION допустим и в MySQL, и в SQLite
+            subquery = tab_query.subquery()
+            selects.append(db.select(subquery.c.tab_id, subquery.c.product_id))
+
+        tab_products = {tab_item.id: [] for tab_item in tab_items}
+        if selects:
+            members = union_all(*selects).subquery()
+            rows = db.session.query(members.c.tab_id, Product) \
+                .join(Product, Product.id == members.c.product_id) \
+                .options(db.joinedload(Product.main_image)) \
+                .all()
+            for tab_id, product in rows:
+                tab_products[tab_id].append(product)
 
+        for tab_id, products in tab_products.items():
+            if tab_id in custom_order:
+                products.sort(key=lambda product: custom_order[tab_id][product.id])
             else:
-                # Если режим не распознан или данных нет, устанавливаем пустой список
-                tab_products[tab_item.id] = []
+                products.sort(key=lambda product: (product.sort_order or 0, product.id))
+
+        products_by_id = {product.id: product for products in tab_products.values() for product in products}
+        options_by_product = ProductOption.get_options_by_product_ids(list(products_by_id))
 
+        # Отсоединённые снимки: шаблон обращается к полям так же, как к ORM-объектам
+        product_snapshots = {
+            product.id: {
+                'id': product.id,
+                'slug': product.slug,
+                'name': product.name,
+                'price': product.price,
+                'main_image': {'filename': product.main_image.filename} if product.main_image else None,
+                'product_options': options_by_product.get(product.id, []),
+            }
+            for product in products_by_id.values()
+        }
         return {
-            'settings': settings,
-            'tabs_instance': tabs_instance,
-            'tab_items': tab_items,
-            'tab_products': tab_products
-        }
\ No newline at end of file
+            'tabs_instance': {'id': tabs_instance.id, 'title': tabs_instance.title},
+            'tab_items': [
+                {
+                    'id': tab_item.id,
+                    'tab_title': tab_item.tab_title,
+                    'mode': tab_item.mode,
+                    'category_id': tab_item.category_id,
+                    'button_text': tab_item.button_text,
+                }
+                for tab_item in tab_items
+            ],
+            'tab_products': {
+                tab_id: [product_snapshots[product.id] for product in products]
+                for tab_id, products in tab_products.items()
+            },
+        }
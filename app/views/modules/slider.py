@@ -1,5 +1,3 @@
-import json
-
 from flask import flash, redirect, url_for, jsonify
 
 from ...models.module import *
@@ -24,7 +22,7 @@ class SliderModule:
             }
 
         # Парсим настройки из JSON
-        settings = json.loads(module_instance.settings) if module_instance.settings else {}
+        settings = module_instance.get_settings()
 
         # Получаем связанный слайдер и слайды через отношения
         slider_instance = module_instance.slider_instance
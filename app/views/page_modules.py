@@ -0,0 +1,193 @@
+"""
+@file: app/views/page_modules.py
+@description: Сборка страницы из модулей (PageLayout -> ModuleInstance): экземпляры загружаются одним запросом,
+              HTML каждого модуля кэшируется отдельно, промахи рендерятся параллельно в ограниченном пуле потоков
+@dependencies: VersionedCache, ModuleInstance, module_registry, page_cache (теги зависимостей), concurrent.futures
+@created: 2026-10-18
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import copy_current_request_context, current_app, g, render_template
+from jinja2 import TemplateNotFound
+from markupsafe import Markup
+
+from ..cache import VersionedCache
+from ..extensions import db
+from ..models.module import ModuleInstance
+from ..module_registry import module_registry
+from ..page_cache import add_page_tags
+from ..query_counter import merge_thread_queries, thread_query_counts
+
+# Пространство имён фрагмента — module:<id>: save_instance сбрасывает только свой модуль
+module_fragment_cache = VersionedCache(max_entries=2000)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _fragment_namespace(module_instance_id):
+    return f'module:{module_instance_id}'
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('MODULE_RENDER_WORKERS', 4),
+                thread_name_prefix='module-render'
+            )
+        return _executor
+
+
+def build_module_data(layout, module_instance):
+    """Контекст модуля для шаблона front/extations/<module_name>.html."""
+    module_data = {
+        'row_index': layout['row_index'],
+        'col_index': layout['col_index'],
+        'col_width': layout['col_width'],
+        'module_name': module_instance.module.name.lower().replace(" ", "_"),
+        'template': module_instance.selected_template,
+        'settings': module_instance.get_settings(),
+        'content': module_instance.content,
+        'instance': module_instance
+    }
+
+    # Динамически определяем класс модуля
+    module_class_name = module_instance.module.name  # Например, "SliderModule"
+    module_class = module_registry.get_front(module_class_name)
+    if module_class and hasattr(module_class, 'get_instance_data'):
+        # Добавляем специфичные данные модуля
+        module_data.update(module_class.get_instance_data(module_instance))
+    else:
+        current_app.logger.warning(f"Класс для модуля {module_class_name} не найден в реестре модулей")
+
+    return module_data
+
+
+def _render_fragment(layout, module_instance):
+    """{'html', 'tags'}: HTML модуля и теги кэша страниц, собранные во время его загрузки."""
+    page_tags = g.get('page_cache_tags')
+    g.page_cache_tags = set()
+    try:
+        module_data = build_module_data(layout, module_instance)
+        template_path = f"front/extations/{module_data['module_name']}.html"
+        try:
+            html = render_template(template_path, module=module_data)
+        except TemplateNotFound:
+            html = ''
+        return {'html': html, 'tags': sorted(g.page_cache_tags)}
+    finally:
+        # Теги самой страницы добавляются из фрагмента в render_page_modules (в том числе при попадании в кэш)
+        g.page_cache_tags = page_tags
+
+
+def _render_fragment_in_thread(layout, module_instance_id):
+    """
+    (фрагмент, счётчики запросов потока). Своя сессия БД в потоке: ORM-объекты основного потока здесь
+    использовать нельзя; g у потока тоже свой, поэтому запросы возвращаются для merge_thread_queries.
+    """
+    module_instance = ModuleInstance.query.options(db.joinedload(ModuleInstance.module)).get(module_instance_id)
+    if not module_instance:
+        return {'html': '', 'tags': []}, thread_query_counts()
+    return _render_fragment(layout, module_instance), thread_query_counts()
+
+
+def render_page_modules(layouts):
+    """
+    Модули страницы в порядке (row_index, col_index):
+    [{'row_index', 'col_index', 'col_width', 'module_name', 'html'}].
+
+    ModuleInstance всех ячеек загружаются одним запросом вместе с Module. Готовые фрагменты берутся из кэша,
+    промахи рендерятся параллельно (MODULE_RENDER_WORKERS потоков), так что страница стоит примерно
+    как самый медленный модуль, а не как их сумма.
+    """
+    cells = [
+        {
+            'row_index': layout.row_index,
+            'col_index': layout.col_index,
+            'col_width': layout.col_width,
+            'module_instance_id': layout.module_instance_id,
+        }
+        for layout in sorted(layouts, key=lambda x: (x.row_index, x.col_index))
+        if layout.module_instance_id
+    ]
+    if not cells:
+        return []
+
+    instance_ids = {cell['module_instance_id'] for cell in cells}
+    instances = {
+        instance.id: instance
+        for instance in ModuleInstance.query.options(db.joinedload(ModuleInstance.module))
+        .filter(ModuleInstance.id.in_(instance_ids)).all()
+    }
+    cells = [cell for cell in cells if cell['module_instance_id'] in instances]
+
+    ttl = current_app.config.get('MODULE_FRAGMENT_CACHE_TTL', 300)
+    fragments = {}
+    misses = []
+    for index, cell in enumerate(cells):
+        namespace = _fragment_namespace(cell['module_instance_id'])
+        key = (cell['row_index'], cell['col_index'], cell['col_width'])
+        fragment = module_fragment_cache.get(namespace, key)
+        if fragment is not None:
+            fragments[index] = fragment
+        else:
+            misses.append((index, cell, namespace, key, module_fragment_cache.version(namespace)))
+
+    if len(misses) > 1 and current_app.config.get('MODULE_RENDER_WORKERS', 4) > 1:
+        executor = _get_executor()
+        futures = {
+            index: executor.submit(copy_current_request_context(_render_fragment_in_thread),
+                                   cell, cell['module_instance_id'])
+            for index, cell, _, _, _ in misses
+        }
+        computed = {}
+        for index, future in futures.items():
+            computed[index], counts = future.result()
+            merge_thread_queries(counts)
+    else:
+        computed = {index: _render_fragment(cell, instances[cell['module_instance_id']])
+                    for index, cell, _, _, _ in misses}
+
+    for index, cell, namespace, key, version in misses:
+        module_fragment_cache.set(namespace, computed[index], key=key, ttl=ttl, version=version)
+        fragments[index] = computed[index]
+
+    modules = []
+    for index, cell in enumerate(cells):
+        fragment = fragments[index]
+        add_page_tags(*fragment['tags'])
+        modules.append({
+            'row_index': cell['row_index'],
+            'col_index': cell['col_index'],
+            'col_width': cell['col_width'],
+            'module_name': instances[cell['module_instance_id']].module.name.lower().replace(" ", "_"),
+            'html': Markup(fragment['html']),
+        })
+    return modules
+
+
+def cached_module_data(module_instance_id, loader, key='data'):
+    """
+    Кэш данных модуля (отсоединённый снимок) рядом с его фрагментом:
+    сбрасывается теми же invalidate_module_fragment / invalidate_module_fragments.
+    """
+    return module_fragment_cache.get_or_set(
+        _fragment_namespace(module_instance_id),
+        loader,
+        key=key,
+        ttl=current_app.config.get('MODULE_FRAGMENT_CACHE_TTL', 300)
+    )
+
+
+def invalidate_module_fragment(module_instance_id):
+    """Сбрасывает HTML одного модуля (после save_instance / удаления экземпляра)."""
+    module_fragment_cache.bump(_fragment_namespace(module_instance_id))
+
+
+def invalidate_module_fragments():
+    """Сбрасывает HTML всех модулей (изменились товары или категории, которые они выводят)."""
+    module_fragment_cache.clear()
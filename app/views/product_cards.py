@@ -0,0 +1,56 @@
+"""
+@file: app/views/product_cards.py
+@description: Кэш отрендеренных карточек товаров (front/_product_card.html) для листингов категории и фильтра
+@dependencies: VersionedCache, get_product_images_data, ProductOption
+@created: 2026-10-18
+"""
+
+from flask import current_app, render_template
+from markupsafe import Markup
+
+from ..cache import VersionedCache
+from ..models.product import get_product_images_data
+from ..models.productOptions import ProductOption
+
+PRODUCT_CARDS_NAMESPACE = 'product_cards'
+
+# Ключ фрагмента — (product.id, product.updated_at): после сохранения товара старый фрагмент просто не запрашивается.
+# Значения опций, их фото и изображения общие для товаров и не меняют updated_at — после их правки в админке
+# вызывается invalidate_product_cards()
+product_card_cache = VersionedCache(max_entries=20000)
+
+
+def _card_key(product):
+    return product.id, product.updated_at.isoformat() if product.updated_at else ''
+
+
+def render_product_cards(products):
+    """
+    {product_id: Markup} с HTML карточек. Из кэша берутся готовые фрагменты, остальные рендерятся
+    одним проходом: изображения и опции загружаются пакетно только для промахов.
+    """
+    keys = {product.id: _card_key(product) for product in products}
+    cached = product_card_cache.get_many(PRODUCT_CARDS_NAMESPACE, keys.values())
+    cards = {product_id: Markup(cached[key]) for product_id, key in keys.items() if key in cached}
+
+    missing = [product for product in products if product.id not in cards]
+    if missing:
+        missing_ids = [product.id for product in missing]
+        product_images_data = get_product_images_data(missing_ids)
+        options_by_product = ProductOption.get_options_by_product_ids(missing_ids)
+        ttl = current_app.config.get('PRODUCT_CARD_CACHE_TTL', 3600)
+        for product in missing:
+            html = render_template(
+                'front/_product_card.html',
+                product=product,
+                product_images=product_images_data.get(product.id, []),
+                options=options_by_product.get(product.id, [])
+            )
+            product_card_cache.set(PRODUCT_CARDS_NAMESPACE, html, key=keys[product.id], ttl=ttl)
+            cards[product.id] = Markup(html)
+    return cards
+
+
+def invalidate_product_cards():
+    """Сбрасывает все фрагменты (например, после правки общих опций или изображений)."""
+    product_card_cache.bump(PRODUCT_CARDS_NAMESPACE)
@@ -0,0 +1,104 @@
+"""
+@file: app/views/product_page.py
+@description: Сборка контекста страницы товара за фиксированное число SQL-запросов:
+              связи товара — жадной загрузкой, опции/вариации/отзывы — пакетными помощниками
+@dependencies: Product, ProductOption, ProductVariation, RelatedProduct, Review, SEOSettings
+@created: 2026-10-18
+"""
+
+from ..extensions import db
+from ..models.product import Product, RelatedProduct
+from ..models.productAttribute import ProductAttribute
+from ..models.attributeValue import AttributeValue
+from ..models.productOptions import ProductOption, ProductVariation
+from ..models.review import Review, paginate_approved_reviews
+from ..models.seo_settings import getSEO
+from ..models.size_chart import ProductSizeChart, SizeChart
+from .review_cards import render_review_cards
+
+# Бюджет SQL-запросов всей страницы товара (загрузка + рендеринг шаблона, без кэшей обвязки).
+# Не зависит от числа вариаций, атрибутов, отзывов и товаров категории.
+PRODUCT_PAGE_QUERY_BUDGET = 13
+
+# Отзывов в первой порции; следующие — через main.get_product_reviews по reviews_next_cursor
+PRODUCT_REVIEWS_PER_PAGE = 2
+
+# Товаров из той же категории внизу страницы
+CATEGORY_PRODUCTS_LIMIT = 6
+
+
+def load_product(product_slug):
+    """Товар со всеми связями, которые выводит страница; None, если не найден."""
+    return Product.query.options(
+        db.joinedload(Product.category),
+        db.joinedload(Product.main_image),
+        db.selectinload(Product.additional_images),
+        db.joinedload(Product.size_chart_link)
+        .joinedload(ProductSizeChart.size_chart)
+        .joinedload(SizeChart.image),
+        db.selectinload(Product.attributes)
+        .joinedload(ProductAttribute.attribute_value)
+        .joinedload(AttributeValue.attribute),
+    ).filter(Product.slug == product_slug).first()
+
+
+def _attributes_display(product):
+    # Атрибуты для вывода (имя -> значение)
+    return [
+        {'name': pa.attribute_value.attribute.name, 'value': pa.attribute_value.value}
+        for pa in product.attributes or []
+        if pa.attribute_value and pa.attribute_value.attribute
+    ]
+
+
+def load_product_page(product_slug):
+    """
+    Контекст шаблона front/product2.html или None, если товара нет.
+    Запросы: товар (+ доп. изображения, атрибуты), SEO, вариации (+ значения), товары категории,
+    связанные товары, опции (2), предки категории, первая порция отзывов (keyset) и статистика отзывов.
+    """
+    product = load_product(product_slug)
+    if not product:
+        return None
+
+    # До 6 других товаров из той же категории
+    category_products = Product.query.options(db.joinedload(Product.main_image)).filter(
+        Product.category_id == product.category_id,
+        Product.id != product.id
+    ).order_by(Product.sort_order, Product.id).limit(CATEGORY_PRODUCTS_LIMIT).all()
+
+    related_products_data = RelatedProduct.query.options(db.joinedload(RelatedProduct.related_product)) \
+        .filter_by(product_id=product.id).order_by(RelatedProduct.sort_order).all()
+
+    # Опции текущего товара и товаров из той же категории — одним пакетом
+    product_options = ProductOption.get_options_by_product_ids([product.id] + [p.id for p in category_products])
+    options = product_options.pop(product.id, [])
+
+    # Цепочка категорий для хлебных крошек — по материализованному пути, одним запросом
+    category_chain = product.category.get_ancestors() if product.category else []
+
+    # Первая порция одобренных отзывов (keyset, новые сверху) с авторами; карточки — из кэша фрагментов
+    approved_reviews, reviews_next_cursor = paginate_approved_reviews(product.id, limit=PRODUCT_REVIEWS_PER_PAGE)
+    review_stats = Review.approved_stats(product.id)
+
+    size_chart_link = product.size_chart_link
+    return {
+        'product': product,
+        'seo': getSEO('product', product.id),
+        'options': options,
+        'variations': ProductVariation.get_variations_by_product_id(product.id),
+        'cat_products': category_products,
+        'product_options': product_options,
+        'top_category': category_chain[0] if category_chain else None,
+        'category_chain': category_chain,
+        'product_attributes': _attributes_display(product),
+        'size_chart': size_chart_link.size_chart if size_chart_link else None,
+        'approved_reviews': approved_reviews,
+        'review_cards': render_review_cards(approved_reviews),
+        'reviews_next_cursor': reviews_next_cursor,
+        'rating_total': review_stats['total'],
+        'related_products_data': related_products_data,
+        'rating_avg': review_stats['avg'],
+        'rating_counts': review_stats['counts'],
+        'recommend_percent': review_stats['recommend_percent'],
+    }
@@ -0,0 +1,41 @@
+"""
+@file: app/views/review_cards.py
+@description: Кэш отрендеренных карточек отзывов (front/_review_card.html) для страницы товара и кнопки «Показать ещё»
+@dependencies: VersionedCache
+@created: 2026-10-18
+"""
+
+from flask import current_app, render_template
+from markupsafe import Markup
+
+from ..cache import VersionedCache
+
+REVIEW_CARDS_NAMESPACE = 'review_cards'
+
+# Ключ фрагмента — (id, updated_at, likes, dislikes): правка и голоса меняют ключ, старый фрагмент не запрашивается
+review_card_cache = VersionedCache(max_entries=20000)
+
+
+def _card_key(review):
+    return review.id, review.updated_at.isoformat() if review.updated_at else '', review.likes, review.dislikes
+
+
+def render_review_cards(reviews):
+    """{review_id: Markup} с HTML карточек; рендерятся только отзывы, которых нет в кэше."""
+    keys = {review.id: _card_key(review) for review in reviews}
+    cached = review_card_cache.get_many(REVIEW_CARDS_NAMESPACE, keys.values())
+    cards = {review_id: Markup(cached[key]) for review_id, key in keys.items() if key in cached}
+
+    ttl = current_app.config.get('REVIEW_CARD_CACHE_TTL', 3600)
+    for review in reviews:
+        if review.id in cards:
+            continue
+        html = render_template('front/_review_card.html', reviews=[review])
+        review_card_cache.set(REVIEW_CARDS_NAMESPACE, html, key=keys[review.id], ttl=ttl)
+        cards[review.id] = Markup(html)
+    return cards
+
+
+def invalidate_review_cards():
+    """Сбрасывает все фрагменты (например, после смены имени покупателя или шаблона карточки)."""
+    review_card_cache.bump(REVIEW_CARDS_NAMESPACE)
@@ -0,0 +1,34 @@
+"""menu tree snapshot
+
+Revision ID: a6d2f8b4c1e9
+Revises: f3a9c6e1b2d7
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2f8b4c1e9'
+down_revision = 'f3a9c6e1b2d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        with op.batch_alter_table('menu_instances') as batch_op:
+            batch_op.add_column(sa.Column('tree_snapshot', sa.Text(), nullable=True))
+            batch_op.add_column(sa.Column('snapshot_version', sa.Integer(), nullable=False, server_default='0'))
+    except Exception:
+        pass
+
+
+def downgrade():
+    try:
+        with op.batch_alter_table('menu_instances') as batch_op:
+            batch_op.drop_column('snapshot_version')
+            batch_op.drop_column('tree_snapshot')
+    except Exception:
+        pass
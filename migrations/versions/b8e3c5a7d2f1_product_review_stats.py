@@ -0,0 +1,63 @@
+"""product review stats
+
+Revision ID: b8e3c5a7d2f1
+Revises: a6d2f8b4c1e9
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e3c5a7d2f1'
+down_revision = 'a6d2f8b4c1e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        op.create_table(
+            'product_review_stats',
+            sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('review_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rating_1', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rating_2', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rating_3', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rating_4', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rating_5', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('recommend_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+        )
+    except Exception:
+        pass
+
+    # Заполняем статистику по уже одобренным отзывам
+    try:
+        op.execute("""
+            INSERT INTO product_review_stats
+                (product_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5,
+                 recommend_count, updated_at)
+            SELECT product_id, COUNT(id), COALESCE(SUM(rating), 0),
+                   SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN rating = 3 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN rating = 4 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN rating = 5 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN recommend = 1 OR (recommend IS NULL AND rating >= 4) THEN 1 ELSE 0 END),
+                   CURRENT_TIMESTAMP
+            FROM reviews
+            WHERE approved = 1
+            GROUP BY product_id
+        """)
+    except Exception:
+        pass
+
+
+def downgrade():
+    try:
+        op.drop_table('product_review_stats')
+    except Exception:
+        pass
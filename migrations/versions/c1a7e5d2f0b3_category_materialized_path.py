@@ -0,0 +1,55 @@
+"""category materialized path
+
+Revision ID: c1a7e5d2f0b3
+Revises: a743bf01e6fe, fix_related_products_encoding
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1a7e5d2f0b3'
+down_revision = ('a743bf01e6fe', 'fix_related_products_encoding')
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        with op.batch_alter_table('categories') as batch_op:
+            batch_op.add_column(sa.Column('path', sa.String(length=255), nullable=True))
+            batch_op.create_index('ix_categories_path', ['path'], unique=False)
+    except Exception:
+        pass
+
+    # Заполняем пути по parent_id
+    bind = op.get_bind()
+    rows = bind.execute(sa.text('SELECT id, parent_id FROM categories')).fetchall()
+    parents = {row[0]: row[1] for row in rows}
+    paths = {}
+
+    def resolve(cid):
+        chain = []
+        node = cid
+        while node is not None and node not in paths and node not in chain:
+            chain.append(node)
+            node = parents.get(node)
+        prefix = paths.get(node, '/')
+        for item in reversed(chain):
+            prefix = f"{prefix}{item}/"
+            paths[item] = prefix
+        return paths[cid]
+
+    for cid in parents:
+        bind.execute(sa.text('UPDATE categories SET path = :path WHERE id = :id'), {'path': resolve(cid), 'id': cid})
+
+
+def downgrade():
+    try:
+        with op.batch_alter_table('categories') as batch_op:
+            batch_op.drop_index('ix_categories_path')
+            batch_op.drop_column('path')
+    except Exception:
+        pass
@@ -0,0 +1,42 @@
+"""reviews keyset pagination index and updated_at
+
+Revision ID: c2f7a9d4e6b1
+Revises: b8e3c5a7d2f1
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f7a9d4e6b1'
+down_revision = 'b8e3c5a7d2f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL в created_at ломает порядок курсора — заполняем значением по умолчанию
+    op.execute(sa.text('UPDATE reviews SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL'))
+    try:
+        with op.batch_alter_table('reviews') as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    except Exception:
+        pass
+    op.execute(sa.text('UPDATE reviews SET updated_at = created_at WHERE updated_at IS NULL'))
+    try:
+        with op.batch_alter_table('reviews') as batch_op:
+            batch_op.create_index('idx_review_product_approved_created',
+                                  ['product_id', 'approved', 'created_at', 'id'], unique=False)
+    except Exception:
+        pass
+
+
+def downgrade():
+    try:
+        with op.batch_alter_table('reviews') as batch_op:
+            batch_op.drop_index('idx_review_product_approved_created')
+            batch_op.drop_column('updated_at')
+    except Exception:
+        pass
@@ -0,0 +1,39 @@
+"""products keyset pagination indexes
+
+Revision ID: d4e8a1b6c9f2
+Revises: c1a7e5d2f0b3
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e8a1b6c9f2'
+down_revision = 'c1a7e5d2f0b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL в колонках сортировки ломают порядок курсора — заполняем значениями по умолчанию
+    op.execute(sa.text('UPDATE products SET sort_order = 0 WHERE sort_order IS NULL'))
+    op.execute(sa.text('UPDATE products SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL'))
+    try:
+        with op.batch_alter_table('products') as batch_op:
+            batch_op.create_index('idx_product_category_sort', ['category_id', 'sort_order', 'id'], unique=False)
+            batch_op.create_index('idx_product_category_price', ['category_id', 'price', 'id'], unique=False)
+            batch_op.create_index('idx_product_category_created', ['category_id', 'created_at', 'id'], unique=False)
+    except Exception:
+        pass
+
+
+def downgrade():
+    try:
+        with op.batch_alter_table('products') as batch_op:
+            batch_op.drop_index('idx_product_category_created')
+            batch_op.drop_index('idx_product_category_price')
+            batch_op.drop_index('idx_product_category_sort')
+    except Exception:
+        pass
@@ -0,0 +1,34 @@
+"""cart_item owner indexes for server-side guest carts
+
+Revision ID: d5b1e8c3f7a2
+Revises: c2f7a9d4e6b1
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5b1e8c3f7a2'
+down_revision = 'c2f7a9d4e6b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        with op.batch_alter_table('cart_item') as batch_op:
+            batch_op.create_index('idx_cart_item_customer', ['customer_id'], unique=False)
+            batch_op.create_index('idx_cart_item_session', ['session_id'], unique=False)
+    except Exception:
+        pass
+
+
+def downgrade():
+    try:
+        with op.batch_alter_table('cart_item') as batch_op:
+            batch_op.drop_index('idx_cart_item_session')
+            batch_op.drop_index('idx_cart_item_customer')
+    except Exception:
+        pass
@@ -0,0 +1,106 @@
+"""product search terms inverted index
+
+Revision ID: e7b2c9d4a1f5
+Revises: d4e8a1b6c9f2
+Create Date: 2026-10-18
+"""
+
+import re
+
+from alembic import op
+import sqlalchemy as sa
+from unidecode import unidecode
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2c9d4a1f5'
+down_revision = 'd4e8a1b6c9f2'
+branch_labels = None
+depends_on = None
+
+
+# Копия app.search (веса полей и tokenize): миграция не зависит от кода приложения
+FIELD_WEIGHTS = {'name': 10, 'sku': 8, 'category': 4, 'attribute': 3, 'description': 1}
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _tokenize(text):
+    if not text:
+        return []
+    text = unidecode(_TAG_RE.sub(' ', str(text))).lower()
+    return [token[:MAX_TERM_LENGTH] for token in _TOKEN_RE.findall(text) if len(token) >= MIN_TERM_LENGTH]
+
+
+def _sku_terms(sku):
+    tokens = _tokenize(sku)
+    if len(tokens) > 1:
+        tokens.append(''.join(tokens)[:MAX_TERM_LENGTH])
+    return tokens
+
+
+def _backfill(bind, batch_size=1000):
+    """Первичное заполнение индекса тем же набором полей, что и `flask reindex-search`."""
+    terms = {}
+
+    def add(product_id, text_terms, field):
+        weight = FIELD_WEIGHTS[field]
+        bucket = terms.setdefault(product_id, {})
+        for term in text_terms:
+            if bucket.get(term, 0) < weight:
+                bucket[term] = weight
+
+    for row in bind.execute(sa.text(
+        'SELECT p.id, p.name, p.description, c.name AS category_name '
+        'FROM products p LEFT JOIN categories c ON c.id = p.category_id'
+    )):
+        add(row.id, _tokenize(row.name), 'name')
+        add(row.id, _tokenize(row.description), 'description')
+        add(row.id, _tokenize(row.category_name), 'category')
+    for row in bind.execute(sa.text('SELECT product_id, sku FROM product_variations WHERE sku IS NOT NULL')):
+        add(row.product_id, _sku_terms(row.sku), 'sku')
+    for row in bind.execute(sa.text(
+        'SELECT pa.product_id, av.value FROM product_attributes pa '
+        'JOIN attribute_values av ON av.id = pa.attribute_value_id'
+    )):
+        add(row.product_id, _tokenize(row.value), 'attribute')
+
+    rows = [
+        {'term': term, 'product_id': product_id, 'weight': weight}
+        for product_id, bucket in terms.items()
+        for term, weight in bucket.items()
+    ]
+    table = sa.table('product_search_terms', sa.column('term'), sa.column('product_id'), sa.column('weight'))
+    bind.execute(table.delete())
+    for start in range(0, len(rows), batch_size):
+        bind.execute(table.insert(), rows[start:start + batch_size])
+
+
+def upgrade():
+    try:
+        op.create_table(
+            'product_search_terms',
+            sa.Column('term', sa.String(length=64), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('weight', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('term', 'product_id')
+        )
+        with op.batch_alter_table('product_search_terms') as batch_op:
+            batch_op.create_index('idx_search_term_product', ['product_id'], unique=False)
+    except Exception:
+        pass
+
+    # Заполняем индекс сразу: иначе /search ничего не находит до `flask reindex-search`
+    _backfill(op.get_bind())
+
+
+def downgrade():
+    try:
+        with op.batch_alter_table('product_search_terms') as batch_op:
+            batch_op.drop_index('idx_search_term_product')
+        op.drop_table('product_search_terms')
+    except Exception:
+        pass
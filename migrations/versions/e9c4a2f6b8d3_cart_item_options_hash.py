@@ -0,0 +1,80 @@
+"""cart_item options_hash and unique cart lines
+
+Revision ID: e9c4a2f6b8d3
+Revises: d5b1e8c3f7a2
+Create Date: 2026-10-18
+"""
+
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9c4a2f6b8d3'
+down_revision = 'd5b1e8c3f7a2'
+branch_labels = None
+depends_on = None
+
+
+def _options_hash(raw):
+    # Копия app.models.cart.options_hash: миграция не зависит от кода приложения
+    try:
+        options = json.loads(raw) if raw else {}
+    except ValueError:
+        options = {}
+    pairs = []
+    if isinstance(options, dict):
+        for option_id, value_id in options.items():
+            try:
+                pairs.append((int(option_id), int(value_id)))
+            except (ValueError, TypeError):
+                continue
+    return hashlib.sha1(json.dumps(sorted(pairs)).encode()).hexdigest()
+
+
+def upgrade():
+    try:
+        with op.batch_alter_table('cart_item') as batch_op:
+            batch_op.add_column(sa.Column('options_hash', sa.String(length=40), nullable=False, server_default=''))
+    except Exception:
+        pass
+
+    # Хеши существующих строк; дубли (товар + опции у одного владельца) сливаются в первую строку
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        'SELECT id, customer_id, session_id, product_id, quantity, selected_options FROM cart_item ORDER BY id'
+    )).fetchall()
+    kept = {}
+    for row in rows:
+        line_hash = _options_hash(row.selected_options)
+        owner = ('c', row.customer_id) if row.customer_id else ('s', row.session_id)
+        key = (owner, row.product_id, line_hash)
+        if key in kept:
+            kept_id = kept[key]
+            bind.execute(sa.text('UPDATE cart_item SET quantity = quantity + :q WHERE id = :id'),
+                         {'q': row.quantity, 'id': kept_id})
+            bind.execute(sa.text('DELETE FROM cart_item WHERE id = :id'), {'id': row.id})
+        else:
+            kept[key] = row.id
+            bind.execute(sa.text('UPDATE cart_item SET options_hash = :h WHERE id = :id'),
+                         {'h': line_hash, 'id': row.id})
+
+    try:
+        with op.batch_alter_table('cart_item') as batch_op:
+            batch_op.create_unique_constraint('uq_cart_item_customer_line', ['customer_id', 'product_id', 'options_hash'])
+            batch_op.create_unique_constraint('uq_cart_item_session_line', ['session_id', 'product_id', 'options_hash'])
+    except Exception:
+        pass
+
+
+def downgrade():
+    try:
+        with op.batch_alter_table('cart_item') as batch_op:
+            batch_op.drop_constraint('uq_cart_item_session_line', type_='unique')
+            batch_op.drop_constraint('uq_cart_item_customer_line', type_='unique')
+            batch_op.drop_column('options_hash')
+    except Exception:
+        pass
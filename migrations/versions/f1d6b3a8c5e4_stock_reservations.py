@@ -0,0 +1,59 @@
+"""stock reservations and reserved counters
+
+Revision ID: f1d6b3a8c5e4
+Revises: e9c4a2f6b8d3
+Create Date: 2026-10-18
+
+Учёт остатков включается INVENTORY_TRACKING=1 (по умолчанию выключен). Перед включением заполните stock:
+товар/вариация со stock = 0 станет недоступен к заказу, stock IS NULL — остаток не ведётся.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1d6b3a8c5e4'
+down_revision = 'e9c4a2f6b8d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('products', 'product_variations'):
+        try:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(sa.Column('reserved', sa.Integer(), nullable=False, server_default='0'))
+        except Exception:
+            pass
+
+    try:
+        op.create_table(
+            'stock_reservations',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('variation_id', sa.Integer(), sa.ForeignKey('product_variations.id', ondelete='CASCADE'), nullable=True),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('customer_id', sa.Integer(), sa.ForeignKey('customers.id', ondelete='CASCADE'), nullable=True),
+            sa.Column('session_id', sa.String(length=100), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+        )
+        op.create_index('idx_stock_reservation_customer', 'stock_reservations', ['customer_id'])
+        op.create_index('idx_stock_reservation_session', 'stock_reservations', ['session_id'])
+        op.create_index('idx_stock_reservation_expires', 'stock_reservations', ['expires_at'])
+    except Exception:
+        pass
+
+
+def downgrade():
+    try:
+        op.drop_table('stock_reservations')
+    except Exception:
+        pass
+    for table in ('product_variations', 'products'):
+        try:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column('reserved')
+        except Exception:
+            pass
@@ -0,0 +1,32 @@
+"""module instance settings version
+
+Revision ID: f3a9c6e1b2d7
+Revises: e7b2c9d4a1f5
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c6e1b2d7'
+down_revision = 'e7b2c9d4a1f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        with op.batch_alter_table('module_instances') as batch_op:
+            batch_op.add_column(sa.Column('settings_version', sa.Integer(), nullable=False, server_default='0'))
+    except Exception:
+        pass
+
+
+def downgrade():
+    try:
+        with op.batch_alter_table('module_instances') as batch_op:
+            batch_op.drop_column('settings_version')
+    except Exception:
+        pass
@@ -0,0 +1,55 @@
+"""
+@file: tests/conftest.py
+@description: Общие фикстуры: приложение на временной SQLite-базе, клиент витрины по https (Talisman force_https)
+@dependencies: pytest, app.create_app
+@created: 2026-10-18
+"""
+
+import pytest
+
+from app.config import Config
+from app.extensions import db
+
+BASE_URL = 'https://localhost'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(Config, 'TESTING', True, raising=False)
+    monkeypatch.setattr(Config, 'WTF_CSRF_ENABLED', False, raising=False)
+    monkeypatch.setattr(Config, 'PAGE_CACHE_ENABLED', False)
+
+    from app import create_app
+    from app.cache import chrome_cache
+    from app.models.productOptions import ProductVariation
+
+    app = create_app()
+    # Кэши процесса живут дольше одной базы — чистим, чтобы тесты не видели чужие данные
+    chrome_cache.clear()
+    ProductVariation.invalidate_variation_index()
+    with app.app_context():
+        _seed_site()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _seed_site():
+    """Минимум для рендеринга витрины: настройки сайта с логотипом и главная страница."""
+    from app.models.image import Image
+    from app.models.page import Page
+    from app.models.site_setings import SiteSettings
+
+    logo = Image(filename='logo.png')
+    page = Page(title='Главная', slug='home', home_page=True)
+    db.session.add_all([logo, page])
+    db.session.flush()
+    db.session.add(SiteSettings(title='Магазин', logo_id=logo.id, home_page_id=page.id))
+    db.session.commit()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
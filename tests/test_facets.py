@@ -0,0 +1,81 @@
+from app.extensions import db
+from app.facets import CategoryBitmapIndex, FacetEngine
+from app.models.category import Category
+from app.models.product import Product
+from app.models.productOptions import ProductOption, ProductOptionValue, product_option_value_association
+from app.query_counter import query_count
+
+
+def _seed_catalog():
+    """Категория из 12 товаров с тремя опциями по три значения; значения раскиданы так, чтобы пересечения были неполными."""
+    category = Category(name='Одежда', slug='odezhda')
+    db.session.add(category)
+    db.session.flush()
+
+    options = []
+    for name in ('Цвет', 'Размер', 'Материал'):
+        option = ProductOption(name=name)
+        db.session.add(option)
+        db.session.flush()
+        values = [ProductOptionValue(option_id=option.id, value=f'{name} {i}') for i in range(3)]
+        db.session.add_all(values)
+        db.session.flush()
+        options.append((option, values))
+
+    rows = []
+    for i in range(12):
+        product = Product(name=f'Товар {i}', slug=f'tovar-{i}', price=100, category_id=category.id)
+        db.session.add(product)
+        db.session.flush()
+        for k, (option, values) in enumerate(options):
+            if (i + k) % 5 == 0:
+                continue  # у части товаров опции нет совсем
+            value_ids = {values[(i + k) % 3].id, values[(i * (k + 1)) % 3].id}
+            rows.extend({'product_id': product.id, 'option_value_id': value_id} for value_id in value_ids)
+    db.session.execute(product_option_value_association.insert(), rows)
+    db.session.commit()
+    return category, options
+
+
+def _selections(options):
+    (color, colors), (size, sizes), (material, materials) = options
+    return [
+        {},
+        {color.id: frozenset({colors[0].id})},
+        {color.id: frozenset({colors[0].id, colors[1].id})},
+        {color.id: frozenset({colors[1].id}), size.id: frozenset({sizes[2].id})},
+        {color.id: frozenset({colors[0].id, colors[2].id}), size.id: frozenset({sizes[0].id}),
+         material.id: frozenset({materials[1].id, materials[2].id})},
+    ]
+
+
+def test_engine_matches_bitmap_index(app):
+    with app.app_context():
+        category, options = _seed_catalog()
+        engine = FacetEngine([category.id])
+        index = CategoryBitmapIndex.build([category.id])
+
+        for selected in _selections(options):
+            expected = index.search(selected)
+            result = engine.search(selected)
+            assert result.counts() == expected.counts(), selected
+            assert result.total == expected.total
+            if expected.product_ids is None:
+                assert result.product_ids is None
+            else:
+                assert sorted(result.product_ids) == sorted(expected.product_ids)
+
+
+def test_engine_query_count_does_not_grow_with_selected_options(app):
+    with app.app_context():
+        category, options = _seed_catalog()
+        engine = FacetEngine([category.id])
+
+        queries = []
+        with app.test_request_context():
+            for selected in _selections(options)[1:]:
+                before = query_count()
+                engine.search(selected)
+                queries.append(query_count() - before)
+        # Скелет, отфильтрованные товары и счётчики — по одному запросу при любом числе выбранных опций
+        assert queries == [3] * len(queries)
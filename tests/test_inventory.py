@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models.product import Product
+from app.models.stock_reservation import StockReservation
+
+from .conftest import BASE_URL
+
+
+def _guest_holds(app, product_id, quantity):
+    client = app.test_client()
+    response = client.post('/cart/api/items', json={'product_id': product_id, 'quantity': quantity}, base_url=BASE_URL)
+    assert response.status_code == 200
+    client.get('/checkout', base_url=BASE_URL)
+    return client
+
+
+def test_release_expired_reservations_returns_stock(app):
+    app.config['INVENTORY_TRACKING'] = True
+    with app.app_context():
+        product = Product(name='Футболка', slug='futbolka', price=100, stock=5)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+
+    _guest_holds(app, product_id, 4)
+    with app.app_context():
+        assert db.session.get(Product, product_id).reserved == 4
+        # Второму гостю свободного остатка не хватает
+        db.session.remove()
+    _guest_holds(app, product_id, 4)
+    with app.app_context():
+        assert StockReservation.query.count() == 1
+        StockReservation.query.update({StockReservation.expires_at: datetime.utcnow() - timedelta(minutes=1)})
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['release-expired-reservations'])
+    assert result.exit_code == 0, result.output
+    assert 'Освобождено 1 удержаний' in result.output
+
+    with app.app_context():
+        assert db.session.get(Product, product_id).reserved == 0
+        assert StockReservation.query.count() == 0
+
+    _guest_holds(app, product_id, 4)
+    with app.app_context():
+        assert db.session.get(Product, product_id).reserved == 4
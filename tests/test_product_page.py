@@ -0,0 +1,120 @@
+from flask import g
+
+from app.extensions import db
+from app.models.attribute import Attribute
+from app.models.attributeValue import AttributeValue
+from app.models.category import Category
+from app.models.customer import Customer
+from app.models.image import Image
+from app.models.product import Product, RelatedProduct, product_images
+from app.models.productAttribute import ProductAttribute
+from app.models.productOptions import (
+    ProductOption, ProductOptionValue, ProductVariation, ProductVariationOptionValue,
+    product_option_association, product_option_value_association,
+)
+from app.models.review import Review, ProductReviewStats
+from app.models.seo_settings import SEOSettings
+from app.models.size_chart import SizeChart, ProductSizeChart
+from app.views.product_page import PRODUCT_PAGE_QUERY_BUDGET
+
+from .conftest import BASE_URL
+
+
+def _seed_product(scale, prefix='p'):
+    """Товар со всем, что выводит страница; scale — сколько вариаций, отзывов, атрибутов и соседей создать."""
+    category = Category(name=f'Одежда {prefix}', slug=f'{prefix}-odezhda')
+    db.session.add(category)
+    db.session.flush()
+    images = [Image(filename=f'{prefix}-img{i}.jpg') for i in range(4 + scale)]
+    db.session.add_all(images)
+    db.session.flush()
+
+    product = Product(name=f'Футболка {prefix}', slug=f'{prefix}-futbolka', price=100, stock=10,
+                      category_id=category.id, main_image_id=images[0].id)
+    db.session.add(product)
+    db.session.flush()
+    db.session.execute(product_images.insert(), [
+        {'product_id': product.id, 'image_id': image.id, 'order': i} for i, image in enumerate(images[1:3])
+    ])
+
+    color = ProductOption(name=f'Цвет {prefix}', display_type='color')
+    size = ProductOption(name=f'Размер {prefix}', display_type='select')
+    db.session.add_all([color, size])
+    db.session.flush()
+    colors = [ProductOptionValue(option_id=color.id, value=f'Цвет {i}') for i in range(scale)]
+    sizes = [ProductOptionValue(option_id=size.id, value=f'Размер {i}') for i in range(scale)]
+    db.session.add_all(colors + sizes)
+    db.session.flush()
+    for option in (color, size):
+        db.session.execute(product_option_association.insert().values(product_id=product.id, option_id=option.id))
+    for value in colors + sizes:
+        db.session.execute(product_option_value_association.insert().values(
+            product_id=product.id, option_value_id=value.id))
+    for i, (color_value, size_value) in enumerate(zip(colors, sizes)):
+        variation = ProductVariation(product_id=product.id, price=100 + i, sku=f'{prefix}-SKU-{i}', stock=3,
+                                     image_id=images[3 + i].id)
+        db.session.add(variation)
+        db.session.flush()
+        db.session.add_all([
+            ProductVariationOptionValue(variation_id=variation.id, option_value_id=color_value.id),
+            ProductVariationOptionValue(variation_id=variation.id, option_value_id=size_value.id),
+        ])
+
+    for i in range(scale):
+        related = Product(name=f'Сосед {prefix} {i}', slug=f'{prefix}-sosed-{i}', price=50, category_id=category.id)
+        db.session.add(related)
+        db.session.flush()
+        db.session.add(RelatedProduct(product_id=product.id, related_product_id=related.id,
+                                      link_text=f'Группа {i % 2}', sort_order=i))
+        attribute = Attribute(name=f'Атрибут {prefix} {i}')
+        db.session.add(attribute)
+        db.session.flush()
+        value = AttributeValue(attribute_id=attribute.id, value=f'Значение {i}')
+        db.session.add(value)
+        db.session.flush()
+        db.session.add(ProductAttribute(product_id=product.id, attribute_value_id=value.id))
+
+    chart = SizeChart(title=f'Размерная сетка {prefix}', image_id=images[0].id)
+    db.session.add(chart)
+    db.session.flush()
+    db.session.add(ProductSizeChart(product_id=product.id, size_chart_id=chart.id))
+
+    customer = Customer(name='Иван', email=f'{prefix}-ivan@example.com', password='x')
+    db.session.add(customer)
+    db.session.flush()
+    for i in range(scale * 2):
+        db.session.add(Review(product_id=product.id, customer_id=customer.id if i % 2 else None,
+                              guest_name=None if i % 2 else f'Гость {i}', rating=1 + i % 5,
+                              comment=f'Отзыв {i}', approved=True))
+    db.session.add(SEOSettings(page_type='product', page_id=product.id, meta_title='Футболка'))
+    db.session.commit()
+    ProductReviewStats.rebuild()
+    db.session.commit()
+    return product.slug
+
+
+def _product_page_queries(client, slug):
+    # Первый запрос прогревает кэши обвязки (шапка, меню) — они не входят в бюджет страницы
+    client.get(f'/product/{slug}', base_url=BASE_URL)
+    with client:
+        response = client.get(f'/product/{slug}', base_url=BASE_URL)
+        assert response.status_code == 200
+        return g.query_budgets['product_page']
+
+
+def test_product_page_fits_query_budget(app):
+    # В строгом режиме превышение бюджета — QueryBudgetExceeded прямо из запроса
+    app.config['QUERY_BUDGET_STRICT'] = True
+    with app.app_context():
+        slug = _seed_product(scale=3)
+    assert _product_page_queries(app.test_client(), slug) <= PRODUCT_PAGE_QUERY_BUDGET
+
+
+def test_product_page_queries_do_not_grow_with_data(app):
+    app.config['QUERY_BUDGET_STRICT'] = True
+    with app.app_context():
+        small = _seed_product(scale=1, prefix='small')
+        large = _seed_product(scale=6, prefix='large')
+    client = app.test_client()
+    # Число запросов не зависит от количества вариаций, отзывов, атрибутов и соседних товаров
+    assert _product_page_queries(client, small) == _product_page_queries(client, large)
@@ -0,0 +1,38 @@
+import time
+
+from app.config import Config
+from app.extensions import db
+from app.models.product import Product
+from app.models.review import Review
+from app.review_votes import cast_vote, review_vote_buffer
+
+
+def test_idle_buffer_is_flushed_by_interval(app, monkeypatch):
+    monkeypatch.setattr(Config, 'REVIEW_VOTE_BUFFER', True)
+    monkeypatch.setattr(Config, 'REVIEW_VOTE_FLUSH_INTERVAL', 0.5)
+    from app import create_app
+    app = create_app()
+    try:
+        with app.app_context():
+            product = Product(name='Футболка', slug='futbolka', price=100)
+            db.session.add(product)
+            db.session.flush()
+            review = Review(product_id=product.id, guest_name='Гость', rating=5, comment='Отлично', approved=True)
+            db.session.add(review)
+            db.session.commit()
+
+            review_vote_buffer.flush()  # отсчёт интервала — с этого момента
+            recorded, likes, _ = cast_vote(review.id, 'voter-1', 'like')
+            assert recorded and likes == 1
+            assert Review.vote_counts(review.id) == (0, 0)  # приращение ещё в буфере
+
+            # Новых голосов нет — буфер сбрасывает фоновый поток
+            deadline = time.monotonic() + 5
+            while Review.vote_counts(review.id) != (1, 0) and time.monotonic() < deadline:
+                db.session.rollback()
+                time.sleep(0.05)
+            assert Review.vote_counts(review.id) == (1, 0)
+            assert review_vote_buffer.pending(review.id) == (0, 0)
+    finally:
+        review_vote_buffer.enabled = False
+        review_vote_buffer.app = None
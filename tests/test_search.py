@@ -0,0 +1,38 @@
+from app.extensions import db
+from app.models.product import Product
+from app.models.search import ProductSearchTerm
+from app.search import index_products, search_cache, search_product_ids, SEARCH_NAMESPACE
+
+
+def _add_product(name, slug):
+    product = Product(name=name, slug=slug, price=100)
+    db.session.add(product)
+    db.session.flush()
+    return product
+
+
+def test_prefix_and_typo_matches(app):
+    with app.app_context():
+        search_cache.bump(SEARCH_NAMESPACE)
+        tshirt = _add_product('Футболка хлопковая', 'futbolka')
+        _add_product('Худи', 'hudi')
+        index_products(Product.query.all())
+        db.session.commit()
+
+        assert search_product_ids('футб') == [tshirt.id]
+        assert search_product_ids('futbolak') == [tshirt.id]
+
+
+def test_exact_term_found_with_stale_vocabulary(app):
+    with app.app_context():
+        search_cache.bump(SEARCH_NAMESPACE)
+        index_products([_add_product('Футболка', 'futbolka')])
+        db.session.commit()
+        assert search_product_ids('футболка')  # словарь закэширован
+
+        # Товар проиндексирован другим воркером: строки в БД есть, кэш словаря этого процесса не сброшен
+        jacket = _add_product('Куртка', 'kurtka')
+        db.session.add(ProductSearchTerm(term='kurtka', product_id=jacket.id, weight=10))
+        db.session.commit()
+
+        assert search_product_ids('куртка') == [jacket.id]